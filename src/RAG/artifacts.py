@@ -0,0 +1,141 @@
+# RAG/artifacts.py
+"""
+Content-addressed store of per-document triage artifacts, so re-uploading the
+same PDF reuses earlier work instead of repeating it (triage.py).
+
+- Documents are keyed by the sha256 of the PDF bytes (RAG/manifest.file_sha256),
+  not by file name or upload folder.
+- Each artifact is (document, kind, variant) -> JSON value, zlib-compressed in
+  a local SQLite file. `variant` holds whatever else the value depends on
+  (chunking profile, model, retrieval backend, analysis graph); a different
+  variant is a different artifact.
+- Artifacts that depend on the regulations corpus (findings, report) are
+  stored with the corpus generation (RAG/manifest.py) and dropped on lookup
+  once an ingestion run has bumped it.
+- Bounded by entry count; least-recently-used artifacts are evicted first.
+
+Kinds written by triage.py: pages, chunks, filter, ingest, findings, report.
+
+Environment variables (all optional):
+  ARTIFACT_STORE_PATH         default '.cache/artifacts.sqlite3'
+  ARTIFACT_STORE_MAX_ENTRIES  default 20000
+  ARTIFACT_STORE_DISABLED     set to 1 to recompute everything
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_STORE_PATH = ".cache/artifacts.sqlite3"
+DEFAULT_MAX_ENTRIES = 20_000
+
+
+def variant_key(variant: Optional[dict]) -> str:
+    return hashlib.sha256(json.dumps(variant or {}, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class ArtifactStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                document   TEXT NOT NULL,
+                kind       TEXT NOT NULL,
+                variant    TEXT NOT NULL,
+                generation INTEGER,
+                value      BLOB NOT NULL,
+                last_used  REAL NOT NULL,
+                PRIMARY KEY (document, kind, variant)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_lru ON artifacts(last_used)")
+        self._conn.commit()
+
+    def get(self, document: str, kind: str, variant: Optional[dict] = None, generation: Optional[int] = None):
+        """Stored value, or None (missing, or built for another corpus generation)."""
+        key = (document, kind, variant_key(variant))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generation, value FROM artifacts WHERE document = ? AND kind = ? AND variant = ?", key
+            ).fetchone()
+            if row is not None and row[0] != generation:
+                self._conn.execute("DELETE FROM artifacts WHERE document = ? AND kind = ? AND variant = ?", key)
+                self._conn.commit()
+                self.invalidated += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE artifacts SET last_used = ? WHERE document = ? AND kind = ? AND variant = ?", (time.time(), *key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[1]).decode("utf-8"))
+
+    def put(self, document: str, kind: str, value, variant: Optional[dict] = None, generation: Optional[int] = None) -> None:
+        blob = zlib.compress(json.dumps(value, default=str).encode("utf-8"), 6)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts (document, kind, variant, generation, value, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (document, kind, variant_key(variant), generation, blob, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM artifacts WHERE rowid IN (SELECT rowid FROM artifacts ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def forget(self, document: str) -> int:
+        """Drop every artifact of a document; returns how many were removed."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM artifacts WHERE document = ?", (document,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()
+        return count
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_artifact_store() -> Optional[ArtifactStore]:
+    """Process-wide artifact store, or None when ARTIFACT_STORE_DISABLED is set."""
+    if os.getenv("ARTIFACT_STORE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    return ArtifactStore(
+        path=os.getenv("ARTIFACT_STORE_PATH", DEFAULT_STORE_PATH),
+        max_entries=int(os.getenv("ARTIFACT_STORE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    )
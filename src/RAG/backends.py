@@ -0,0 +1,513 @@
+# RAG/backends.py
+"""
+Pluggable retrieval backends for the regulations corpus.
+
+Every backend speaks the same small interface, mirroring the Supabase table and
+the match_documents_oag_compliance RPC:
+  match(embedding, match_count, filter[, ef_search, probes]) -> [{id, content, metadata, similarity}]
+  match_many(embeddings, ...) -> one such list per embedding, in one round trip
+  upsert(rows) / delete(ids) / delete_source(source_pdf, corpus[, source_path]) / flush()
+
+- SupabaseBackend: the existing pgvector table + RPC (default). The schema,
+  HNSW/GIN indexes and optional halfvec storage are managed by RAG/migrate.py;
+  ef_search / probes are sent to the RPC only when set, so the original
+  three-argument function keeps working. match_many calls the batched
+  match_documents_oag_compliance_many RPC (migration 0006).
+- LocalBackend: in-process index. Unit-normalized float32 vectors live in a
+  NumPy .npy file opened as a memory map; metadata is kept as a compact column
+  store (one list per metadata key). `filter` uses JSONB `@>` containment
+  semantics. Top-k is a single vectorized dot product + argpartition, optionally
+  restricted to the nearest IVF partitions (k-means lists) as the corpus grows;
+  without IVF, match_many scores every query with one matrix product.
+  With path=None it is purely in-memory, which makes it an offline stand-in
+  for tests.
+
+Selected with RETRIEVAL_BACKEND=supabase|local (see get_backend()).
+
+Environment variables (all optional):
+  RETRIEVAL_BACKEND       'supabase' (default) or 'local'
+  LOCAL_INDEX_PATH        default '.cache/local_index'
+  LOCAL_INDEX_IVF_LISTS   number of IVF partitions; 0 disables IVF (default)
+  LOCAL_INDEX_IVF_PROBES  partitions scanned per query (default 8)
+  PGVECTOR_EF_SEARCH      default hnsw.ef_search sent with every RPC (unset = server default)
+  PGVECTOR_PROBES         default ivfflat.probes sent with every RPC (unset = server default)
+"""
+import asyncio
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+TABLE_NAME = "documents_oag_compliance"
+QUERY_NAME = "match_documents_oag_compliance"
+DEFAULT_LOCAL_PATH = ".cache/local_index"
+_IVF_MIN_ROWS_PER_LIST = 39  # below this, k-means partitions are too noisy to help
+
+
+def jsonb_contains(value, pattern) -> bool:
+    """Python equivalent of Postgres `value @> pattern` for JSON values."""
+    if isinstance(pattern, dict):
+        return isinstance(value, dict) and all(
+            k in value and jsonb_contains(value[k], v) for k, v in pattern.items()
+        )
+    if isinstance(pattern, list):
+        if not isinstance(value, list):
+            return False
+        return all(any(jsonb_contains(v, p) for v in value) for p in pattern)
+    if isinstance(value, list):
+        # A JSON array contains a primitive value when one of its elements equals it.
+        return any(jsonb_contains(v, pattern) for v in value)
+    if isinstance(value, bool) or isinstance(pattern, bool):
+        return type(value) is type(pattern) and value == pattern
+    return value == pattern
+
+
+def _source_filter(source_pdf: str, corpus: str, source_path: Optional[str]) -> dict:
+    pattern = {"corpus": corpus, "source_pdf": source_pdf}
+    if source_path:
+        pattern["source_path"] = source_path
+    return pattern
+
+
+class RetrievalBackend:
+    name = "base"
+    durable = True  # writes are persisted as soon as upsert()/delete() return
+
+    def match(
+        self,
+        embedding: Sequence[float],
+        match_count: int = 5,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[dict]:
+        """ef_search / probes: per-call ANN recall-vs-latency knobs (None = backend default)."""
+        raise NotImplementedError
+
+    async def amatch(
+        self,
+        embedding: Sequence[float],
+        match_count: int = 5,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[dict]:
+        return await asyncio.to_thread(self.match, embedding, match_count, filter, ef_search, probes)
+
+    def match_many(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        match_count: int = 5,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[List[dict]]:
+        """match() for several embeddings; backends override it to answer them in one round trip."""
+        return [self.match(e, match_count, filter, ef_search, probes) for e in embeddings]
+
+    async def amatch_many(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        match_count: int = 5,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[List[dict]]:
+        return await asyncio.to_thread(self.match_many, embeddings, match_count, filter, ef_search, probes)
+
+    def upsert(self, rows: List[dict]) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def delete_source(self, source_pdf: str, corpus: str = "regulations", source_path: Optional[str] = None) -> None:
+        """Delete a PDF's rows; with source_path, only the rows ingested from that path."""
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Persist pending writes (no-op for remote backends)."""
+
+    def default_manifest_path(self) -> Optional[str]:
+        """Where ingestion keeps its manifest for this backend (None = global default)."""
+        return None
+
+
+class SupabaseBackend(RetrievalBackend):
+    name = "supabase"
+
+    def __init__(
+        self,
+        client,
+        table_name: str = TABLE_NAME,
+        query_name: str = QUERY_NAME,
+        url: Optional[str] = None,
+        key: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ):
+        self.client = client
+        self.table_name = table_name
+        self.query_name = query_name
+        self.ef_search = ef_search
+        self.probes = probes
+        # With url/key, RPC reads go straight to PostgREST over the shared
+        # keep-alive pools in RAG/http_pool.py (sync and async, with retries).
+        self.url = url.rstrip("/") if url else None
+        self.key = key
+
+    def _rpc_request(self, embedding, match_count, filter, ef_search=None, probes=None, many=False) -> dict:
+        vectors = {"query_embeddings": [list(e) for e in embedding]} if many else {"query_embedding": list(embedding)}
+        payload = {
+            **vectors,
+            "match_count": match_count,
+            "filter": filter or {},
+        }
+        # Only when set: the pre-0004 RPC has no such arguments.
+        for name, value in (("ef_search", ef_search or self.ef_search), ("probes", probes or self.probes)):
+            if value:
+                payload[name] = int(value)
+        query_name = f"{self.query_name}_many" if many else self.query_name
+        return {
+            "url": f"{self.url}/rest/v1/rpc/{query_name}",
+            "json": payload,
+            "headers": {"apikey": self.key, "Authorization": f"Bearer {self.key}"},
+        }
+
+    def match(self, embedding, match_count=5, filter=None, ef_search=None, probes=None):
+        request = self._rpc_request(embedding, match_count, filter, ef_search, probes)
+        if not self.url:
+            resp = self.client.rpc(self.query_name, request["json"]).execute()
+            return resp.data or []
+        from .http_pool import request_with_retry
+
+        return request_with_retry("POST", **request).json() or []
+
+    async def amatch(self, embedding, match_count=5, filter=None, ef_search=None, probes=None):
+        if not self.url:
+            return await super().amatch(embedding, match_count, filter, ef_search, probes)
+        from .http_pool import arequest_with_retry
+
+        response = await arequest_with_retry("POST", **self._rpc_request(embedding, match_count, filter, ef_search, probes))
+        return response.json() or []
+
+    @staticmethod
+    def _split(rows: List[dict], n: int) -> List[List[dict]]:
+        """Batched RPC rows (tagged with query_index) -> one list per query."""
+        grouped: List[List[dict]] = [[] for _ in range(n)]
+        for row in rows:
+            row = dict(row)
+            grouped[row.pop("query_index")].append(row)
+        return grouped
+
+    def match_many(self, embeddings, match_count=5, filter=None, ef_search=None, probes=None):
+        if not embeddings:
+            return []
+        request = self._rpc_request(embeddings, match_count, filter, ef_search, probes, many=True)
+        if not self.url:
+            rows = self.client.rpc(f"{self.query_name}_many", request["json"]).execute().data or []
+        else:
+            from .http_pool import request_with_retry
+
+            rows = request_with_retry("POST", **request).json() or []
+        return self._split(rows, len(embeddings))
+
+    async def amatch_many(self, embeddings, match_count=5, filter=None, ef_search=None, probes=None):
+        if not self.url or not embeddings:
+            return await super().amatch_many(embeddings, match_count, filter, ef_search, probes)
+        from .http_pool import arequest_with_retry
+
+        request = self._rpc_request(embeddings, match_count, filter, ef_search, probes, many=True)
+        response = await arequest_with_retry("POST", **request)
+        return self._split(response.json() or [], len(embeddings))
+
+    def upsert(self, rows):
+        self.client.table(self.table_name).upsert(rows).execute()
+
+    def delete(self, ids):
+        self.client.table(self.table_name).delete().in_("id", ids).execute()
+
+    def delete_source(self, source_pdf, corpus="regulations", source_path=None):
+        (
+            self.client.table(self.table_name)
+            .delete()
+            .contains("metadata", _source_filter(source_pdf, corpus, source_path))  # `@>`, served by the GIN index
+            .execute()
+        )
+
+
+class LocalBackend(RetrievalBackend):
+    name = "local"
+    durable = False  # writes are persisted by flush()
+
+    def __init__(self, path: Optional[str] = DEFAULT_LOCAL_PATH, ivf_lists: int = 0, ivf_probes: int = 8):
+        self.path = Path(path) if path else None
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = max(1, ivf_probes)
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._buffer: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._content: List[str] = []
+        self._columns: Dict[str, list] = {}  # metadata key -> value per row (None = absent)
+        self._row: Dict[str, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: Optional[List[np.ndarray]] = None
+        self._mask_cache: Dict[str, np.ndarray] = {}  # per (key, value) filter masks; reset on writes
+        self._dirty = False
+        if self.path and (self.path / "meta.json").exists():
+            self._load()
+
+    # ---------------- Persistence ----------------
+    def _load(self) -> None:
+        with open(self.path / "meta.json", "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        self._ids = meta["ids"]
+        self._content = meta["content"]
+        self._columns = meta["columns"]
+        self._row = {cid: i for i, cid in enumerate(self._ids)}
+        self._vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        if self.ivf_lists > 0 and (self.path / "ivf_centroids.npy").exists():
+            self._centroids = np.load(self.path / "ivf_centroids.npy")
+            assign = np.load(self.path / "ivf_assign.npy")
+            self._lists = _group_lists(assign, len(self._centroids))
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            self._rebuild_ivf()
+            if self.path:
+                self.path.mkdir(parents=True, exist_ok=True)
+                _atomic_save(self.path / "vectors.npy", np.ascontiguousarray(self._vectors, dtype=np.float32))
+                meta = {"ids": self._ids, "content": self._content, "columns": self._columns}
+                tmp = self.path / "meta.json.tmp"
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump(meta, fh)
+                os.replace(tmp, self.path / "meta.json")
+                if self._centroids is not None:
+                    _atomic_save(self.path / "ivf_centroids.npy", self._centroids)
+                    _atomic_save(self.path / "ivf_assign.npy", _flatten_lists(self._lists, len(self._ids)))
+                else:
+                    for name in ("ivf_centroids.npy", "ivf_assign.npy"):
+                        (self.path / name).unlink(missing_ok=True)
+            self._dirty = False
+
+    def default_manifest_path(self):
+        return str(self.path / "manifest.json") if self.path else None
+
+    # ---------------- Writes ----------------
+    def _writable(self, extra: int, dim: int) -> np.ndarray:
+        """Growable in-memory buffer (capacity doubles) backing self._vectors during writes."""
+        n = len(self._ids)
+        buf = self._buffer
+        if buf is None or buf.shape[1] != dim or buf.shape[0] < n + extra:
+            capacity = max(n + extra, 2 * (buf.shape[0] if buf is not None else 0), 1024)
+            grown = np.zeros((capacity, dim), dtype=np.float32)
+            if n:
+                grown[:n] = self._vectors[:n]
+            self._buffer = buf = grown
+        return buf
+
+    def upsert(self, rows):
+        if not rows:
+            return
+        with self._lock:
+            vecs = np.asarray([r["embedding"] for r in rows], dtype=np.float32)
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+            buf = self._writable(len(rows), vecs.shape[1])
+            for row, vec in zip(rows, vecs):
+                idx = self._row.get(row["id"])
+                metadata = row.get("metadata") or {}
+                if idx is None:
+                    idx = len(self._ids)
+                    self._row[row["id"]] = idx
+                    self._ids.append(row["id"])
+                    self._content.append(row.get("content", ""))
+                    for col in self._columns.values():
+                        col.append(None)
+                else:
+                    self._content[idx] = row.get("content", "")
+                buf[idx] = vec
+                for key in set(self._columns) | set(metadata):
+                    col = self._columns.setdefault(key, [None] * len(self._ids))
+                    col[idx] = metadata.get(key)
+            self._vectors = buf[:len(self._ids)]
+            self._lists = None  # partitions are stale until the next flush
+            self._mask_cache.clear()
+            self._dirty = True
+
+    def delete(self, ids):
+        self._remove([self._row[i] for i in ids if i in self._row])
+
+    def delete_source(self, source_pdf, corpus="regulations", source_path=None):
+        with self._lock:  # the mask reads the shared columns; _remove re-enters the (reentrant) lock
+            self._remove(np.flatnonzero(self._filter_mask(_source_filter(source_pdf, corpus, source_path))).tolist())
+
+    def _remove(self, rows: List[int]) -> None:
+        if not rows:
+            return
+        with self._lock:
+            keep = np.ones(len(self._ids), dtype=bool)
+            keep[rows] = False
+            self._vectors = np.array(self._vectors[keep], dtype=np.float32)
+            self._buffer = None
+            self._ids = [v for v, k in zip(self._ids, keep) if k]
+            self._content = [v for v, k in zip(self._content, keep) if k]
+            self._columns = {key: [v for v, k in zip(col, keep) if k] for key, col in self._columns.items()}
+            self._row = {cid: i for i, cid in enumerate(self._ids)}
+            self._lists = None
+            self._mask_cache.clear()
+            self._dirty = True
+
+    # ---------------- Reads ----------------
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _metadata(self, idx: int) -> dict:
+        return {key: col[idx] for key, col in self._columns.items() if col[idx] is not None}
+
+    def _filter_mask(self, filter: Optional[dict]) -> np.ndarray:
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, wanted in (filter or {}).items():
+            cache_key = json.dumps([key, wanted], sort_keys=True)
+            cached = self._mask_cache.get(cache_key)
+            if cached is None:
+                col = self._columns.get(key, [None] * len(self._ids))
+                cached = np.fromiter((v is not None and jsonb_contains(v, wanted) for v in col), bool, len(col))
+                self._mask_cache[cache_key] = cached
+            mask &= cached
+        return mask
+
+    def _candidates(self, query: np.ndarray, probes: Optional[int] = None) -> Optional[np.ndarray]:
+        if self._lists is None or self._centroids is None:
+            return None
+        probes = min(probes or self.ivf_probes, len(self._centroids))
+        nearest = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+        return np.concatenate([self._lists[c] for c in nearest])
+
+    def match(self, embedding, match_count=5, filter=None, ef_search=None, probes=None):
+        # probes overrides the IVF partitions scanned; there is no graph index, so ef_search is unused.
+        with self._lock:
+            if not self._ids or match_count <= 0:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)  # never normalize the caller's array in place
+            rows = self._candidates(query, probes)
+            mask = self._filter_mask(filter)
+            rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+            if rows.size == 0:
+                return []
+            return self._top(rows, self._vectors[rows] @ query, match_count)
+
+    def _top(self, rows: np.ndarray, scores: np.ndarray, match_count: int) -> List[dict]:
+        k = min(match_count, rows.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "id": self._ids[rows[i]],
+                "content": self._content[rows[i]],
+                "metadata": self._metadata(int(rows[i])),
+                "similarity": float(scores[i]),
+            }
+            for i in top
+        ]
+
+    async def amatch(self, embedding, match_count=5, filter=None, ef_search=None, probes=None):
+        return self.match(embedding, match_count, filter, ef_search, probes)  # in-process and fast; no thread hop
+
+    def match_many(self, embeddings, match_count=5, filter=None, ef_search=None, probes=None):
+        with self._lock:
+            if self._centroids is not None:  # IVF candidates differ per query
+                return [self.match(e, match_count, filter, ef_search, probes) for e in embeddings]
+            if not self._ids or match_count <= 0 or not len(embeddings):
+                return [[] for _ in embeddings]
+            queries = np.asarray(embeddings, dtype=np.float32)
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+            rows = np.flatnonzero(self._filter_mask(filter))
+            if rows.size == 0:
+                return [[] for _ in embeddings]
+            scores = self._vectors[rows] @ queries.T  # (rows, queries): one pass over the matrix for all queries
+            return [self._top(rows, scores[:, j], match_count) for j in range(len(queries))]
+
+    async def amatch_many(self, embeddings, match_count=5, filter=None, ef_search=None, probes=None):
+        return self.match_many(embeddings, match_count, filter, ef_search, probes)
+
+    # ---------------- IVF partitions ----------------
+    def _rebuild_ivf(self) -> None:
+        n = len(self._ids)
+        lists = min(self.ivf_lists, n // _IVF_MIN_ROWS_PER_LIST)
+        if lists < 2:
+            self._centroids, self._lists = None, None
+            return
+        vectors = np.asarray(self._vectors, dtype=np.float32)
+        self._centroids = _kmeans(vectors, lists)
+        self._lists = _group_lists(np.argmax(vectors @ self._centroids.T, axis=1), lists)
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, sample: int = 256, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the (unit-normalized) rows."""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    train = vectors[rng.choice(n, size=min(n, k * sample), replace=False)]
+    centroids = train[rng.choice(len(train), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(train @ centroids.T, axis=1)
+        for c in range(k):
+            members = train[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def _group_lists(assign: np.ndarray, k: int) -> List[np.ndarray]:
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(k + 1))
+    return [order[bounds[c]:bounds[c + 1]] for c in range(k)]
+
+
+def _flatten_lists(lists: List[np.ndarray], n: int) -> np.ndarray:
+    assign = np.zeros(n, dtype=np.int32)
+    for c, rows in enumerate(lists):
+        assign[rows] = c
+    return assign
+
+
+def _atomic_save(path: Path, array: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        np.save(fh, array)
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: Optional[str] = None) -> RetrievalBackend:
+    """Process-wide backend selected by `name` or RETRIEVAL_BACKEND (default 'supabase')."""
+    name = (name or os.getenv("RETRIEVAL_BACKEND", "supabase")).lower()
+    if name == "local":
+        return LocalBackend(
+            path=os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_PATH),
+            ivf_lists=int(os.getenv("LOCAL_INDEX_IVF_LISTS", "0")),
+            ivf_probes=int(os.getenv("LOCAL_INDEX_IVF_PROBES", "8")),
+        )
+    if name == "supabase":
+        from supabase import create_client
+
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
+        if not supabase_url or not supabase_key:
+            raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY in environment.")
+        return SupabaseBackend(
+            create_client(supabase_url, supabase_key),
+            url=supabase_url,
+            key=supabase_key,
+            ef_search=int(os.getenv("PGVECTOR_EF_SEARCH", "0")) or None,
+            probes=int(os.getenv("PGVECTOR_PROBES", "0")) or None,
+        )
+    raise ValueError(f"Unknown retrieval backend '{name}' (expected 'supabase' or 'local').")
@@ -0,0 +1,296 @@
+# RAG/batch_triage.py
+"""
+Unattended triage of a whole directory of inspection reports.
+- Runs the same stages as the Streamlit app (triage.triage_document):
+  extract -> filter -> ingest -> analyze, for many PDFs at once.
+- PDF parsing is CPU-bound and runs in a process pool; the parsed pages are
+  handed to triage_document, which reuses them for ingestion, so each PDF is
+  parsed once. The remaining stages (network-bound) run in a thread pool.
+- Per-provider limits around every stage that calls Gemini / OpenAI / Supabase
+  (triage.STAGE_PROVIDERS), shared by all workers: a cap on concurrent stages
+  and an optional pace on stage starts per minute. They bound stages, not API
+  requests: one analyze stage makes several Gemini calls (agent hand-offs)
+  under a single slot, so set the pace below the provider's request quota
+  divided by the calls a stage makes.
+- Checkpointed: every finished report is appended (and fsync'ed) to the JSONL
+  output as soon as it completes. A re-run skips files whose content hash is
+  already recorded as done / not_relevant, so a crash resumes where it stopped
+  (failed reports are retried; --no-retry-failed keeps them).
+
+Each JSONL record: document, path, sha256, status (done | not_relevant | failed),
+relevance, has_gaps, gaps [{text, severity} (+ citation, sections from the
+map-reduce gap analysis)], report, error, timings
+(seconds per stage, total, and the streamed analysis timings), finished_at.
+
+Usage (from src/):
+  python -m RAG.batch_triage --dir /path/to/reports
+  python -m RAG.batch_triage --dir reports --output .cache/batch_triage.jsonl --workers 8
+  python -m RAG.batch_triage --dir reports --limit-gemini 2 --pace-gemini 10
+
+Environment variables (defaults for the limits, shared with the job runner):
+  JOBS_LIMIT_GEMINI (2), JOBS_LIMIT_OPENAI (4), JOBS_LIMIT_SUPABASE (4)
+  BATCH_PACE_GEMINI, BATCH_PACE_OPENAI, BATCH_PACE_SUPABASE   stage starts per minute (unset = no pacing)
+Requires the same API keys as the app.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .ingest_regulations import _collect_pdfs
+from .manifest import file_sha256
+
+load_dotenv()
+
+DEFAULT_OUTPUT = ".cache/batch_triage.jsonl"
+PROVIDERS = ["gemini", "openai", "supabase"]
+COMPLETE_STATUSES = ("done", "not_relevant")
+
+
+class RateLimiter:
+    """Spaces acquisitions at least 60/per_minute seconds apart (thread-safe)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait_s = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self.interval
+        if wait_s:
+            time.sleep(wait_s)
+
+
+class ProviderLimits:
+    """`limit(provider)` context manager held for a whole stage: concurrency cap + optional pace of starts per minute."""
+
+    def __init__(
+        self, concurrency: Optional[Dict[str, int]] = None, starts_per_minute: Optional[Dict[str, float]] = None
+    ):
+        self.semaphores = {p: threading.BoundedSemaphore(max(1, n)) for p, n in (concurrency or {}).items()}
+        self.rates = {p: RateLimiter(r) for p, r in (starts_per_minute or {}).items() if r}
+
+    @contextmanager
+    def limit(self, provider: str):
+        semaphore = self.semaphores.get(provider)
+        if semaphore:
+            semaphore.acquire()
+        try:
+            if provider in self.rates:
+                self.rates[provider].acquire()
+            yield
+        finally:
+            if semaphore:
+                semaphore.release()
+
+
+def load_checkpoint(output: str) -> Dict[str, dict]:
+    """Latest record per sha256 from a previous (possibly interrupted) run."""
+    records: Dict[str, dict] = {}
+    path = Path(output)
+    if not path.exists():
+        return records
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash
+            if record.get("sha256"):
+                records[record["sha256"]] = record
+    return records
+
+
+class CheckpointWriter:
+    """Appends one JSON line per finished report and makes it durable before returning."""
+
+    def __init__(self, output: str):
+        path = Path(output)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(path, "a+", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._fh.seek(0, os.SEEK_END)
+        if self._fh.tell():
+            self._fh.seek(self._fh.tell() - 1)
+            if self._fh.read(1) != "\n":
+                self._fh.write("\n")  # terminate a torn line so the next record parses
+
+    def write(self, record: dict) -> None:
+        with self._lock:
+            self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def _triage_one(pdf: Path, digest: str, pages: Optional[List[dict]], limits: ProviderLimits) -> dict:
+    from triage import extract_gaps, triage_document
+
+    started = time.perf_counter()
+    marks: Dict[str, float] = {}
+    stage_s: Dict[str, float] = {}
+
+    def on_stage(stage: str, status: str) -> None:
+        now = time.perf_counter()
+        if status == "running":
+            marks[stage] = now
+        elif status == "done":
+            stage_s[stage] = round(now - marks.get(stage, now), 3)
+
+    record = {"document": pdf.name, "path": str(pdf), "sha256": digest}
+    try:
+        result = triage_document(str(pdf), pdf.name, on_stage=on_stage, limit=limits.limit, pages=pages)
+    except Exception as exc:
+        record.update(status="failed", error="".join(traceback.format_exception_only(type(exc), exc)).strip())
+    else:
+        report = result.get("report")
+        if result.get("gaps") is not None:
+            gaps = [{"text": g["title"], "severity": g["severity"], "citation": g["citation"], "sections": g["sections"]}
+                    for g in result["gaps"]]
+        else:
+            gaps = extract_gaps(report) if report else []
+        record.update(
+            status="done" if result.get("relevant") else "not_relevant",
+            relevance=result.get("relevance"),
+            has_gaps=bool(gaps),
+            gaps=gaps,
+            report=report,
+            error=None,
+        )
+        if result.get("timings"):
+            stage_s["analysis"] = result["timings"]
+    record["timings"] = {**stage_s, "total_s": round(time.perf_counter() - started, 3)}
+    record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return record
+
+
+def batch_triage(
+    directory: str,
+    output: str = DEFAULT_OUTPUT,
+    workers: int = 4,
+    parse_workers: int = min(4, os.cpu_count() or 1),
+    concurrency: Optional[Dict[str, int]] = None,
+    starts_per_minute: Optional[Dict[str, float]] = None,
+    retry_failed: bool = True,
+    on_record: Optional[Callable[[dict], None]] = None,
+) -> Dict[str, int]:
+    """Triage every PDF in `directory`, appending records to `output`. parse_workers=0 parses in the workers."""
+    from triage import extract_pages
+
+    pdfs = _collect_pdfs(directory)
+    previous = load_checkpoint(output)
+    resume = COMPLETE_STATUSES + (() if retry_failed else ("failed",))
+    pending: List[tuple] = []
+    summary = {"total": len(pdfs), "skipped": 0, "done": 0, "not_relevant": 0, "failed": 0}
+    for pdf in pdfs:
+        digest = file_sha256(pdf)
+        if previous.get(digest, {}).get("status") in resume:
+            summary["skipped"] += 1
+            continue
+        pending.append((pdf, digest))
+
+    print(f"[batch] {len(pdfs)} PDF(s) in '{directory}': {len(pending)} to triage, {summary['skipped']} already recorded")
+    if not pending:
+        return summary
+
+    limits = ProviderLimits(concurrency, starts_per_minute)
+    writer = CheckpointWriter(output)
+    started = time.perf_counter()
+
+    def finish(record: dict) -> None:
+        writer.write(record)
+        summary[record["status"]] += 1
+        gaps = f", {len(record.get('gaps') or [])} gap(s)" if record["status"] == "done" else ""
+        print(f"[batch] {record['document']}: {record['status']}{gaps} in {record['timings']['total_s']}s")
+        if on_record:
+            on_record(record)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            triage_futures = set()
+            if parse_workers > 0:
+                with ProcessPoolExecutor(max_workers=parse_workers) as parsers:
+                    extract_futures = {parsers.submit(extract_pages, str(pdf)): (pdf, digest) for pdf, digest in pending}
+                    while extract_futures or triage_futures:
+                        done, _ = wait(set(extract_futures) | triage_futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            if future in triage_futures:
+                                triage_futures.discard(future)
+                                finish(future.result())
+                                continue
+                            pdf, digest = extract_futures.pop(future)
+                            try:
+                                pages = future.result()
+                            except Exception as exc:
+                                finish({
+                                    "document": pdf.name, "path": str(pdf), "sha256": digest, "status": "failed",
+                                    "error": f"extract: {exc}", "timings": {"total_s": 0.0},
+                                    "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                })
+                                continue
+                            triage_futures.add(pool.submit(_triage_one, pdf, digest, pages, limits))
+            else:
+                triage_futures = {pool.submit(_triage_one, pdf, digest, None, limits) for pdf, digest in pending}
+            for future in triage_futures:
+                finish(future.result())
+    finally:
+        writer.close()
+
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    print(
+        f"[batch] Completed in {summary['seconds']}s: done={summary['done']} not_relevant={summary['not_relevant']} "
+        f"failed={summary['failed']} skipped={summary['skipped']} -> {output}"
+    )
+    return summary
+
+
+def _env_limits(prefix: str, cast, default=None) -> Dict[str, float]:
+    values = {}
+    for provider in PROVIDERS:
+        raw = os.getenv(f"{prefix}_{provider.upper()}")
+        if raw:
+            values[provider] = cast(raw)
+        elif default is not None:
+            values[provider] = default(provider)
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Triage every inspection report PDF in a directory.")
+    parser.add_argument("--dir", required=True, help="Directory of inspection report PDFs")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSONL results + checkpoint file")
+    parser.add_argument("--workers", type=int, default=4, help="Reports triaged concurrently")
+    parser.add_argument("--parse-workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Processes parsing PDFs (0 = parse in the workers)")
+    parser.add_argument("--no-retry-failed", action="store_true", help="Keep failed records instead of retrying")
+    concurrency = _env_limits("JOBS_LIMIT", int, default=lambda p: 2 if p == "gemini" else 4)
+    pace = _env_limits("BATCH_PACE", float)
+    for provider in PROVIDERS:
+        parser.add_argument(f"--limit-{provider}", type=int, default=concurrency[provider],
+                            help=f"Concurrent stages calling {provider}")
+        parser.add_argument(f"--pace-{provider}", type=float, default=pace.get(provider),
+                            help=f"Max stage starts per minute for {provider} (stages, not API requests)")
+    args = parser.parse_args()
+
+    batch_triage(
+        args.dir,
+        output=args.output,
+        workers=args.workers,
+        parse_workers=args.parse_workers,
+        concurrency={p: getattr(args, f"limit_{p}") for p in PROVIDERS},
+        starts_per_minute={p: getattr(args, f"pace_{p}") for p in PROVIDERS if getattr(args, f"pace_{p}")},
+        retry_failed=not args.no_retry_failed,
+    )
@@ -0,0 +1,348 @@
+# RAG/chunking.py
+"""
+Chunking profiles shared by regulation ingestion and report uploads.
+- A profile is a token budget (tiktoken, cl100k_base: the tokenizer of the
+  OpenAI embedding models), hard boundaries and soft separators. Text between
+  hard boundaries (a section, a heading's body) is a unit: small units are
+  packed whole into one chunk, so chunks start at boundaries; a unit over the
+  budget is split on the soft separators (subsections, paragraphs, lines,
+  sentences, words) with the profile's overlap.
+- regulations: hard boundaries before SOR sections (with their marginal
+  note) and Directive headings; subsections / numbered requirements are soft.
+  10% overlap, only inside long sections (the former 500/200 character
+  splitter overlapped 40%: ~2x the chunks, vectors and scan work).
+- inspection: shorter chunks for uploaded reports; hard boundaries at their
+  numbered, markdown or ALL-CAPS headings, soft ones at bullet lists.
+- legacy: the former RecursiveCharacterTextSplitter(500, 200), kept for
+  comparison and for manifests written before profiles existed.
+The profile name is stored in every chunk's metadata (`chunk_profile`).
+
+Compare profiles on a corpus (chunk count, tokens embedded, storage and
+retrieval hit-rate on section-heading queries, see compare_profiles):
+  python -m RAG.chunking --dir RAG/Regulations --profiles regulations legacy
+  python -m RAG.chunking --offline        # hashed bag-of-words embeddings, no API calls
+
+Environment variables (all optional):
+  REGULATIONS_CHUNK_PROFILE   profile used by ingest_regulations (default 'regulations')
+  REPORT_CHUNK_PROFILE        profile used by rag.run_rag_pipeline (default 'inspection')
+"""
+import argparse
+import json
+import os
+import re
+import time
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+TOKENIZER = "cl100k_base"
+EMBEDDING_DIMENSIONS = 1536  # text-embedding-ada-002, float32 per dimension in pgvector
+
+# Hard boundaries: a chunk never straddles one unless both sides fit whole in it.
+# Each pattern matches the newline before the unit it starts (lookahead only).
+_SOR_NOTE_THEN_SECTION = r"\n(?=[^\n]{3,160}\n\d{1,3}(?:\.\d{1,2})? (?:\(1\) )?[A-Z])"
+_SECTION = r"\n(?=\d{1,3}(?:\.\d{1,2}){0,3} (?:\(1\) )?[A-Z])"
+# Soft boundaries, tried in order inside a section too long for one chunk.
+_SUBSECTION = r"\n(?=\(\d{1,2}(?:\.\d)?\) )"
+_REQUIREMENT = r"\n(?=\d{1,2}\) )"
+_PARAGRAPH = [r"\n\n", r"\n", r"(?<=[.;:]) ", r" ", r""]
+
+
+class ChunkProfile:
+    """Token-aware, boundary-aware splitter settings."""
+
+    def __init__(
+        self,
+        name: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        boundaries: Sequence[str],
+        separators: Sequence[str],
+        tokens: bool = True,
+    ):
+        self.name = name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.boundaries = [re.compile(b) for b in boundaries]
+        self.separators = list(separators)
+        self.tokens = tokens  # False: sizes are characters (legacy)
+        self.min_size = chunk_size // 8 if tokens else 0  # a smaller unit (lone heading) joins the next one
+
+    def length(self, text: str) -> int:
+        return token_length(text) if self.tokens else len(text)
+
+    def splitter(self):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        return RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            length_function=self.length,
+            separators=self.separators,
+            is_separator_regex=True,
+        )
+
+    def __repr__(self) -> str:
+        unit = "tokens" if self.tokens else "chars"
+        return f"ChunkProfile({self.name!r}, {self.chunk_size}/{self.chunk_overlap} {unit})"
+
+
+PROFILES: Dict[str, ChunkProfile] = {
+    "regulations": ChunkProfile(
+        "regulations", 220, 22, [_SOR_NOTE_THEN_SECTION, _SECTION], [_SUBSECTION, _REQUIREMENT] + _PARAGRAPH
+    ),
+    "inspection": ChunkProfile(
+        "inspection", 160, 16,
+        [r"\n(?=#{1,6} )", r"\n(?=\d{1,2}(?:\.\d{1,2})*[.)]? [A-Z])", r"\n(?=[A-Z][A-Z0-9 &/,()-]{3,60}:?\n)"],
+        [r"\n(?=[-*•] )"] + _PARAGRAPH,
+    ),
+    "legacy": ChunkProfile("legacy", 500, 200, [], ["\n\n", "\n", " ", ""], tokens=False),
+}
+
+
+def get_profile(name: str) -> ChunkProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown chunk profile {name!r}; expected one of {sorted(PROFILES)}") from None
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    """tiktoken encoding, or None when its BPE file cannot be loaded (offline, no cache)."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(TOKENIZER)
+    except Exception as exc:
+        print(f"[chunking] tiktoken {TOKENIZER} unavailable ({type(exc).__name__}); estimating 4 characters per token")
+        return None
+
+
+def token_length(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _trim(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _units(text: str, settings: ChunkProfile) -> List[Tuple[int, int]]:
+    """Text between hard boundaries, as (start, end) slices."""
+    cuts = sorted({0, len(text), *(m.end() for b in settings.boundaries for m in b.finditer(text))})
+    return [span for span in (_trim(text, a, b) for a, b in zip(cuts, cuts[1:])) if span[0] < span[1]]
+
+
+def split_spans(text: str, settings: ChunkProfile) -> List[Tuple[int, int]]:
+    """
+    Chunk (start, end) slices of one page: whole units packed up to chunk_size,
+    longer units split on the soft separators with chunk_overlap, and a unit
+    below min_size (a lone heading) joined to what follows it.
+    """
+    spans: List[List[int]] = []
+    packable = False  # whether spans[-1] holds whole units only
+    for start, end in _units(text, settings):
+        if spans and packable and settings.length(text[spans[-1][0]:end]) <= settings.chunk_size:
+            spans[-1][1] = end
+            continue
+        tiny = packable and settings.length(text[spans[-1][0]:spans[-1][1]]) < settings.min_size
+        if settings.length(text[start:end]) <= settings.chunk_size:
+            if tiny:
+                spans[-1][1] = end
+            else:
+                spans.append([start, end])
+            packable = True
+            continue
+        position = start - 1
+        for piece in settings.splitter().split_text(text[start:end]):
+            found = text.find(piece, position + 1, end)
+            position = found if found >= 0 else text.find(piece, start, end)
+            if tiny:
+                spans[-1][1], tiny = position + len(piece), False
+            else:
+                spans.append([position, position + len(piece)])
+        packable = False
+    return [(a, b) for a, b in spans]
+
+
+def chunk_documents(documents: Iterable[Document], profile: str) -> List[Document]:
+    """
+    Split documents (pages) with `profile`. Each chunk records the profile name
+    and its `start_index` in the page, which RAG/citations.py uses to place
+    section markers.
+    """
+    settings = get_profile(profile)
+    chunks = []
+    for document in documents:
+        text = document.page_content
+        for start, end in split_spans(text, settings):
+            metadata = {**(document.metadata or {}), "start_index": start, "chunk_profile": settings.name}
+            chunks.append(Document(page_content=text[start:end], metadata=metadata))
+    return chunks
+
+
+def chunk_page_stream(pages: Iterable[Document], split: Callable[[List[Document]], List[Document]]) -> Iterator[Document]:
+    """
+    Chunk pages as they arrive without cutting clauses at page breaks: each
+    page's last chunk is held back and split again together with the next
+    page. A chunk keeps the metadata (page) and `start_index` of the page it
+    starts on; its text may run into the next page.
+    """
+    held: Optional[Document] = None  # last chunk so far, may continue on the next page
+    rest = ""  # text from held's start to the end of what has been read
+    for page in pages:
+        offset = 0
+        if held is not None:
+            offset = len(rest) + 1
+            page = Document(page_content=f"{rest}\n{page.page_content}", metadata=page.metadata)
+        chunks = split([page])
+        if not chunks:
+            continue
+        tail = chunks[-1].metadata.get("start_index", 0)
+        for chunk in chunks:
+            start = chunk.metadata.get("start_index", 0)  # in the combined text
+            if start < offset:
+                chunk.metadata = {**chunk.metadata, **held.metadata, "start_index": held.metadata["start_index"] + start}
+            else:
+                chunk.metadata["start_index"] = start - offset
+        yield from chunks[:-1]
+        held, rest = chunks[-1], page.page_content[tail:]
+    if held is not None:
+        yield held
+
+
+# ---------------- Profile comparison ----------------
+def _heading_queries(chunks: List[Document], limit: int) -> List[dict]:
+    """Self-labelled queries: each section heading must retrieve a chunk citing that section."""
+    queries, seen = [], set()
+    for chunk in chunks:
+        heading, section = chunk.metadata.get("heading"), chunk.metadata.get("section")
+        key = (chunk.metadata.get("source_pdf"), section)
+        if heading and section and key not in seen:
+            seen.add(key)
+            queries.append({"query": heading, "source_pdf": key[0], "section": section})
+    step = max(1, len(queries) // limit) if limit else 1
+    return queries[::step][:limit] if limit else queries
+
+
+def _evaluate(chunks: List[Document], vectors, queries: List[dict], embeddings, k: int) -> dict:
+    import numpy as np
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    query_vectors = np.asarray(embeddings.embed_documents([q["query"] for q in queries]), dtype=np.float32)
+    hits, started = 0, time.perf_counter()
+    for q, vector in zip(queries, query_vectors):
+        top = np.argsort(-(matrix @ vector))[:k]
+        hits += any(
+            chunks[i].metadata.get("source_pdf") == q["source_pdf"] and q["section"] in _sections(chunks[i])
+            for i in top
+        )
+    return {
+        "queries": len(queries),
+        "hit_rate": round(hits / len(queries), 3) if queries else None,
+        "scan_ms_per_query": round((time.perf_counter() - started) * 1000 / max(1, len(queries)), 3),
+    }
+
+
+def _sections(chunk: Document) -> set:
+    return {label.split("(")[0] for label in chunk.metadata.get("citations") or []} | {chunk.metadata.get("section")}
+
+
+def compare_profiles(
+    directory: str,
+    profiles: Sequence[str] = ("regulations", "legacy"),
+    embeddings=None,
+    k: int = 5,
+    max_queries: int = 200,
+    queries: Optional[List[dict]] = None,
+) -> Dict[str, dict]:
+    """
+    Chunk every PDF in `directory` with each profile and report chunk count,
+    tokens embedded, estimated storage (content + metadata + vector) and
+    top-k hit-rate. Queries default to the regulations' own section headings
+    (labelled by the structure parser); pass [{'query', 'source_pdf', 'section'}] to override.
+    """
+    from langchain_community.document_loaders import PyPDFLoader
+
+    from .citations import annotate_structure
+    from .embedding_cache import get_embeddings
+
+    embeddings = embeddings or get_embeddings()
+    pdfs = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() == ".pdf")
+    pages = {pdf: PyPDFLoader(str(pdf)).load() for pdf in pdfs}
+    chunked: Dict[str, List[Document]] = {}
+    for name in profiles:
+        chunked[name] = []
+        for pdf in pdfs:
+            chunks = list(chunk_page_stream(pages[pdf], partial(chunk_documents, profile=name)))
+            for chunk in chunks:
+                chunk.metadata.update(source_pdf=pdf.name, corpus="regulations")
+            annotate_structure(chunks, pdf.name)
+            chunked[name].extend(chunks)
+    if queries is None:
+        reference = chunked.get("regulations") or next(iter(chunked.values()))
+        queries = _heading_queries(reference, max_queries)
+
+    report: Dict[str, dict] = {}
+    for name, chunks in chunked.items():
+        texts = [c.page_content for c in chunks]
+        content_bytes = sum(len(t.encode("utf-8")) for t in texts)
+        metadata_bytes = sum(len(json.dumps(c.metadata)) for c in chunks)
+        vector_bytes = len(chunks) * EMBEDDING_DIMENSIONS * 4
+        report[name] = {
+            "profile": repr(get_profile(name)),
+            "chunks": len(chunks),
+            "tokens_embedded": sum(token_length(t) for t in texts),
+            "mean_chunk_tokens": round(sum(token_length(t) for t in texts) / max(1, len(texts)), 1),
+            "storage_bytes": content_bytes + metadata_bytes + vector_bytes,
+            **_evaluate(chunks, embeddings.embed_documents(texts), queries, embeddings, k),
+        }
+    baseline = report.get("legacy")
+    if baseline:
+        for entry in report.values():
+            entry["chunks_vs_legacy"] = round(entry["chunks"] / max(1, baseline["chunks"]), 3)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare chunking profiles on a directory of regulation PDFs.")
+    parser.add_argument("--dir", dest="directory", default="RAG/Regulations", help="Directory containing PDF regulations")
+    parser.add_argument("--profiles", nargs="+", default=["regulations", "legacy"], choices=sorted(PROFILES))
+    parser.add_argument("--k", type=int, default=5, help="Top-k for the hit-rate")
+    parser.add_argument("--max-queries", type=int, default=200, help="Section-heading queries sampled (0 = all)")
+    parser.add_argument("--queries", default=None, help="JSONL of {query, source_pdf, section} instead of headings")
+    parser.add_argument("--offline", action="store_true", help="Hashed bag-of-words embeddings instead of OpenAI")
+    parser.add_argument("--output", default=".cache/chunking_report.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    offline = None
+    if args.offline:
+        from bench.fakes import FakeEmbeddings
+
+        offline = FakeEmbeddings(dim=EMBEDDING_DIMENSIONS)
+    labelled = None
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as fh:
+            labelled = [json.loads(line) for line in fh if line.strip()]
+    results = compare_profiles(
+        args.directory, args.profiles, embeddings=offline, k=args.k, max_queries=args.max_queries, queries=labelled
+    )
+    for name, entry in results.items():
+        print(
+            f"[chunking] {name}: {entry['chunks']} chunks, {entry['tokens_embedded']} tokens, "
+            f"{entry['storage_bytes'] / 1e6:.1f} MB, hit@{args.k} {entry['hit_rate']} over {entry['queries']} queries"
+        )
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2)
+    print(f"[chunking] wrote {args.output}")
@@ -0,0 +1,376 @@
+# RAG/citations.py
+"""
+Regulation structure and the exact-citation index.
+- annotate_structure(chunks, source_pdf): recovers the section / subsection
+  numbering of a regulation from its chunk text (chunks must carry `page` and
+  `start_index`) and stamps `section`, `subsection` and `heading` into each
+  chunk's metadata, plus `citations`: every label the chunk covers.
+  Two numbering styles are recognized:
+    * federal regulations (SOR/DORS): "8 (1) Every operator ...", "(2) ...",
+      validated against the "Sections 6-8" running header of each page
+    * numbered directives (AER Directive 060): "3.3.2  Conditions That ..."
+      headings and "1) ..." requirements; table-of-contents lines are ignored
+- CitationIndex: precomputed at ingestion (RAG.ingest_regulations) and saved
+  as JSON. Maps (document, label) -> chunk ids (with every ancestor label, so
+  "8" covers "8(1)" and "3.3" covers "3.3.2"), keeps each chunk's text, page
+  and heading, and resolves a citation string in O(1) dict lookups, with no
+  embedding or vector scan. It also backs the BM25 index (RAG/lexical.py).
+
+Citation strings understood by parse_citations:
+  "SOR/2018-66, Section 8(1)", "DORS/2018-66 s. 8", "section 37 of SOR-2018-66",
+  "AER Directive 060, Section 3.2", "D060 3.3.2(1)", "Section 8(1)" (any document)
+
+Environment variables (all optional):
+  CITATION_INDEX_PATH   default '.cache/citation_index.json'
+"""
+import bisect
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_INDEX_PATH = ".cache/citation_index.json"
+INDEX_VERSION = 1
+
+# ---------------- Document names ----------------
+_SOR_NAME = re.compile(r"(?:sor|dors)\W*(\d{4})\W*(\d+)", re.IGNORECASE)
+_DIRECTIVE_NAME = re.compile(r"(?:directive|\bd)\W*(\d{2,3})\b", re.IGNORECASE)
+
+
+def doc_key(name: str) -> str:
+    """Canonical document key: 'SOR-2018-66.pdf' / 'DORS/2018-66' -> 'sor-2018-66', 'Directive060.pdf' -> 'directive-060'."""
+    stem = Path(name).stem if name.lower().endswith(".pdf") else name
+    sor = _SOR_NAME.search(stem)
+    if sor:
+        return f"sor-{sor.group(1)}-{int(sor.group(2))}"
+    directive = _DIRECTIVE_NAME.search(stem)
+    if directive:
+        return f"directive-{int(directive.group(1)):03d}"
+    return re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-")
+
+
+def doc_label(key: str) -> str:
+    if key.startswith("sor-"):
+        _, year, number = key.split("-")
+        return f"SOR/{year}-{number}"
+    if key.startswith("directive-"):
+        return f"Directive {key.split('-')[1]}"
+    return key
+
+
+def section_ancestors(label: str) -> List[str]:
+    """'3.3.2(1)(a)' -> ['3.3.2(1)(a)', '3.3.2(1)', '3.3.2', '3.3', '3']."""
+    labels = [label]
+    while "(" in label:
+        label = label[: label.rindex("(")]
+        labels.append(label)
+    while "." in label:
+        label = label[: label.rindex(".")]
+        labels.append(label)
+    return labels
+
+
+# ---------------- Structure parsing ----------------
+_SOR_HEADER = re.compile(r"^Sections?\s+(\d+)(?:\.\d+)?(?:\s*-\s*(\d+)(?:\.\d+)?)?\s+Articles?", re.MULTILINE)
+_SOR_SECTION = re.compile(r"^(\d{1,3}(?:\.\d{1,2})?)(?:\s*\((\d{1,2})\))?\s+(?=[A-Z«])", re.MULTILINE)
+_SOR_SUBSECTION = re.compile(r"^\((\d{1,2})\)\s+(?=[A-Z«])", re.MULTILINE)
+# A heading at the top of a page shares a line with the running header "... (June 2025)  5 2.3 Notification ..."
+_DIRECTIVE_HEADING = re.compile(
+    r"^(?:[^\n]*\([A-Z][a-z]+ \d{4}\)\s+(?:\d+\s+)?)?(\d{1,2}(?:\.\d{1,2}){0,3})\s+([A-Z][^\n]{2,120}?)\s*$", re.MULTILINE
+)
+_DIRECTIVE_REQUIREMENT = re.compile(r"^(\d{1,2})\)\s+(?=[A-Z])", re.MULTILINE)
+_TOC_LEADER = re.compile(r"\.{5,}|\s\d+\s*$")
+_TOC_PAGE = re.compile(r"TABLE OF (?:PROVISIONS|CONTENTS)|TABLE ANALYTIQUE", re.IGNORECASE)
+
+
+def _is_sor(source_pdf: str) -> bool:
+    return doc_key(source_pdf).startswith("sor-")
+
+
+def _line_before(text: str, pos: int) -> str:
+    end = text.rfind("\n", 0, pos)
+    if end <= 0:
+        return ""
+    return text[text.rfind("\n", 0, end) + 1: end].strip()[:120]
+
+
+def _pages(chunks) -> Dict[int, str]:
+    """Page text rebuilt from its chunks' start_index slices (whitespace the splitter stripped becomes newlines)."""
+    buffers: Dict[int, list] = {}
+    for chunk in chunks:
+        page, start = chunk.metadata.get("page", 0), max(0, chunk.metadata.get("start_index", 0))
+        end = start + len(chunk.page_content)
+        buffer = buffers.setdefault(page, [])
+        if len(buffer) < end:
+            buffer.extend("\n" * (end - len(buffer)))
+        buffer[start:end] = chunk.page_content
+    return {page: "".join(buffer) for page, buffer in buffers.items()}
+
+
+def _markers(chunks, source_pdf: str) -> List[tuple]:
+    """Candidate (page, position, kind, number, sub, heading) markers, scanned over whole pages so a
+    marker (or an SOR marginal note) is found even when a chunk boundary falls next to it."""
+    sor = _is_sor(source_pdf)
+    found: Dict[Tuple[int, int], tuple] = {}
+    patterns = (("section", _SOR_SECTION), ("sub", _SOR_SUBSECTION)) if sor else (
+        ("section", _DIRECTIVE_HEADING), ("sub", _DIRECTIVE_REQUIREMENT))
+    for page, text in _pages(chunks).items():
+        if _TOC_PAGE.search(text):
+            continue
+        for kind, pattern in patterns:
+            for m in pattern.finditer(text):
+                if kind == "section" and not sor and _TOC_LEADER.search(m.group(0)):
+                    continue
+                position = m.start(1 if kind == "section" else 0)
+                if kind == "section" and sor:
+                    heading = _line_before(text, m.start())
+                    marker = ("section", m.group(1), m.group(2), heading)
+                    if heading:  # the marginal note opens the section
+                        position = text.rfind("\n", 0, text.rfind("\n", 0, m.start())) + 1
+                elif kind == "section":
+                    marker = ("section", m.group(1), None, m.group(2).strip())
+                else:
+                    marker = ("sub", None, m.group(1), None)
+                found.setdefault((page, position), marker)
+    return [(page, pos, *marker) for (page, pos), marker in sorted(found.items())]
+
+
+def _page_ranges(chunks) -> Dict[int, Tuple[int, int]]:
+    ranges = {}
+    for chunk in chunks:
+        m = _SOR_HEADER.search(chunk.page_content)
+        if m:
+            lo = int(m.group(1))
+            ranges[chunk.metadata.get("page", 0)] = (lo, int(m.group(2) or lo))
+    return ranges
+
+
+def _number(label: str) -> Tuple[int, ...]:
+    return tuple(int(p) for p in label.split("."))
+
+
+def _directive_successor(current: Tuple[int, ...], new: Tuple[int, ...]) -> bool:
+    """A numbered heading may only move forward by a small step (rejects stray numbers and tables)."""
+    for i, value in enumerate(new):
+        if i >= len(current):
+            return value == 1 and all(v == 1 for v in new[i + 1:])
+        if value != current[i]:
+            return 0 < value - current[i] <= 2 and all(v == 1 for v in new[i + 1:])
+    return False
+
+
+def annotate_structure(chunks, source_pdf: str) -> None:
+    """Stamp section/subsection/heading/citations into chunk metadata (in place, chunks in document order)."""
+    sor = _is_sor(source_pdf)
+    ranges = _page_ranges(chunks) if sor else {}
+    accepted: List[Tuple[Tuple[int, int], Optional[str], Optional[str], Optional[str]]] = []
+    section, sub, heading = None, None, None
+    for page, pos, kind, number, subnumber, title in _markers(chunks, source_pdf):
+        if kind == "section":
+            if sor:
+                lo_hi = ranges.get(page)
+                major = int(number.split(".")[0])
+                if lo_hi and not lo_hi[0] <= major <= lo_hi[1]:
+                    continue
+                if not lo_hi and major != (int(float(section)) + 1 if section else 1):
+                    continue  # no running header (first pages): only the next section number
+                if section is not None and _number(number) < _number(section):
+                    continue
+            elif not _directive_successor(_number(section) if section else (0,), _number(number)):
+                continue
+            if number != section:
+                section, heading = number, title or None
+                sub = None
+            if subnumber:
+                sub = subnumber
+        else:
+            if section is None or (sub is not None and int(subnumber) < int(sub)):
+                continue
+            sub = subnumber
+        accepted.append(((page, pos), section, sub, heading))
+
+    keys = [a[0] for a in accepted]
+    for chunk in chunks:
+        page, start = chunk.metadata.get("page", 0), chunk.metadata.get("start_index", 0)
+        first = bisect.bisect_right(keys, (page, start)) - 1
+        last = bisect.bisect_left(keys, (page, start + len(chunk.page_content)))
+        active = accepted[first] if first >= 0 else None
+        span = ([active] if active else []) + accepted[first + 1: last]
+        labels = []
+        for _, sec, subsec, _ in span:
+            label = f"{sec}({subsec})" if subsec else sec
+            if label not in labels:
+                labels.append(label)
+        if active:
+            chunk.metadata["section"] = active[1]
+            chunk.metadata["subsection"] = f"{active[1]}({active[2]})" if active[2] else None
+            chunk.metadata["heading"] = active[3]
+        chunk.metadata["citations"] = labels
+
+
+# ---------------- Citation strings ----------------
+_DOC_REF = r"(?:(?:SOR|DORS)\s*[/-]\s*\d{4}\s*-\s*\d+|(?:AER\s+)?Directive\s*0?\d{2,3}|\bD0\d{2})"
+_SECTION_REF = r"(?P<sec>\d{1,3}(?:\.\d{1,2}){0,3}(?:\s*\([0-9a-z.]{1,4}\))*)"
+_SECTION_WORD = r"(?:sections?|subsections?|paragraphs?|articles?|ss?\.|sec\.|§)"
+_CITATION_PATTERNS = [
+    re.compile(rf"(?P<doc>{_DOC_REF})\b(?:\s*,\s*|\s+)(?:{_SECTION_WORD}\s*)?{_SECTION_REF}", re.IGNORECASE),
+    re.compile(rf"{_SECTION_WORD}\s*{_SECTION_REF}\s*(?:of|in)\s+(?:the\s+)?(?P<doc>{_DOC_REF})", re.IGNORECASE),
+    re.compile(rf"{_SECTION_WORD}\s*{_SECTION_REF}", re.IGNORECASE),
+]
+
+
+def normalize_section(text: str) -> str:
+    return re.sub(r"\s+", "", text).lower().rstrip(".")
+
+
+def parse_citations(text: str) -> List[Tuple[Optional[str], str]]:
+    """[(doc_key or None, section label)] in order of appearance."""
+    found: List[Tuple[int, Optional[str], str]] = []
+    taken: List[Tuple[int, int]] = []
+    for pattern in _CITATION_PATTERNS:
+        for m in pattern.finditer(text):
+            if any(s < m.end() and m.start() < e for s, e in taken):
+                continue
+            taken.append((m.start(), m.end()))
+            doc = m.groupdict().get("doc")
+            found.append((m.start(), doc_key(doc) if doc else None, normalize_section(m.group("sec"))))
+    return [(doc, label) for _, doc, label in sorted(found)]
+
+
+# ---------------- Index ----------------
+class CitationIndex:
+    """{document: {label: [chunk_id]}} plus chunk text/page/heading, for exact citation lookup."""
+
+    def __init__(self, documents: Optional[Dict[str, dict]] = None):
+        self.documents: Dict[str, dict] = documents or {}
+        self._build()
+
+    def _build(self) -> None:
+        self._labels: Dict[Tuple[str, str], List[str]] = {}
+        self._by_section: Dict[str, List[str]] = {}
+        self._chunks: Dict[str, dict] = {}
+        for source_pdf, entry in self.documents.items():
+            key = entry["doc"]
+            for chunk_id, chunk in entry["chunks"].items():
+                self._chunks[chunk_id] = {**chunk, "source_pdf": source_pdf, "doc": key}
+            for label, ids in entry["citations"].items():
+                self._labels[(key, label)] = ids
+                self._by_section.setdefault(label, []).append(key)
+        self._bm25 = None
+
+    # ---- building ----
+    def add_document(self, source_pdf: str, chunks) -> None:
+        """Replace `source_pdf`'s entry with its annotated chunks (see annotate_structure)."""
+        entry = {"doc": doc_key(source_pdf), "chunks": {}, "citations": {}}
+        for chunk in chunks:
+            meta = chunk.metadata
+            chunk_id = meta["chunk_id"]
+            entry["chunks"][chunk_id] = {
+                "content": chunk.page_content,
+                "page": meta.get("page"),
+                "section": meta.get("section"),
+                "heading": meta.get("heading"),
+            }
+            for label in meta.get("citations") or []:
+                for ancestor in section_ancestors(label):
+                    ids = entry["citations"].setdefault(ancestor, [])
+                    if chunk_id not in ids:
+                        ids.append(chunk_id)
+        self.documents[source_pdf] = entry
+        self._build()
+
+    def remove_document(self, source_pdf: str) -> None:
+        if self.documents.pop(source_pdf, None) is not None:
+            self._build()
+
+    def has_document(self, source_pdf: str) -> bool:
+        return source_pdf in self.documents
+
+    # ---- persistence ----
+    def save(self, path: Optional[str] = None) -> None:
+        path = Path(path or index_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"version": INDEX_VERSION, "documents": self.documents}, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "CitationIndex":
+        path = Path(path or index_path())
+        if not path.exists():
+            return cls()
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(data.get("documents", {}) if data.get("version") == INDEX_VERSION else {})
+
+    # ---- queries ----
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def row(self, chunk_id: str, citation: Optional[str] = None) -> dict:
+        chunk = self._chunks[chunk_id]
+        metadata = {"corpus": "regulations", "source_pdf": chunk["source_pdf"], "page": chunk["page"],
+                    "section": chunk["section"], "heading": chunk["heading"]}
+        row = {"id": chunk_id, "content": chunk["content"], "metadata": metadata}
+        if citation:
+            row["citation"] = citation
+        return row
+
+    def resolve(self, doc: Optional[str], label: str) -> List[Tuple[str, str, List[str]]]:
+        """[(doc, matched label, chunk ids)]; falls back to the nearest enclosing label."""
+        for candidate in section_ancestors(label):
+            docs = [doc] if doc else self._by_section.get(candidate, [])
+            hits = [(d, candidate, self._labels[(d, candidate)]) for d in docs if (d, candidate) in self._labels]
+            if hits:
+                return hits
+        return []
+
+    def lookup(self, citation: str, max_chunks: int = 8) -> List[dict]:
+        """Rows for every citation in `citation`, in document order; [] if none resolve."""
+        rows, seen = [], set()
+        for doc, label in parse_citations(citation):
+            for matched_doc, matched, ids in self.resolve(doc, label):
+                reference = f"{doc_label(matched_doc)}, Section {matched}"
+                for chunk_id in ids[:max_chunks]:
+                    if chunk_id not in seen:
+                        seen.add(chunk_id)
+                        rows.append(self.row(chunk_id, reference))
+        return rows
+
+    @property
+    def bm25(self):
+        if self._bm25 is None:
+            from .lexical import BM25Index
+
+            self._bm25 = BM25Index([(cid, f"{c.get('heading') or ''}\n{c['content']}") for cid, c in self._chunks.items()])
+        return self._bm25
+
+    def search(self, query: str, k: int = 10) -> List[dict]:
+        """BM25 rows (best first) with a `bm25` score."""
+        return [{**self.row(cid), "bm25": score} for cid, score in self.bm25.search(query, k)]
+
+
+def index_path() -> str:
+    return os.getenv("CITATION_INDEX_PATH", DEFAULT_INDEX_PATH)
+
+
+_loaded: Dict[str, Tuple[float, CitationIndex]] = {}
+_load_lock = threading.Lock()
+
+
+def get_citation_index(path: Optional[str] = None) -> CitationIndex:
+    """Process-wide index, reloaded when the file changes (e.g. after a re-ingest)."""
+    path = path or index_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = -1.0
+    with _load_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, CitationIndex.load(path))
+            _loaded[path] = cached
+        return cached[1]
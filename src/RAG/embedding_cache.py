@@ -0,0 +1,249 @@
+# RAG/embedding_cache.py
+"""
+Persistent, content-addressed embedding cache shared by ingestion and retrieval.
+- Vectors are keyed by (model name, sha256 of the normalized text) and stored as
+  float32 blobs in a local SQLite file.
+- The store is bounded by entry count; least-recently-used rows are evicted first.
+- CachedEmbeddings wraps any LangChain Embeddings: only cache misses go to the
+  provider, deduplicated and sent in batches.
+
+Every code path that embeds text should call get_embeddings() instead of
+building its own OpenAIEmbeddings, so they all share one cache.
+
+Environment variables (all optional):
+  EMBEDDING_CACHE_PATH         default '.cache/embeddings.sqlite3'
+  EMBEDDING_CACHE_MAX_ENTRIES  default 200000
+  EMBEDDING_BATCH_SIZE         default 256 texts per provider call
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL = "text-embedding-ada-002"
+DEFAULT_CACHE_PATH = ".cache/embeddings.sqlite3"
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_BATCH_SIZE = 256
+
+_SQL_VARS = 500  # keep IN (...) lists well below SQLite's variable limit
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for hashing: NFC, collapsed whitespace, stripped."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """SQLite-backed (model, text hash) -> float32 vector store with LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model     TEXT NOT NULL,
+                key       TEXT NOT NULL,
+                dim       INTEGER NOT NULL,
+                vector    BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_lru ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Return {key: vector} for the keys that are cached and refresh their LRU stamp."""
+        wanted = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(wanted), _SQL_VARS):
+                batch = wanted[start:start + _SQL_VARS]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = _unpack(blob)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model, k) for k in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(model, k, len(v), _pack(v), now) for k, v in items.items()],
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (overflow,),
+        )
+        self.evictions += overflow
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeats from EmbeddingCache and batches the misses."""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache: EmbeddingCache,
+        model_name: str = DEFAULT_MODEL,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+
+    def _split(self, texts: List[str]):
+        keys = [text_key(t) for t in texts]
+        cached = self.cache.get_many(self.model_name, keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        return keys, cached, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split(texts)
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = self.underlying.embed_documents([text for _, text in batch])
+            fresh = {key: vec for (key, _), vec in zip(batch, vectors)}
+            self.cache.put_many(self.model_name, fresh)
+            cached.update(fresh)
+        return [cached[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_key(text)
+        cached = self.cache.get_many(self.model_name, [key])
+        if key in cached:
+            return cached[key]
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many(self.model_name, {key: vector})
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split(texts)
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = await self.underlying.aembed_documents([text for _, text in batch])
+            fresh = {key: vec for (key, _), vec in zip(batch, vectors)}
+            self.cache.put_many(self.model_name, fresh)
+            cached.update(fresh)
+        return [cached[k] for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = text_key(text)
+        cached = self.cache.get_many(self.model_name, [key])
+        if key in cached:
+            return cached[key]
+        vector = await self.underlying.aembed_query(text)
+        self.cache.put_many(self.model_name, {key: vector})
+        return vector
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(path: Optional[str] = None) -> EmbeddingCache:
+    return EmbeddingCache(
+        path=path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model: str = DEFAULT_MODEL) -> CachedEmbeddings:
+    """Process-wide cached embeddings client for `model` (OpenAI underneath)."""
+    from langchain_openai import OpenAIEmbeddings
+
+    from .http_pool import LoopLocalAsyncClient, get_http_client
+
+    return CachedEmbeddings(
+        underlying=OpenAIEmbeddings(
+            model=model,
+            http_client=get_http_client(),
+            http_async_client=LoopLocalAsyncClient(),  # built once, used from whichever loop runs aembed_*
+            max_retries=int(os.getenv("HTTP_RETRIES", 3)),
+        ),
+        cache=get_embedding_cache(),
+        model_name=model,
+        batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+    )
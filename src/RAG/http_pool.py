@@ -0,0 +1,134 @@
+# RAG/http_pool.py
+"""
+Long-lived, keep-alive HTTP connection pools shared by the tools and backends.
+- One httpx.Client per process and one httpx.AsyncClient per event loop
+  (async connections are bound to the loop that opened them, so a client must
+  not outlive it: asyncio.run, Streamlit worker loops), with configurable
+  connection limits and timeouts, so repeated tool calls reuse TLS sessions
+  instead of paying a handshake each time. A loop's client is dropped with the
+  loop; aclose_async_http_client() closes it early.
+- LoopLocalAsyncClient is for clients configured once (OpenAIEmbeddings): it
+  sends every request through the running loop's pool.
+- request_with_retry / arequest_with_retry retry transport errors and
+  429/5xx responses with exponential backoff and jitter.
+
+Environment variables (all optional):
+  HTTP_MAX_CONNECTIONS   default 64
+  HTTP_MAX_KEEPALIVE     default 32
+  HTTP_KEEPALIVE_S       default 60   (idle keep-alive expiry)
+  HTTP_TIMEOUT_S         default 30
+  HTTP_CONNECT_TIMEOUT_S default 5
+  HTTP_RETRIES           default 3    (extra attempts after the first)
+  HTTP_BACKOFF_S         default 0.5  (base delay, doubled per attempt)
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Optional
+
+import httpx
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 64)),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", 32)),
+        keepalive_expiry=_env_float("HTTP_KEEPALIVE_S", 60),
+    )
+
+
+def pool_timeout() -> httpx.Timeout:
+    return httpx.Timeout(_env_float("HTTP_TIMEOUT_S", 30), connect=_env_float("HTTP_CONNECT_TIMEOUT_S", 5))
+
+
+def get_http_client() -> httpx.Client:
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(limits=pool_limits(), timeout=pool_timeout())
+        return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Async pool of the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = _async_clients[loop] = httpx.AsyncClient(limits=pool_limits(), timeout=pool_timeout())
+        return client
+
+
+async def aclose_async_http_client() -> None:
+    """Close the running loop's pool (call before the loop shuts down)."""
+    with _lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """AsyncClient handle that can be created once and used from any loop: requests go to that loop's pool."""
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await get_async_http_client().send(request, **kwargs)
+
+
+def _retries() -> int:
+    return int(os.getenv("HTTP_RETRIES", 3))
+
+
+def _delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    if response is not None and response.headers.get("retry-after", "").isdigit():
+        return float(response.headers["retry-after"])
+    base = _env_float("HTTP_BACKOFF_S", 0.5)
+    return base * (2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def request_with_retry(method: str, url: str, client: httpx.Client = None, **kwargs) -> httpx.Response:
+    client = client or get_http_client()
+    retries = _retries()
+    for attempt in range(retries + 1):
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+            time.sleep(_delay(attempt))
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            time.sleep(_delay(attempt, response))
+            continue
+        response.raise_for_status()
+        return response
+
+
+async def arequest_with_retry(method: str, url: str, client: httpx.AsyncClient = None, **kwargs) -> httpx.Response:
+    client = client or get_async_http_client()
+    retries = _retries()
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(_delay(attempt))
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            await asyncio.sleep(_delay(attempt, response))
+            continue
+        response.raise_for_status()
+        return response
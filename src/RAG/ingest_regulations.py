@@ -4,32 +4,67 @@ Admin-only script to pre-populate Supabase with regulatory PDFs.
 - Scans the RAG/Regulations directory (or a custom path).
 - Loads each PDF, splits into chunks, assigns metadata (corpus='regulations'),
   and upserts into the existing Supabase vector table used by the app.
+- Writes to the configured retrieval backend (RAG/backends.py): the Supabase
+  table by default, or the local in-process index.
+- Runs as a pipeline (RAG/pipeline.py): PDFs are parsed in a process pool
+  page by page while earlier chunks are embedded and bulk-upserted.
+- Incremental by default: a manifest (RAG/manifest.py) records file and chunk
+  hashes, so unchanged PDFs are skipped, only new/changed chunks are embedded
+  and upserted (deterministic IDs), and stale chunks of changed or removed
+  PDFs are deleted. A PDF new to the manifest first replaces untracked rows
+  with its name; if another directory tracks the same name, only rows ingested
+  from this path.
+- Chunks with a named profile (RAG/chunking.py; default 'regulations':
+  section/heading boundaries, token-sized, 10% overlap). The profile is
+  recorded per PDF in the manifest, so switching profiles re-chunks them.
+- Parses each regulation's structure (section / subsection numbers and
+  headings, RAG/citations.py), stores it in the chunk metadata and writes the
+  citation index (CITATION_INDEX_PATH) used for exact citation lookup and BM25.
+  Unchanged PDFs missing from the index are re-parsed once (nothing re-embedded).
 
 Usage:
   python -m RAG.ingest_regulations  # uses default directory 'RAG/Regulations'
   python -m RAG.ingest_regulations --dir /path/to/pdfs
+  python -m RAG.ingest_regulations --dry-run   # print what would change
+  python -m RAG.ingest_regulations --full      # re-upsert every chunk
+  python -m RAG.ingest_regulations --workers 8 --embed-concurrency 8 --upsert-batch 1000
+  python -m RAG.ingest_regulations --backend local   # build the local index instead
+  python -m RAG.ingest_regulations --chunk-profile legacy   # former 500/200 character chunks
 
 Requires environment variables:
-  SUPABASE_URL, SUPABASE_SERVICE_KEY, OPENAI_API_KEY
+  SUPABASE_URL, SUPABASE_SERVICE_KEY (Supabase backend), OPENAI_API_KEY
 """
 import argparse
 import os
+import threading
+from functools import partial
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, List
 
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import SupabaseVectorStore
-from supabase import create_client
-from langchain.schema import Document
+from langchain_core.documents import Document
+
+from .chunking import chunk_documents, get_profile
+from .citations import CitationIndex, annotate_structure, index_path
+from .embedding_cache import get_embeddings
+from .manifest import (
+    bump_corpus_generation,
+    file_key,
+    file_sha256,
+    load_manifest,
+    save_manifest,
+    tracked_files,
+)
+from .backends import SupabaseBackend, get_backend
+from .pipeline import FileTask, IngestionEngine
 
 load_dotenv()
 
 DEFAULT_DIR = "RAG/Regulations"
 TABLE_NAME = "documents_oag_compliance"          # same table as app ingestion
 QUERY_NAME = "match_documents_oag_compliance"     # same RPC as app ingestion
+UPSERT_BATCH_SIZE = 500
+DEFAULT_PARSE_WORKERS = min(4, os.cpu_count() or 1)
 
 
 def _collect_pdfs(directory: str) -> List[Path]:
@@ -39,62 +74,183 @@ def _collect_pdfs(directory: str) -> List[Path]:
     return sorted([p for p in base.iterdir() if p.is_file() and p.suffix.lower() == ".pdf"])
 
 
-def _load_and_chunk(pdf_path: Path) -> List[Document]:
-    loader = PyPDFLoader(str(pdf_path))
-    docs = loader.load()
-    # Ensure minimal, consistent chunking with the app
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=200)
-    chunks = splitter.split_documents(docs)
+def default_chunk_profile() -> str:
+    return os.getenv("REGULATIONS_CHUNK_PROFILE", "regulations")
+
+
+def _chunk_pages(pages: Iterable[Document], source_path: str, profile: str = None) -> List[Document]:
+    """Split a batch of pages; runs inside the parse worker processes."""
+    chunks = chunk_documents(pages, profile or default_chunk_profile())
 
     # Attach regulation-specific metadata
-    for idx, d in enumerate(chunks):
+    for d in chunks:
         d.metadata = {
             **(d.metadata or {}),
             "corpus": "regulations",
-            "source_pdf": pdf_path.name,
-            "source_path": str(pdf_path),
-            "chunk_index": idx,
+            "source_pdf": Path(source_path).name,
+            "source_path": str(source_path),
         }
     return chunks
 
 
-def ingest_regulations(directory: str = DEFAULT_DIR) -> None:
+def ingest_regulations(
+    directory: str = DEFAULT_DIR,
+    incremental: bool = True,
+    dry_run: bool = False,
+    manifest_file: str = None,
+    client=None,
+    backend: str = None,
+    parse_workers: int = DEFAULT_PARSE_WORKERS,
+    embed_concurrency: int = 4,
+    embed_batch_size: int = 128,
+    upsert_batch_size: int = UPSERT_BATCH_SIZE,
+    queue_size: int = 8,
+    citation_index_file: str = None,
+    chunk_profile: str = None,
+) -> Dict[str, int]:
+    if client is not None:
+        store = SupabaseBackend(client, TABLE_NAME, QUERY_NAME)
+    elif dry_run and (backend or os.getenv("RETRIEVAL_BACKEND", "supabase")).lower() == "supabase":
+        store = None  # a dry run never talks to Supabase
+    else:
+        store = get_backend(backend)
+    manifest_file = manifest_file or (store.default_manifest_path() if store else None)
+    chunk_profile = get_profile(chunk_profile or default_chunk_profile()).name
+
     pdfs = _collect_pdfs(directory)
-    if not pdfs:
-        print(f"[ingest] No PDF files found in '{directory}'.")
-        return
+    manifest = load_manifest(manifest_file)
+    tracked = tracked_files(manifest, Path(directory))
+    removed = sorted(set(tracked) - {p.name for p in pdfs})
+    summary = {"unchanged": 0, "new": 0, "changed": 0, "removed": len(removed), "upserted": 0, "deleted": 0}
 
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-    if not supabase_url or not supabase_key:
-        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY in environment.")
+    if not pdfs and not removed:
+        print(f"[ingest] No PDF files found in '{directory}'.")
+        return summary
 
-    client = create_client(supabase_url, supabase_key)
-    embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
+    tag = "[ingest][dry-run]" if dry_run else "[ingest]"
+    embeddings = None if dry_run else get_embeddings()
+    citation_index_file = citation_index_file or index_path()
+    citations = CitationIndex.load(citation_index_file)
 
-    total_chunks = 0
+    tasks: List[FileTask] = []
+    reindex = set()
     for pdf in pdfs:
-        print(f"[ingest] Processing: {pdf.name}")
-        chunks = _load_and_chunk(pdf)
-        if not chunks:
-            print(f"[ingest] Skipped (no content): {pdf.name}")
-            continue
+        digest = file_sha256(pdf)
+        entry = tracked.get(pdf.name)
+        # Manifests written before chunk profiles existed used the legacy splitter.
+        previous_profile = entry.get("chunk_profile", "legacy") if entry else chunk_profile
+        if incremental and entry and previous_profile != chunk_profile:
+            print(f"{tag} Re-chunking: {pdf.name} ({previous_profile} -> {chunk_profile} profile)")
+        elif incremental and entry and entry.get("sha256") == digest:
+            summary["unchanged"] += 1
+            if citations.has_document(pdf.name):
+                print(f"{tag} Unchanged: {pdf.name}")
+                continue
+            print(f"{tag} Unchanged: {pdf.name} (building its citation index)")
+            reindex.add(pdf.name)
+        task = FileTask(pdf, digest, entry.get("chunks", {}) if entry else None, incremental)
+        task.reindex = pdf.name in reindex
+        tasks.append(task)
+    base = str(Path(directory).resolve())
+    elsewhere = {e["name"] for e in manifest["files"].values() if e.get("directory") != base}
+    for task in tasks:
+        if task.name in elsewhere:
+            task.source_path = str(task.path)  # the same string _chunk_pages stores
+    gone = [
+        FileTask(Path(directory) / name, tracked[name].get("sha256", ""), tracked[name].get("chunks", {}))
+        for name in removed
+    ]
+
+    gone_set = set(gone)
+    manifest_lock = threading.Lock()
+
+    def commit(task: FileTask) -> None:
+        # Called once all of a file's rows are written and its stale rows deleted.
+        with manifest_lock:
+            key = file_key(Path(directory), task.name)
+            if task in gone_set:
+                manifest["files"].pop(key, None)
+            else:
+                manifest["files"][key] = {
+                    "directory": str(Path(directory).resolve()),
+                    "name": task.name,
+                    "sha256": task.sha256,
+                    "chunk_profile": chunk_profile,
+                    "chunks": task.current,
+                }
+            save_manifest(manifest, manifest_file)
 
-        SupabaseVectorStore.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            client=client,
-            table_name=TABLE_NAME,
-            query_name=QUERY_NAME,
-        )
-        total_chunks += len(chunks)
-        print(f"[ingest] Upserted {len(chunks)} chunks from {pdf.name}")
+    def on_file_parsed(task: FileTask, chunks: List[Document]) -> None:
+        annotate_structure(chunks, task.name)
+        citations.add_document(task.name, chunks)
+
+    engine = IngestionEngine(
+        sink=store,
+        embeddings=embeddings,
+        chunker=partial(_chunk_pages, profile=chunk_profile),
+        parse_workers=min(parse_workers, len(tasks)),
+        embed_concurrency=embed_concurrency,
+        embed_batch_size=embed_batch_size,
+        upsert_batch_size=upsert_batch_size,
+        queue_size=queue_size,
+        on_file_done=commit,
+        on_file_parsed=on_file_parsed,
+        dry_run=dry_run,
+    )
+    engine.run(tasks, gone)
+    for name in removed:
+        citations.remove_document(name)
+    if not dry_run and (tasks or gone):
+        citations.save(citation_index_file)
+        print(f"{tag} Citation index: {len(citations)} chunks -> {citation_index_file}")
+
+    for task in tasks:
+        if task.name in reindex:
+            continue
+        summary["new" if task.is_new else "changed"] += 1
+        summary["upserted"] += len(task.upsert)
+        summary["deleted"] += len(task.stale)
+    summary["deleted"] += sum(len(t.stale) for t in gone)
+    if not dry_run and (summary["upserted"] or summary["deleted"]):
+        summary["generation"] = bump_corpus_generation()  # invalidates cached retrieval results
 
-    print(f"[ingest] Completed. Total chunks upserted: {total_chunks}")
+    print(
+        f"{tag} Completed. new={summary['new']} changed={summary['changed']} "
+        f"unchanged={summary['unchanged']} removed={summary['removed']} "
+        f"upserted={summary['upserted']} deleted={summary['deleted']}"
+    )
+    print(f"{tag} Throughput: {engine.stats.report()}")
+    if embeddings is not None:
+        print(f"[ingest] Embedding cache: {embeddings.cache.stats()}")
+    return summary
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ingest regulatory PDFs into Supabase vector store.")
     parser.add_argument("--dir", dest="directory", default=DEFAULT_DIR, help="Directory containing PDF regulations")
+    parser.add_argument("--dry-run", action="store_true", help="Print what would change without writing anything")
+    parser.add_argument("--full", action="store_true", help="Re-upsert every chunk even if the PDF is unchanged")
+    parser.add_argument("--manifest", default=None, help="Manifest path (default: per backend, see RAG/manifest.py)")
+    parser.add_argument("--backend", default=None, choices=["supabase", "local"], help="Retrieval backend (default: $RETRIEVAL_BACKEND or supabase)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_PARSE_WORKERS, help="PDF parse processes (0 = in-process)")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Concurrent embedding requests")
+    parser.add_argument("--embed-batch", type=int, default=128, help="Chunks per embedding request")
+    parser.add_argument("--upsert-batch", type=int, default=UPSERT_BATCH_SIZE, help="Rows per bulk upsert")
+    parser.add_argument("--queue-size", type=int, default=8, help="Max batches buffered between stages")
+    parser.add_argument("--citation-index", default=None, help="Citation index path (default: $CITATION_INDEX_PATH)")
+    parser.add_argument("--chunk-profile", default=None, help="Chunking profile (default: $REGULATIONS_CHUNK_PROFILE or regulations)")
     args = parser.parse_args()
-    ingest_regulations(args.directory)
+    ingest_regulations(
+        args.directory,
+        incremental=not args.full,
+        dry_run=args.dry_run,
+        manifest_file=args.manifest,
+        backend=args.backend,
+        parse_workers=args.workers,
+        embed_concurrency=args.embed_concurrency,
+        embed_batch_size=args.embed_batch,
+        upsert_batch_size=args.upsert_batch,
+        queue_size=args.queue_size,
+        citation_index_file=args.citation_index,
+        chunk_profile=args.chunk_profile,
+    )
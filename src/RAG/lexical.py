@@ -0,0 +1,88 @@
+# RAG/lexical.py
+"""
+Lexical (BM25) retrieval over the regulations corpus, and rank fusion with the
+vector results.
+- BM25Index: in-memory inverted index (term -> postings) built from the chunk
+  texts kept in the citation index (RAG/citations.py), so no extra storage or
+  network call is needed. Scoring touches only the postings of the query terms.
+- reciprocal_rank_fusion: merges ranked lists (vector rows, BM25 rows) by
+  sum(1 / (k + rank)), so exact terms (section numbers, units, defined terms)
+  that embeddings blur still surface, without tuning score scales.
+- hybrid_rows: what match_regulations returns when the citation index exists:
+  exact citation hits + vector rows + BM25 rows, fused with RRF.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were with "
+    "which must any each if not than other such under within".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, docs: Sequence[Tuple[str, str]], k1: float = 1.5, b: float = 0.75):
+        """docs: [(doc_id, text)]."""
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, text in docs:
+            counts = Counter(tokenize(text))
+            position = len(self.ids)
+            self.ids.append(doc_id)
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((position, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(self.ids)
+        self.idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self.postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / (self.avg_length or 1))
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(self.ids[position], round(score, 4)) for position, score in best]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists; returns [(id, score)] best first (ties keep first-seen order)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def hybrid_rows(query: str, vector_rows: List[dict], index, match_count: int) -> List[dict]:
+    """
+    Fuse exact-citation hits, vector rows and BM25 rows (index: RAG.citations.CitationIndex).
+    Rows keep their vector `similarity` when they had one and gain an `rrf` score.
+    """
+    pool: Dict[str, dict] = {}
+    rankings = []
+    for rows in (index.lookup(query), vector_rows, index.search(query, k=max(len(vector_rows), match_count))):
+        ranking = []
+        for row in rows:
+            key = str(row["id"])
+            pool[key] = {**row, **pool.get(key, {})}  # first list that returned a row wins on conflicts
+            ranking.append(key)
+        rankings.append(ranking)
+    return [{**pool[key], "rrf": round(score, 5)} for key, score in reciprocal_rank_fusion(rankings)[:match_count]]
@@ -0,0 +1,136 @@
+# RAG/manifest.py
+"""
+Ingestion manifest: remembers what is already in the vector table so that
+re-running ingestion is incremental and idempotent.
+
+Layout (JSON):
+  {
+    "version": 1,
+    "files": {
+      "<dir>::<pdf name>": {
+        "directory": "/abs/dir", "name": "x.pdf", "sha256": "...",
+        "chunks": {"<chunk uuid>": "<chunk hash>", ...}
+      }
+    }
+  }
+
+Chunk IDs are deterministic (uuid5 of source name + chunk hash + occurrence),
+so upserting the same chunk twice always hits the same row.
+
+The corpus generation is a counter bumped by every ingestion run that changes
+the regulations corpus; caches of retrieval results key on it
+(CORPUS_GENERATION_PATH, default '.cache/corpus_generation').
+"""
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .embedding_cache import normalize_text
+
+DEFAULT_MANIFEST_PATH = ".cache/regulations_manifest.json"
+DEFAULT_GENERATION_PATH = ".cache/corpus_generation"
+MANIFEST_VERSION = 1
+_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "oag-compliance/documents_oag_compliance")
+
+
+def manifest_path() -> str:
+    return os.getenv("INGEST_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(content: str, page=None) -> str:
+    payload = f"{page}\x1f{normalize_text(content)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source_name: str, digest: str, occurrence: int = 0) -> str:
+    return str(uuid.uuid5(_ID_NAMESPACE, f"{source_name}:{digest}:{occurrence}"))
+
+
+def assign_chunk_ids(source_name: str, chunks) -> Dict[str, str]:
+    """Stamp `chunk_id`/`chunk_hash` into each chunk's metadata; return {id: hash}."""
+    seen: Dict[str, int] = {}
+    ids: Dict[str, str] = {}
+    for chunk in chunks:
+        digest = chunk_hash(chunk.page_content, chunk.metadata.get("page"))
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        cid = chunk_id(source_name, digest, occurrence)
+        chunk.metadata["chunk_id"] = cid
+        chunk.metadata["chunk_hash"] = digest
+        ids[cid] = digest
+    return ids
+
+
+def file_key(directory: Path, name: str) -> str:
+    return f"{Path(directory).resolve()}::{name}"
+
+
+def load_manifest(path: str = None) -> dict:
+    path = path or manifest_path()
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "files": {}}
+    with open(path, "r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    data.setdefault("files", {})
+    return data
+
+
+def save_manifest(manifest: dict, path: str = None) -> None:
+    """Atomic write (tmp file + rename) so a crash never leaves a torn manifest."""
+    path = path or manifest_path()
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def tracked_files(manifest: dict, directory: Path) -> Dict[str, dict]:
+    """Manifest entries that belong to `directory`, keyed by PDF name."""
+    base = str(Path(directory).resolve())
+    return {
+        entry["name"]: entry
+        for entry in manifest["files"].values()
+        if entry.get("directory") == base
+    }
+
+
+def diff_chunks(previous: Dict[str, str], current: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """Return (ids to upsert, stale ids to delete) between two {id: hash} maps."""
+    upsert = [cid for cid in current if cid not in previous]
+    stale = [cid for cid in previous if cid not in current]
+    return upsert, stale
+
+
+def generation_path() -> str:
+    return os.getenv("CORPUS_GENERATION_PATH", DEFAULT_GENERATION_PATH)
+
+
+def corpus_generation(path: str = None) -> int:
+    try:
+        with open(path or generation_path(), "r", encoding="utf-8") as fh:
+            return int(fh.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_corpus_generation(path: str = None) -> int:
+    path = path or generation_path()
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    generation = corpus_generation(path) + 1
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(str(generation))
+    os.replace(tmp, path)
+    return generation
@@ -0,0 +1,199 @@
+# RAG/migrate.py
+"""
+Managed schema migrations for the Supabase/Postgres vector table.
+
+- The SQL lives in RAG/migrations/NNNN_name.sql and is applied in version
+  order. Applied versions are recorded in `schema_migrations` (with a checksum
+  of the file, so an edited migration is reported instead of silently ignored).
+- Each file runs in its own transaction, except files marked
+  `-- migrate: no-transaction` (CREATE INDEX CONCURRENTLY cannot run inside
+  one); those are executed statement by statement.
+- Files marked `-- migrate: requires <option>` are optional and only applied
+  when that option is selected, e.g. `--storage halfvec` for 16-bit vectors.
+- A session advisory lock keeps two runners from applying the same files.
+
+Migrations:
+  0001 baseline table + match_documents_oag_compliance (idempotent)
+  0002 GIN (jsonb_path_ops) index on metadata for `@>` filters
+  0003 HNSW cosine index on embedding (m=16, ef_construction=64)
+  0004 RPC gains optional ef_search / probes arguments
+  0005 optional: halfvec(1536) storage (--storage halfvec)
+  0006 batched RPC match_documents_oag_compliance_many (one round trip, many queries)
+
+Usage (from src/):
+  python -m RAG.migrate                    # apply pending migrations
+  python -m RAG.migrate --status           # list applied / pending
+  python -m RAG.migrate --dry-run          # print what would run
+  python -m RAG.migrate --storage halfvec  # also convert to halfvec storage
+
+Requires psycopg 3 and a direct Postgres connection string (Supabase:
+Project Settings -> Database -> Connection string, session mode).
+
+Environment variables:
+  DATABASE_URL     connection string (or --dsn)
+  VECTOR_STORAGE   'vector' (default) or 'halfvec'
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+STORAGE_OPTIONS = ("vector", "halfvec")
+_FILENAME = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+_DIRECTIVE = re.compile(r"^--\s*migrate:\s*(.+?)\s*$", re.MULTILINE)
+_LOCK_KEY = 7_235_001  # arbitrary, shared by every runner of this schema
+
+CREATE_TABLE_SQL = """
+create table if not exists schema_migrations (
+  version int primary key,
+  name text not null,
+  checksum text not null,
+  applied_at timestamptz not null default now()
+)
+"""
+
+
+class Migration:
+    def __init__(self, path: Path):
+        match = _FILENAME.match(path.name)
+        if not match:
+            raise ValueError(f"Migration file name must look like 0001_name.sql: {path.name}")
+        self.path = path
+        self.version = int(match.group(1))
+        self.name = match.group(2)
+        self.sql = path.read_text(encoding="utf-8")
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()[:16]
+        directives = _DIRECTIVE.findall(self.sql)
+        self.transactional = "no-transaction" not in directives
+        self.requires = [d.split(None, 1)[1] for d in directives if d.startswith("requires ")]
+
+    def __repr__(self) -> str:
+        return f"Migration({self.version:04d}_{self.name})"
+
+    def statements(self) -> List[str]:
+        """Statements of a no-transaction file (plain DDL; no function bodies)."""
+        lines = [line for line in self.sql.splitlines() if not line.lstrip().startswith("--")]
+        return [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+
+
+def discover(directory: Optional[str] = None) -> List[Migration]:
+    migrations = sorted((Migration(p) for p in Path(directory or MIGRATIONS_DIR).glob("*.sql")), key=lambda m: m.version)
+    for a, b in zip(migrations, migrations[1:]):
+        if a.version == b.version:
+            raise ValueError(f"Duplicate migration version {a.version:04d}: {a.path.name}, {b.path.name}")
+    return migrations
+
+
+def selected(migrations: List[Migration], storage: str = "vector") -> List[Migration]:
+    """Migrations that apply to this setup (optional ones only when their option is chosen)."""
+    if storage not in STORAGE_OPTIONS:
+        raise ValueError(f"Unknown vector storage '{storage}' (expected one of {', '.join(STORAGE_OPTIONS)}).")
+    return [m for m in migrations if all(option == storage for option in m.requires)]
+
+
+# ---------------- Database ----------------
+def connect(dsn: Optional[str] = None):
+    """psycopg 3 connection in autocommit mode (transactions are opened per migration)."""
+    import psycopg
+
+    dsn = dsn or os.getenv("DATABASE_URL")
+    if not dsn:
+        raise RuntimeError("Missing DATABASE_URL (or --dsn) for migrations.")
+    return psycopg.connect(dsn, autocommit=True)
+
+
+def applied_versions(conn) -> Dict[int, str]:
+    """{version: checksum} of applied migrations (creates the bookkeeping table if needed)."""
+    with conn.cursor() as cur:
+        cur.execute(CREATE_TABLE_SQL)
+        cur.execute("select version, checksum from schema_migrations")
+        return {int(version): checksum for version, checksum in cur.fetchall()}
+
+
+def _apply(conn, migration: Migration) -> None:
+    record = ("insert into schema_migrations (version, name, checksum) values (%s, %s, %s)",
+              (migration.version, migration.name, migration.checksum))
+    with conn.cursor() as cur:
+        if not migration.transactional:
+            for statement in migration.statements():
+                cur.execute(statement)
+            cur.execute(*record)
+            return
+        cur.execute("begin")
+        try:
+            cur.execute(migration.sql)
+            cur.execute(*record)
+        except Exception:
+            cur.execute("rollback")
+            raise
+        cur.execute("commit")
+
+
+def apply_migrations(
+    conn,
+    migrations: Optional[List[Migration]] = None,
+    storage: str = "vector",
+    dry_run: bool = False,
+    log: Callable[[str], None] = print,
+) -> List[Migration]:
+    """Apply pending migrations in order; returns the ones applied (or that would be, with dry_run)."""
+    migrations = selected(migrations if migrations is not None else discover(), storage)
+    with conn.cursor() as cur:
+        cur.execute("select pg_advisory_lock(%s)", (_LOCK_KEY,))
+    try:
+        applied = applied_versions(conn)
+        for m in migrations:
+            if m.version in applied and applied[m.version] != m.checksum:
+                log(f"[migrate] WARNING {m.path.name} changed after it was applied; write a new migration instead.")
+        pending = [m for m in migrations if m.version not in applied]
+        for m in pending:
+            log(f"[migrate] {'would apply' if dry_run else 'applying'} {m.path.name}")
+            if not dry_run:
+                _apply(conn, m)
+        if not pending:
+            log("[migrate] up to date")
+        return pending
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("select pg_advisory_unlock(%s)", (_LOCK_KEY,))
+
+
+def status(conn, migrations: Optional[List[Migration]] = None, storage: str = "vector") -> List[Dict[str, object]]:
+    applied = applied_versions(conn)
+    chosen = {m.version for m in selected(migrations if migrations is not None else discover(), storage)}
+    return [
+        {
+            "version": m.version,
+            "name": m.name,
+            "state": "applied" if m.version in applied else ("pending" if m.version in chosen else "optional"),
+            "modified": m.version in applied and applied[m.version] != m.checksum,
+        }
+        for m in (migrations if migrations is not None else discover())
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply the vector table migrations (RAG/migrations).")
+    parser.add_argument("--dsn", default=None, help="Postgres connection string (default: $DATABASE_URL)")
+    parser.add_argument("--storage", default=os.getenv("VECTOR_STORAGE", "vector"), choices=STORAGE_OPTIONS,
+                        help="Embedding column type (halfvec halves table and index size)")
+    parser.add_argument("--status", action="store_true", help="List migrations and exit")
+    parser.add_argument("--dry-run", action="store_true", help="Print pending migrations without applying them")
+    args = parser.parse_args(argv)
+
+    with connect(args.dsn) as conn:
+        if args.status:
+            for row in status(conn, storage=args.storage):
+                flag = " (modified since applied)" if row["modified"] else ""
+                print(f"[migrate] {row['version']:04d}_{row['name']}: {row['state']}{flag}")
+            return 0
+        apply_migrations(conn, storage=args.storage, dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
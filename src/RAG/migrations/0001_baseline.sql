@@ -0,0 +1,39 @@
+-- 0001_baseline.sql
+-- Table and RPC as documented in supabase_tables_readme.md. Idempotent, so it
+-- is safe on projects that were set up by hand before migrations existed.
+create extension if not exists vector;
+
+create table if not exists documents_oag_compliance (
+  id uuid primary key default gen_random_uuid(),
+  content text,
+  metadata jsonb,
+  -- 1536 dimensions because we use 'text-embedding-ada-002'
+  embedding vector (1536)
+);
+
+create or replace function match_documents_oag_compliance(
+  query_embedding vector(1536),
+  match_count int default 5,
+  filter jsonb default '{}'::jsonb
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  return query
+  select
+    documents_oag_compliance.id,
+    documents_oag_compliance.content,
+    documents_oag_compliance.metadata,
+    1 - (documents_oag_compliance.embedding <=> query_embedding) as similarity
+  from documents_oag_compliance
+  where (filter = '{}'::jsonb or documents_oag_compliance.metadata @> filter)
+  order by documents_oag_compliance.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
@@ -0,0 +1,7 @@
+-- 0002_metadata_gin_index.sql
+-- migrate: no-transaction
+-- GIN index for `metadata @> filter` (the RPC filter and delete_source).
+-- jsonb_path_ops only supports containment, and is smaller and faster for it
+-- than the default jsonb_ops. Built concurrently so ingestion keeps writing.
+create index concurrently if not exists documents_oag_compliance_metadata_gin
+  on documents_oag_compliance using gin (metadata jsonb_path_ops);
@@ -0,0 +1,11 @@
+-- 0003_embedding_hnsw_index.sql
+-- migrate: no-transaction
+-- Approximate nearest-neighbour index for `embedding <=> query` (cosine).
+-- HNSW rather than IVFFlat: it needs no training data (the table can be empty
+-- when this runs), and recall holds as rows are added. Query-time recall vs
+-- latency is tuned with hnsw.ef_search (RPC argument, see 0004).
+-- An interrupted concurrent build leaves an INVALID index behind; drop it
+-- by hand and re-run the migration.
+create index concurrently if not exists documents_oag_compliance_embedding_hnsw
+  on documents_oag_compliance using hnsw (embedding vector_cosine_ops)
+  with (m = 16, ef_construction = 64);
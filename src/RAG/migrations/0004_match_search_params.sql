@@ -0,0 +1,54 @@
+-- 0004_match_search_params.sql
+-- RPC with optional ANN search parameters:
+--   ef_search  hnsw.ef_search for this call (candidate list size; higher = better recall, slower)
+--   probes     ivfflat.probes for this call (only used if an IVFFlat index is built instead)
+-- Both default to null (server settings). They are set with set_config(..., true),
+-- so they only last for the RPC's transaction.
+-- With a filter, pgvector >= 0.8 iterative scans keep fetching index candidates
+-- until match_count rows pass it, instead of returning fewer rows.
+drop function if exists match_documents_oag_compliance(vector(1536), int, jsonb);
+
+create or replace function match_documents_oag_compliance(
+  query_embedding vector(1536),
+  match_count int default 5,
+  filter jsonb default '{}'::jsonb,
+  ef_search int default null,
+  probes int default null
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql
+as $$
+begin
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+  end if;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
+  if filter <> '{}'::jsonb and current_setting('hnsw.iterative_scan', true) is not null then
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    perform set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+  end if;
+  return query
+  with candidates as materialized (
+    select
+      documents_oag_compliance.id,
+      documents_oag_compliance.content,
+      documents_oag_compliance.metadata,
+      documents_oag_compliance.embedding <=> query_embedding as distance
+    from documents_oag_compliance
+    where (filter = '{}'::jsonb or documents_oag_compliance.metadata @> filter)
+    order by documents_oag_compliance.embedding <=> query_embedding
+    limit match_count
+  )
+  -- relaxed_order may return candidates slightly out of order; re-sort them
+  select candidates.id, candidates.content, candidates.metadata, 1 - candidates.distance as similarity
+  from candidates
+  order by candidates.distance;
+end;
+$$;
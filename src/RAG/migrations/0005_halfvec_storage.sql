@@ -0,0 +1,61 @@
+-- 0005_halfvec_storage.sql
+-- migrate: requires halfvec
+-- Optional compact storage (python -m RAG.migrate --storage halfvec, pgvector >= 0.7):
+-- embeddings are stored as 16-bit floats, halving the heap and HNSW index
+-- (6 KB -> 3 KB per row). Clients are unchanged: the RPC still takes a
+-- vector(1536) and casts it, and PostgREST casts upserted arrays to halfvec.
+-- Rewrites the table and rebuilds the index, so run it in a quiet window.
+drop index if exists documents_oag_compliance_embedding_hnsw;
+
+alter table documents_oag_compliance
+  alter column embedding type halfvec(1536) using embedding::halfvec(1536);
+
+create index documents_oag_compliance_embedding_hnsw
+  on documents_oag_compliance using hnsw (embedding halfvec_cosine_ops)
+  with (m = 16, ef_construction = 64);
+
+create or replace function match_documents_oag_compliance(
+  query_embedding vector(1536),
+  match_count int default 5,
+  filter jsonb default '{}'::jsonb,
+  ef_search int default null,
+  probes int default null
+)
+returns table (
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql
+as $$
+declare
+  query_half halfvec(1536) := query_embedding::halfvec(1536);
+begin
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+  end if;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
+  if filter <> '{}'::jsonb and current_setting('hnsw.iterative_scan', true) is not null then
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    perform set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+  end if;
+  return query
+  with candidates as materialized (
+    select
+      documents_oag_compliance.id,
+      documents_oag_compliance.content,
+      documents_oag_compliance.metadata,
+      documents_oag_compliance.embedding <=> query_half as distance
+    from documents_oag_compliance
+    where (filter = '{}'::jsonb or documents_oag_compliance.metadata @> filter)
+    order by documents_oag_compliance.embedding <=> query_half
+    limit match_count
+  )
+  select candidates.id, candidates.content, candidates.metadata, 1 - candidates.distance as similarity
+  from candidates
+  order by candidates.distance;
+end;
+$$;
@@ -0,0 +1,29 @@
+-- 0006_match_many.sql
+-- Batched RPC: several query embeddings in one round trip (graph.match_regulations_many).
+-- query_embeddings is a JSON array of embeddings (PostgREST passes it through as
+-- jsonb); each one runs through match_documents_oag_compliance, so the
+-- ANN parameters, filters and vector / halfvec storage behave exactly as for a
+-- single query. Rows come back tagged with the 0-based query_index.
+create or replace function match_documents_oag_compliance_many(
+  query_embeddings jsonb,
+  match_count int default 5,
+  filter jsonb default '{}'::jsonb,
+  ef_search int default null,
+  probes int default null
+)
+returns table (
+  query_index int,
+  id uuid,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language sql
+as $$
+  select (q.position - 1)::int, m.id, m.content, m.metadata, m.similarity
+  from jsonb_array_elements(query_embeddings) with ordinality as q(embedding, position)
+  cross join lateral match_documents_oag_compliance(
+    (q.embedding::text)::vector(1536), match_count, filter, ef_search, probes
+  ) as m
+  order by q.position, m.similarity desc;
+$$;
@@ -0,0 +1,315 @@
+# RAG/pipeline.py
+"""
+Pipelined bulk-ingestion engine used by RAG.ingest_regulations.
+
+Stages (each connected by a bounded queue, so a slow stage applies backpressure
+to the ones before it instead of buffering the whole corpus in memory):
+
+  parse   process pool; each worker streams one PDF page by page and chunks it
+          (a page's last chunk is re-split with the next page). A file's
+          chunks are scheduled together: chunk ids, the manifest diff and the
+          section labels (citations.annotate_structure) need the whole file,
+          so the pool overlaps files rather than pages
+  embed   N threads, each sending batches of chunks to the (cached) embeddings
+  upsert  1 thread, writing rows to the retrieval backend (RAG/backends.py) in
+          bulk batches; a file's stale chunks are deleted and its manifest
+          entry is committed only after all of its rows are written (for
+          non-durable backends, after the final flush)
+
+Throughput (pages/s, chunks/s, rows/s) is printed at the end of a run.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from .manifest import assign_chunk_ids, diff_chunks
+
+_STOP = object()
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.rows = 0
+        self.deleted = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self) -> Dict[str, float]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "seconds": round(elapsed, 3),
+            "files": self.files,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "deleted": self.deleted,
+            "pages_per_s": round(self.pages / elapsed, 2),
+            "chunks_per_s": round(self.chunks / elapsed, 2),
+            "rows_per_s": round(self.rows / elapsed, 2),
+        }
+
+
+class FileTask:
+    """One PDF scheduled for (re)ingestion and its bookkeeping across stages."""
+
+    def __init__(self, path, sha256: str, previous: Optional[Dict[str, str]], incremental: bool = True):
+        self.path = path
+        self.name = path.name
+        self.sha256 = sha256
+        self.previous = previous or {}
+        self.is_new = previous is None
+        # Set when another directory's manifest entry tracks the same file name:
+        # replacing untracked rows is then limited to rows ingested from this path.
+        self.source_path: Optional[str] = None
+        self.reindex = False  # unchanged file parsed again only to rebuild its citation index
+        self.incremental = incremental
+        self.current: Dict[str, str] = {}
+        self.upsert: List[Document] = []
+        self.stale: List[str] = []
+        self.pending = 0
+
+
+def parse_pdf(path: str, chunker: Callable[[Iterable[Document], str], List[Document]]) -> Tuple[int, List[Document]]:
+    """
+    Worker entry point: stream pages with lazy_load and chunk them as they
+    arrive; a clause running over a page break stays in one chunk (see
+    chunking.chunk_page_stream).
+    """
+    from langchain_community.document_loaders import PyPDFLoader
+
+    from .chunking import chunk_page_stream
+
+    counter = {"pages": 0}
+
+    def pages():
+        for page in PyPDFLoader(path).lazy_load():
+            counter["pages"] += 1
+            yield page
+
+    chunks: List[Document] = []
+    for chunk in chunk_page_stream(pages(), lambda batch: chunker(batch, path)):
+        chunk.metadata["chunk_index"] = len(chunks)
+        chunks.append(chunk)
+    return counter["pages"], chunks
+
+
+class IngestionEngine:
+    def __init__(
+        self,
+        sink,
+        embeddings,
+        chunker: Callable[[Iterable[Document], str], List[Document]],
+        parse_workers: int = 4,
+        embed_concurrency: int = 4,
+        embed_batch_size: int = 128,
+        upsert_batch_size: int = 500,
+        queue_size: int = 8,
+        on_file_done: Callable[[FileTask], None] = None,
+        on_file_parsed: Callable[[FileTask, List[Document]], None] = None,
+        dry_run: bool = False,
+        log: Callable[[str], None] = print,
+    ):
+        self.tag = "[ingest][dry-run]" if dry_run else "[ingest]"
+        self.sink = sink
+        self.embeddings = embeddings
+        self.chunker = chunker
+        self.parse_workers = parse_workers
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.upsert_batch_size = max(1, upsert_batch_size)
+        self.queue_size = max(1, queue_size)
+        self.on_file_done = on_file_done
+        self.on_file_parsed = on_file_parsed  # sees all of a file's chunks (with ids) before embedding
+        self.dry_run = dry_run
+        self.log = log
+        self.stats = IngestStats()
+        self._errors: List[BaseException] = []
+        self._done_lock = threading.Lock()
+        self._deferred: List[FileTask] = []
+
+    # ---------------- Public API ----------------
+    def run(self, tasks: List[FileTask], removed: List[FileTask] = ()) -> IngestStats:
+        embed_q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        upsert_q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        threads: List[threading.Thread] = []
+        if not self.dry_run:
+            threads = [
+                threading.Thread(target=self._embed_worker, args=(embed_q, upsert_q), daemon=True)
+                for _ in range(self.embed_concurrency)
+            ]
+            threads.append(threading.Thread(target=self._upsert_worker, args=(upsert_q,), daemon=True))
+            for t in threads:
+                t.start()
+
+        try:
+            for task, pages, chunks in self._parse_all(tasks):
+                self._schedule(task, pages, chunks, embed_q)
+            for task in removed:
+                task.stale = list(task.previous)
+                self.log(f"{self.tag} Removed: {task.name}, -{len(task.stale)} stale")
+                self._finish_if_done(task)
+        finally:
+            if threads:
+                for _ in range(self.embed_concurrency):
+                    embed_q.put(_STOP)
+                for t in threads[:-1]:
+                    t.join()
+                upsert_q.put(_STOP)
+                threads[-1].join()
+
+        if self._errors:
+            raise self._errors[0]
+        if not self.dry_run:
+            self.sink.flush()
+            for task in self._deferred:
+                self.on_file_done(task)
+        return self.stats
+
+    # ---------------- Stage 1: parse ----------------
+    def _parse_all(self, tasks: List[FileTask]):
+        if self.parse_workers <= 0:
+            for task in tasks:
+                pages, chunks = parse_pdf(str(task.path), self.chunker)
+                yield task, pages, chunks
+            return
+
+        window = self.parse_workers * 2  # bounded number of files in flight
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            inflight: Dict[Future, FileTask] = {}
+            pending = iter(tasks)
+            for task in pending:
+                inflight[pool.submit(parse_pdf, str(task.path), self.chunker)] = task
+                if len(inflight) >= window:
+                    break
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    task = inflight.pop(fut)
+                    pages, chunks = fut.result()
+                    yield task, pages, chunks
+                    nxt = next(pending, None)
+                    if nxt is not None:
+                        inflight[pool.submit(parse_pdf, str(nxt.path), self.chunker)] = nxt
+
+    def _schedule(self, task: FileTask, pages: int, chunks: List[Document], embed_q: "queue.Queue") -> None:
+        task.current = assign_chunk_ids(task.name, chunks)
+        if self.on_file_parsed:
+            self.on_file_parsed(task, chunks)
+        to_upsert, task.stale = diff_chunks(task.previous, task.current)
+        wanted = set(task.current) if not task.incremental else set(to_upsert)
+        task.upsert = [c for c in chunks if c.metadata["chunk_id"] in wanted]
+        task.pending = len(task.upsert)
+        self.stats.add(files=1, pages=pages, chunks=len(chunks))
+
+        state = "new (replaces any untracked rows)" if task.is_new else "reindex" if task.reindex else "changed"
+        self.log(f"{self.tag} {task.name}: {state}, {pages} pages, +{len(task.upsert)} upsert, -{len(task.stale)} stale")
+        if self.dry_run:
+            return
+        if task.is_new:
+            self.sink.delete_source(task.name, source_path=task.source_path)
+        if not task.upsert:
+            self._finish_if_done(task)
+            return
+        batch = self.embed_batch_size
+        for start in range(0, len(task.upsert), batch):
+            self._put(embed_q, (task, task.upsert[start:start + batch]))
+
+    def _put(self, q: "queue.Queue", item) -> None:
+        # Block (backpressure) but keep checking whether a downstream stage died.
+        while True:
+            if self._errors:
+                raise self._errors[0]
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    # ---------------- Stage 2: embed ----------------
+    def _embed_worker(self, embed_q: "queue.Queue", upsert_q: "queue.Queue") -> None:
+        while True:
+            item = embed_q.get()
+            if item is _STOP:
+                return
+            if self._errors:
+                continue  # drain so producers never block forever
+            task, chunks = item
+            try:
+                vectors = self.embeddings.embed_documents([c.page_content for c in chunks])
+                self.stats.add(embedded=len(chunks))
+                rows = [
+                    {"id": c.metadata["chunk_id"], "content": c.page_content, "metadata": c.metadata, "embedding": v}
+                    for c, v in zip(chunks, vectors)
+                ]
+                self._put(upsert_q, (task, rows))
+            except BaseException as exc:  # surfaced by run()
+                self._errors.append(exc)
+
+    # ---------------- Stage 3: upsert ----------------
+    def _upsert_worker(self, upsert_q: "queue.Queue") -> None:
+        buffer: List[dict] = []
+        owners: List[FileTask] = []
+
+        def flush():
+            if not buffer:
+                return
+            self.sink.upsert(list(buffer))
+            self.stats.add(rows=len(buffer))
+            done = owners[:]
+            buffer.clear()
+            owners.clear()
+            for task in done:
+                task.pending -= 1
+                self._finish_if_done(task)
+
+        while True:
+            try:
+                item = upsert_q.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            try:
+                if item is _STOP:
+                    if not self._errors:
+                        flush()
+                    return
+                if self._errors:
+                    continue
+                if item is None:
+                    flush()  # idle: don't hold a partial batch (and a file's commit) hostage
+                    continue
+                task, rows = item
+                for row in rows:
+                    buffer.append(row)
+                    owners.append(task)
+                    if len(buffer) >= self.upsert_batch_size:
+                        flush()
+            except BaseException as exc:
+                self._errors.append(exc)
+
+    def _finish_if_done(self, task: FileTask) -> None:
+        with self._done_lock:
+            if task.pending > 0 or self.dry_run:
+                return
+            if task.stale:
+                for start in range(0, len(task.stale), self.upsert_batch_size):
+                    self.sink.delete(task.stale[start:start + self.upsert_batch_size])
+                self.stats.add(deleted=len(task.stale))
+            if not self.on_file_done:
+                return
+            if getattr(self.sink, "durable", True):
+                self.on_file_done(task)
+            else:
+                self._deferred.append(task)
@@ -3,36 +3,37 @@ import os
 from dotenv import load_dotenv
 
 from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 
-from langchain_community.vectorstores import SupabaseVectorStore
-from supabase import create_client
+from .backends import get_backend
+from .chunking import chunk_documents
+from .embedding_cache import get_embeddings
+from .manifest import assign_chunk_ids
 
 load_dotenv()
 
-def run_rag_pipeline(pdf_path: str):
-    # 1. Cargar documento
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-
-    # 2. Dividir en chunks
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=200)
-    chunks = splitter.split_documents(documents)
-
-    # 3. Embeddings
-    embedding_model = OpenAIEmbeddings(model='text-embedding-ada-002')
-
-    # 4. Supabase Vector Store
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-    client = create_client(supabase_url, supabase_key)
-
-    # Tabla y query dedicadas para O&G compliance
-    vectorstore = SupabaseVectorStore.from_documents(
-        documents=chunks,
-        embedding=embedding_model,
-        client=client,
-        table_name="documents_oag_compliance",
-        query_name="match_documents_oag_compliance",
-    )
+def run_rag_pipeline(pdf_path: str, documents=None, chunks=None):
+    """Ingest one uploaded PDF; returns its chunks. documents / chunks skip parsing / splitting when already known."""
+    # 1. Cargar documento (salvo que ya venga parseado, ver triage.py y RAG/artifacts.py)
+    if documents is None and chunks is None:
+        loader = PyPDFLoader(pdf_path)
+        documents = loader.load()
+
+    # 2. Dividir en chunks (perfil de informes de inspección, ver RAG/chunking.py)
+    if chunks is None:
+        chunks = chunk_documents(documents, os.getenv("REPORT_CHUNK_PROFILE", "inspection"))
+
+    # 3. Embeddings (shared on-disk cache; only new chunks hit OpenAI)
+    embedding_model = get_embeddings()
+
+    # 4. Backend de recuperación (tabla Supabase por defecto, ver RAG/backends.py)
+    backend = get_backend()
+
+    # IDs deterministas: volver a subir el mismo PDF sobrescribe sus filas
+    assign_chunk_ids(os.path.basename(pdf_path), chunks)
+    vectors = embedding_model.embed_documents([c.page_content for c in chunks])
+    backend.upsert([
+        {"id": c.metadata["chunk_id"], "content": c.page_content, "metadata": c.metadata, "embedding": v}
+        for c, v in zip(chunks, vectors)
+    ])
+    backend.flush()
+    return chunks
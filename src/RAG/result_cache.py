@@ -0,0 +1,190 @@
+# RAG/result_cache.py
+"""
+Tool-result cache in front of match_regulations and web_search.
+
+Two lookup modes:
+- exact: same tool, same normalized query text, same parameters;
+- semantic: same tool and parameters, and a cached query whose embedding has
+  cosine similarity >= threshold with the new query (near-duplicate phrasing
+  such as "AER Directive 060 venting limits" vs "Directive 060 venting limits").
+
+Entries expire after a TTL and the cache is LRU-bounded. Entries created with a
+corpus generation (RAG/manifest.py) are dropped as soon as an ingestion run
+bumps the generation, so regulation results never outlive a corpus change.
+
+Environment variables (all optional):
+  TOOL_CACHE_MAX_ENTRIES    default 512
+  TOOL_CACHE_TTL_S          default 3600
+  TOOL_CACHE_SIM_THRESHOLD  default 0.95
+  TOOL_CACHE_DISABLED       set to 1 to bypass the cache
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embedding_cache import normalize_text
+
+
+class ToolResultCache:
+    def __init__(self, max_entries: int = 512, ttl_s: float = 3600, threshold: float = 0.95):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def _key(tool: str, query: str, params: Optional[dict]) -> tuple:
+        return tool, json.dumps(params or {}, sort_keys=True), normalize_text(query).lower()
+
+    def _alive(self, key: tuple, entry: dict, generation: Optional[int], now: float) -> bool:
+        if now - entry["created"] > self.ttl_s:
+            self.expired += 1
+        elif entry["generation"] is not None and entry["generation"] != generation:
+            self.invalidated += 1
+        else:
+            return True
+        del self._entries[key]
+        return False
+
+    def lookup(
+        self,
+        tool: str,
+        query: str,
+        params: Optional[dict] = None,
+        generation: Optional[int] = None,
+        embed: Optional[Callable[[str], Sequence[float]]] = None,
+    ) -> Tuple[Optional[object], Optional[Sequence[float]]]:
+        """Exact lookup, then (if `embed` is given) semantic lookup.
+
+        Returns (value or None, query vector or None); the vector is handed back
+        so callers that need it anyway (retrieval) never embed twice.
+        """
+        value = self.get(tool, query, params, generation)
+        if value is not None:
+            return value, None
+        vector = embed(query) if embed else None
+        if vector is not None:
+            value = self.get_similar(tool, vector, params, generation)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+        return value, vector
+
+    async def alookup(
+        self,
+        tool: str,
+        query: str,
+        params: Optional[dict] = None,
+        generation: Optional[int] = None,
+        aembed: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None,
+    ) -> Tuple[Optional[object], Optional[Sequence[float]]]:
+        """Async twin of lookup() for coroutine tools (embedding awaited, not blocking the loop)."""
+        value = self.get(tool, query, params, generation)
+        if value is not None:
+            return value, None
+        vector = await aembed(query) if aembed else None
+        if vector is not None:
+            value = self.get_similar(tool, vector, params, generation)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+        return value, vector
+
+    def get(self, tool: str, query: str, params: Optional[dict] = None, generation: Optional[int] = None):
+        """Exact-key lookup; returns the cached value or None."""
+        key = self._key(tool, query, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._alive(key, entry, generation, time.time()):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["value"]
+        return None
+
+    def get_similar(self, tool: str, vector: Sequence[float], params: Optional[dict] = None, generation: Optional[int] = None):
+        """Semantic lookup over cached query embeddings; returns the best value above threshold or None."""
+        group = self._key(tool, "", params)[:2]
+        query = _unit(vector)
+        with self._lock:
+            now = time.time()
+            keys, vectors = [], []
+            for key, entry in list(self._entries.items()):
+                if key[:2] != group or entry["vector"] is None:
+                    continue
+                if self._alive(key, entry, generation, now):
+                    keys.append(key)
+                    vectors.append(entry["vector"])
+            if vectors:
+                scores = np.vstack(vectors) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return self._entries[keys[best]]["value"]
+        return None
+
+    def put(
+        self,
+        tool: str,
+        query: str,
+        value,
+        params: Optional[dict] = None,
+        vector: Optional[Sequence[float]] = None,
+        generation: Optional[int] = None,
+    ) -> None:
+        key = self._key(tool, query, params)
+        with self._lock:
+            self._entries[key] = {
+                "value": value,
+                "vector": _unit(vector) if vector is not None else None,
+                "created": time.time(),
+                "generation": generation,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    return v / max(float(np.linalg.norm(v)), 1e-12)
+
+
+@lru_cache(maxsize=None)
+def get_result_cache() -> Optional[ToolResultCache]:
+    """Process-wide tool-result cache, or None when TOOL_CACHE_DISABLED is set."""
+    if os.getenv("TOOL_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    return ToolResultCache(
+        max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", 512)),
+        ttl_s=float(os.getenv("TOOL_CACHE_TTL_S", 3600)),
+        threshold=float(os.getenv("TOOL_CACHE_SIM_THRESHOLD", 0.95)),
+    )
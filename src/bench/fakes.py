@@ -0,0 +1,261 @@
+# bench/fakes.py
+"""
+Deterministic local stand-ins for the external services, with injected latency.
+- FakeChatModel: replaces Gemini. Supports bind_tools and plays every role in
+  graph.py from the bound tools and system prompt: supervisor (hands off to
+  retriever → gap analyzer → report generator, then stops), retriever (one
+  match_regulations_many call with the topic queries, or one match_regulations
+  call when only that is bound, then summarizes), filter (Yes/No from the
+  pre-classifier's keyword score), gap analyzer and report generator.
+  Counts calls per role and prompt tokens; reports approximate token usage.
+- FakeEmbeddings: replaces OpenAIEmbeddings with hashed bag-of-words vectors,
+  so similar texts get similar vectors and retrieval results are meaningful.
+- LatencyBackend: wraps a RetrievalBackend (normally an in-memory LocalBackend)
+  and adds a fixed delay per call, standing in for the Supabase RPC/table API.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+from RAG.backends import RetrievalBackend
+
+RETRIEVER_QUERIES = ["LDAR survey frequency", "pneumatic devices", "venting and flaring limits", "produced water spills"]
+HANDOFF_ORDER = ["compliance_retriever_agent", "gap_analyzer_agent", "report_generator_agent"]
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class CallStats:
+    """Thread-safe call counter shared by a FakeChatModel and its bound copies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_role: Dict[str, int] = {}
+        self.prompt_tokens = 0
+
+    def add(self, role: str) -> None:
+        with self._lock:
+            self.by_role[role] = self.by_role.get(role, 0) + 1
+
+    def add_prompt_tokens(self, tokens: int) -> None:
+        with self._lock:
+            self.prompt_tokens += tokens
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.by_role.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self.by_role.clear()
+            self.prompt_tokens = 0
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+
+
+class FakeChatModel(BaseChatModel):
+    latency_s: float = 0.0        # per call (time to first token)
+    token_latency_s: float = 0.0  # per streamed word
+    tool_names: List[str] = Field(default_factory=list)
+    stats: Any = Field(default_factory=CallStats)
+
+    @property
+    def _llm_type(self) -> str:
+        return "bench-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(t, "name", None) or (t.get("name") if isinstance(t, dict) else None) for t in tools]
+        return self.model_copy(update={"tool_names": [n for n in names if n]})
+
+    # ---- roles ----
+    def _role(self, system: str) -> str:
+        if any(n.startswith("transfer_to_") for n in self.tool_names):
+            return "supervisor"
+        if "match_regulations" in self.tool_names or "match_regulations_many" in self.tool_names:
+            return "retriever"
+        if "web_search" in self.tool_names:
+            return "web_search"
+        if "Respond ONLY 'Yes' or 'No'" in system:
+            return "filter"
+        if "potential gaps" in system:
+            return "gap_analyzer"
+        return "report"
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        system = _text(messages[0]) if messages and isinstance(messages[0], SystemMessage) else ""
+        role = self._role(system)
+        self.stats.add(role)
+        conversation = "\n".join(_text(m) for m in messages[1:])
+        if role == "supervisor":
+            visited = {
+                call["name"].replace("transfer_to_", "")
+                for m in messages if isinstance(m, AIMessage) for call in m.tool_calls
+            }
+            pending = [a for a in HANDOFF_ORDER if a not in visited and f"transfer_to_{a}" in self.tool_names]
+            if pending:
+                name = f"transfer_to_{pending[0]}"
+                return AIMessage(content="", tool_calls=[{"name": name, "args": {}, "id": f"call_{len(messages)}"}])
+            reports = [m for m in messages if isinstance(m, AIMessage) and m.name == "report_generator_agent"]
+            return AIMessage(content=_text(reports[-1]) if reports else "Analysis complete.")
+        if role == "retriever":
+            if isinstance(messages[-1], ToolMessage) and messages[-1].name in ("match_regulations", "match_regulations_many"):
+                return AIMessage(content=f"Relevant clauses: {_text(messages[-1])[:400]}")
+            if "match_regulations_many" in self.tool_names:
+                call = {"name": "match_regulations_many", "args": {"queries": RETRIEVER_QUERIES}}
+            else:
+                call = {"name": "match_regulations", "args": {"query": ", ".join(RETRIEVER_QUERIES)}}
+            return AIMessage(content="", tool_calls=[{**call, "id": f"call_{len(messages)}"}])
+        if role == "web_search":
+            return AIMessage(content="No additional public context needed.")
+        from prefilter import keyword_score
+
+        if role == "filter":
+            return AIMessage(content="Yes" if keyword_score(conversation)[0] >= 1.0 else "No")
+        topics = keyword_score(conversation)[1]
+        gaps = [f"- {topic.replace('_', ' ').title()}: review against retrieved clauses (Medium)" for topic in topics]
+        if role == "gap_analyzer":
+            return AIMessage(content="\n".join(gaps) or "Context is insufficient to identify gaps.")
+        return AIMessage(
+            content="**Executive Summary**\nAutomated benchmark report.\n\n**Gaps**\n"
+            + ("\n".join(gaps) or "- None identified")
+            + "\n\n**Recommended Actions**\n1. Review flagged items\n2. Schedule follow-up inspection"
+        )
+
+    def _with_usage(self, messages: List[BaseMessage], reply: AIMessage) -> AIMessage:
+        prompt = sum(len(_text(m)) for m in messages) // 4
+        completion = max(1, len(_text(reply)) // 4)
+        self.stats.add_prompt_tokens(prompt)
+        reply.usage_metadata = {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+        return reply
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._with_usage(messages, self._reply(messages))
+        time.sleep(self.latency_s + self.token_latency_s * len(_text(reply).split()))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._with_usage(messages, self._reply(messages))
+        time.sleep(self.latency_s)
+        words = _text(reply).split(" ") if reply.content else [""]
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            time.sleep(self.token_latency_s)
+            chunk = AIMessageChunk(
+                content=word + ("" if last else " "),
+                tool_call_chunks=[
+                    {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": j}
+                    for j, c in enumerate(reply.tool_calls)
+                ] if last else [],
+                usage_metadata=reply.usage_metadata if last else None,
+            )
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors (L2-normalized) with injected latency."""
+
+    def __init__(self, dim: int = 384, latency_s: float = 0.0, per_text_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+        self.per_text_s = per_text_s
+        self.calls = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), "little")
+            vec[h % self.dim] += 1.0 if h & 1 << 31 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if not norm:
+            vec[0], norm = 1.0, 1.0
+        return (vec / norm).tolist()
+
+    def _count(self, n: int) -> float:
+        with self._lock:
+            self.calls += 1
+            self.texts += n
+        return self.latency_s + self.per_text_s * n
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._count(len(texts)))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self._count(1))
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._count(len(texts)))
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self._count(1))
+        return self._vector(text)
+
+
+class LatencyBackend(RetrievalBackend):
+    """Adds `latency_s` to every call of the wrapped backend (remote RPC stand-in)."""
+
+    def __init__(self, inner: RetrievalBackend, latency_s: float = 0.0):
+        self.inner = inner
+        self.latency_s = latency_s
+        self.name = f"{inner.name}+latency"
+        self.durable = inner.durable
+
+    def match(self, embedding: Sequence[float], match_count: int = 5, filter: Optional[dict] = None,
+              ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[dict]:
+        time.sleep(self.latency_s)
+        return self.inner.match(embedding, match_count, filter, ef_search, probes)
+
+    async def amatch(self, embedding: Sequence[float], match_count: int = 5, filter: Optional[dict] = None,
+                     ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[dict]:
+        await asyncio.sleep(self.latency_s)
+        return self.inner.match(embedding, match_count, filter, ef_search, probes)
+
+    def match_many(self, embeddings: Sequence[Sequence[float]], match_count: int = 5, filter: Optional[dict] = None,
+                   ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[List[dict]]:
+        time.sleep(self.latency_s)  # one round trip for the whole batch
+        return self.inner.match_many(embeddings, match_count, filter, ef_search, probes)
+
+    async def amatch_many(self, embeddings: Sequence[Sequence[float]], match_count: int = 5, filter: Optional[dict] = None,
+                          ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[List[dict]]:
+        await asyncio.sleep(self.latency_s)
+        return self.inner.match_many(embeddings, match_count, filter, ef_search, probes)
+
+    def upsert(self, rows: List[dict]) -> None:
+        time.sleep(self.latency_s)
+        self.inner.upsert(rows)
+
+    def delete(self, ids: List[str]) -> None:
+        time.sleep(self.latency_s)
+        self.inner.delete(ids)
+
+    def delete_source(self, source_pdf: str, corpus: str = "regulations", source_path: Optional[str] = None) -> None:
+        time.sleep(self.latency_s)
+        self.inner.delete_source(source_pdf, corpus, source_path)
+
+    def flush(self) -> None:
+        self.inner.flush()
+
+    def default_manifest_path(self) -> Optional[str]:
+        return self.inner.default_manifest_path()
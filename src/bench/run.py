@@ -0,0 +1,355 @@
+# bench/run.py
+"""
+Offline performance benchmark: no API keys, no network.
+- Swaps Gemini, OpenAI embeddings and the Supabase table/RPC for the
+  deterministic stand-ins in bench/fakes.py (with configurable latency) and
+  runs the real code paths on the bundled PDFs:
+  * ingestion: RAG.ingest_regulations over the regulation PDFs (chunks/s)
+  * retrieval: graph.match_regulations (embed + vector match), p50/p95/p99
+  * filter: graph.evaluate_document_theme per report, tiered and LLM-only
+  * triage: triage.triage_document end to end per report, for the supervisor
+    and the deterministic pipeline (latency, LLM calls and prompt tokens; run
+    with CONTEXT_COMPACTION=0 for the uncompacted baseline)
+- Writes the results as JSON (--output) and exits 1 when a metric passes a
+  threshold (--thresholds JSON file) or regresses more than --max-regression
+  against a previous results file (--baseline).
+
+Usage (from src/):
+  python -m bench.run
+  python -m bench.run --llm-latency-ms 800 --embed-latency-ms 150 --rpc-latency-ms 60
+  python -m bench.run --baseline .cache/bench/baseline.json --max-regression 0.2
+  python -m bench.run --thresholds bench_thresholds.json   # {"retrieval.p95_ms": 250, ...}
+
+Threshold keys are dotted paths into the results; values are upper bounds,
+except keys ending in `_per_s` (throughput), which are lower bounds.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_REGULATIONS_DIR = str(SRC_DIR / "RAG" / "Regulations")
+DEFAULT_REPORTS = [
+    str(SRC_DIR / "RAG" / "Regulations" / "test_files" / "1st_synthetic_Inspection_Report_SiteA_Compliant.pdf.pdf"),
+    str(SRC_DIR / "RAG" / "Regulations" / "test_files" / "2nd_synthetic_Inspection_Report_SiteB_NonCompliant.pdf"),
+    str(SRC_DIR / "RAG" / "KnowledgeBase" / "Inspection_Report_SiteA_Compliant.pdf"),
+]
+DEFAULT_OUTPUT = ".cache/bench/results.json"
+RETRIEVAL_QUERIES = [
+    "leak detection and repair survey frequency",
+    "pneumatic controller venting limits",
+    "flare stack combustion efficiency requirements",
+    "produced water spill notification timeline",
+    "annual emissions reporting obligations",
+    "compressor seal venting standards",
+    "record keeping for inspections",
+    "vapour recovery unit requirements",
+]
+GRAPH_FACTORIES = (
+    "get_tools", "get_filter_agent", "get_web_search_agent", "get_compliance_retriever_agent",
+    "get_gap_analyzer_agent", "get_report_generator_agent", "get_workflow", "get_agent", "get_pipeline",
+    "get_checkpointer",
+)
+
+
+def percentiles(samples_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s, dtype=float) * 1000
+    if not len(ms):
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"n": int(len(ms)), "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+
+
+def _clear_graph_caches() -> None:
+    import graph
+    from instrumentation import get_instrumentation
+    from prefilter import get_classifier
+    from RAG.artifacts import get_artifact_store
+    from RAG.result_cache import get_result_cache
+
+    for name in GRAPH_FACTORIES:
+        getattr(graph, name).cache_clear()
+    get_instrumentation.cache_clear()
+    get_classifier.cache_clear()
+    get_result_cache.cache_clear()
+    get_artifact_store.cache_clear()
+
+
+@contextmanager
+def offline(llm_latency_s: float = 0.0, token_latency_s: float = 0.0, embed_latency_s: float = 0.0,
+            rpc_latency_s: float = 0.0) -> Iterator[Dict[str, object]]:
+    """Route every external call through bench/fakes.py for the duration of the block."""
+    import graph
+    import RAG.backends
+    import RAG.embedding_cache
+    import RAG.ingest_regulations
+    import RAG.rag
+    from bench.fakes import FakeChatModel, FakeEmbeddings, LatencyBackend
+    from RAG.backends import LocalBackend
+    from RAG.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+    workdir = tempfile.TemporaryDirectory(prefix="bench-")
+    raw_embeddings = FakeEmbeddings(latency_s=embed_latency_s)
+    embeddings = CachedEmbeddings(raw_embeddings, EmbeddingCache(":memory:"), model_name="bench-fake")
+    backend = LatencyBackend(LocalBackend(path=None), latency_s=rpc_latency_s)
+    model = FakeChatModel(latency_s=llm_latency_s, token_latency_s=token_latency_s)
+    fakes = {"model": model, "embeddings": embeddings, "raw_embeddings": raw_embeddings, "backend": backend,
+             "manifest": os.path.join(workdir.name, "manifest.json")}
+
+    patches = [(module, "get_embeddings", lambda *a, **k: embeddings)
+               for module in (RAG.embedding_cache, RAG.rag, RAG.ingest_regulations)]
+    patches += [(module, "get_backend", lambda *a, **k: backend)
+                for module in (RAG.backends, RAG.rag, RAG.ingest_regulations)]
+    patches.append((graph, "get_model", lambda: model))
+    env = {
+        "CORPUS_GENERATION_PATH": os.path.join(workdir.name, "generation"),
+        "CITATION_INDEX_PATH": os.path.join(workdir.name, "citation_index.json"),
+        "TOOL_CACHE_DISABLED": "1",
+        "GRAPH_METRICS_DISABLED": "1",
+        "ANALYSIS_STREAMING": "1",
+        "ARTIFACT_STORE_DISABLED": "1",  # every run measures the work, not the memoized result
+        "ANALYSIS_CHECKPOINTS": "0",
+    }
+    saved_attrs = [(module, attr, getattr(module, attr)) for module, attr, _ in patches]
+    saved_env = {key: os.environ.get(key) for key in (*env, "ANALYSIS_GRAPH", "PREFILTER_MODE")}
+    try:
+        for module, attr, replacement in patches:
+            setattr(module, attr, replacement)
+        os.environ.update(env)
+        _clear_graph_caches()
+        yield fakes
+    finally:
+        for module, attr, original in saved_attrs:
+            setattr(module, attr, original)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        _clear_graph_caches()
+        workdir.cleanup()
+
+
+# ---------------- Benchmarks ----------------
+def bench_ingestion(fakes: Dict[str, object], regulations_dir: str, parse_workers: int) -> Dict[str, object]:
+    from RAG.ingest_regulations import ingest_regulations
+
+    started = time.perf_counter()
+    summary = ingest_regulations(
+        regulations_dir, incremental=False, manifest_file=fakes["manifest"], parse_workers=parse_workers
+    )
+    seconds = time.perf_counter() - started
+    return {
+        "files": summary["new"] + summary["changed"],
+        "chunks": summary["upserted"],
+        "seconds": round(seconds, 3),
+        "chunks_per_s": round(summary["upserted"] / seconds, 1) if seconds else 0.0,
+        "embed_calls": fakes["raw_embeddings"].calls,
+    }
+
+
+def bench_retrieval(queries: int, match_count: int = 5) -> Dict[str, object]:
+    from graph import match_regulations
+
+    samples, empty = [], 0
+    for i in range(queries):
+        # Distinct text per query so every call embeds (no embedding-cache hit).
+        query = f"{RETRIEVAL_QUERIES[i % len(RETRIEVAL_QUERIES)]} ({i})"
+        started = time.perf_counter()
+        rows = json.loads(match_regulations(query, match_count=match_count))
+        samples.append(time.perf_counter() - started)
+        empty += not rows
+    return {**percentiles(samples), "empty_results": empty}
+
+
+def bench_filter(fakes: Dict[str, object], texts: Dict[str, str]) -> Dict[str, object]:
+    from graph import evaluate_document_theme
+    from prefilter import get_classifier
+
+    results = {}
+    for mode in ("tiered", "llm"):
+        os.environ["PREFILTER_MODE"] = mode
+        get_classifier.cache_clear()
+        calls_before = fakes["model"].stats.total
+        samples, labels = [], {}
+        for name, text in texts.items():
+            started = time.perf_counter()
+            labels[name] = evaluate_document_theme(text)
+            samples.append(time.perf_counter() - started)
+        results[mode] = {**percentiles(samples), "llm_calls": fakes["model"].stats.total - calls_before, "labels": labels}
+    os.environ.pop("PREFILTER_MODE", None)
+    get_classifier.cache_clear()
+    return results
+
+
+def bench_triage(fakes: Dict[str, object], reports: List[str], graphs=("supervisor", "pipeline")) -> Dict[str, object]:
+    from triage import triage_document
+
+    results = {}
+    for mode in graphs:
+        os.environ["ANALYSIS_GRAPH"] = mode
+        samples, calls, prompt_tokens, first_tokens, runs = [], [], [], [], []
+        for pdf in reports:
+            calls_before = fakes["model"].stats.total
+            tokens_before = fakes["model"].stats.prompt_tokens
+            started = time.perf_counter()
+            outcome = triage_document(pdf, Path(pdf).name)
+            samples.append(time.perf_counter() - started)
+            calls.append(fakes["model"].stats.total - calls_before)
+            prompt_tokens.append(fakes["model"].stats.prompt_tokens - tokens_before)
+            timings = outcome.get("timings") or {}
+            if timings.get("first_report_token_s") is not None:
+                first_tokens.append(timings["first_report_token_s"])
+            runs.append({"document": Path(pdf).name, "relevant": outcome["relevant"],
+                         "seconds": round(samples[-1], 3), "llm_calls": calls[-1], "prompt_tokens": prompt_tokens[-1],
+                         "report_chars": len(outcome["report"] or "")})
+        results[mode] = {
+            **percentiles(samples),
+            "mean_llm_calls": round(float(np.mean(calls)), 2) if calls else 0.0,
+            "mean_prompt_tokens": round(float(np.mean(prompt_tokens)), 1) if prompt_tokens else 0.0,
+            "first_report_token": percentiles(first_tokens),
+            "runs": runs,
+        }
+    os.environ.pop("ANALYSIS_GRAPH", None)
+    return results
+
+
+def run_benchmarks(
+    regulations_dir: str = DEFAULT_REGULATIONS_DIR,
+    reports: Optional[List[str]] = None,
+    queries: int = 200,
+    llm_latency_ms: float = 0.0,
+    token_latency_ms: float = 0.0,
+    embed_latency_ms: float = 0.0,
+    rpc_latency_ms: float = 0.0,
+    parse_workers: int = 2,
+) -> Dict[str, object]:
+    from triage import extract_text
+
+    reports = reports or DEFAULT_REPORTS
+    config = {"llm_latency_ms": llm_latency_ms, "token_latency_ms": token_latency_ms,
+              "embed_latency_ms": embed_latency_ms, "rpc_latency_ms": rpc_latency_ms,
+              "queries": queries, "regulations_dir": regulations_dir, "reports": [Path(r).name for r in reports]}
+    with offline(llm_latency_ms / 1000, token_latency_ms / 1000, embed_latency_ms / 1000, rpc_latency_ms / 1000) as fakes:
+        ingestion = bench_ingestion(fakes, regulations_dir, parse_workers)
+        retrieval = bench_retrieval(queries)
+        texts = {Path(pdf).name: extract_text(pdf) for pdf in reports}
+        filtering = bench_filter(fakes, texts)
+        triage = bench_triage(fakes, reports)
+    return {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config, "ingestion": ingestion,
+            "retrieval": retrieval, "filter": filtering, "triage": triage}
+
+
+# ---------------- Regression checks ----------------
+def _lookup(results: dict, path: str):
+    value = results
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value if isinstance(value, (int, float)) else None
+
+
+def _higher_is_better(path: str) -> bool:
+    return path.endswith("_per_s")
+
+
+def check_thresholds(results: dict, thresholds: Dict[str, float]) -> List[str]:
+    failures = []
+    for path, limit in thresholds.items():
+        value = _lookup(results, path)
+        if value is None:
+            failures.append(f"{path}: missing from results")
+        elif _higher_is_better(path) and value < limit:
+            failures.append(f"{path}: {value} < {limit}")
+        elif not _higher_is_better(path) and value > limit:
+            failures.append(f"{path}: {value} > {limit}")
+    return failures
+
+
+# Metrics compared against --baseline (latencies and LLM calls up, throughput down).
+REGRESSION_METRICS = [
+    "ingestion.chunks_per_s",
+    "retrieval.p50_ms", "retrieval.p95_ms", "retrieval.p99_ms",
+    "filter.tiered.p95_ms", "filter.tiered.llm_calls",
+    "triage.supervisor.p95_ms", "triage.supervisor.mean_llm_calls",
+    "triage.pipeline.p95_ms", "triage.pipeline.mean_llm_calls",
+]
+
+
+def check_baseline(results: dict, baseline: dict, max_regression: float, min_abs_ms: float = 1.0) -> List[str]:
+    """Relative regressions beyond max_regression; latency changes under min_abs_ms are noise."""
+    failures = []
+    for path in REGRESSION_METRICS:
+        new, old = _lookup(results, path), _lookup(baseline, path)
+        if new is None or old is None:
+            continue
+        if _higher_is_better(path):
+            if old and new < old * (1 - max_regression):
+                failures.append(f"{path}: {new} vs baseline {old} (-{(1 - new / old) * 100:.0f}%)")
+        elif new > old * (1 + max_regression) and not (path.endswith("_ms") and new - old < min_abs_ms):
+            change = f"+{(new / old - 1) * 100:.0f}%" if old else "new"
+            failures.append(f"{path}: {new} vs baseline {old} ({change})")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark with local LLM/embedding/vector-store stand-ins.")
+    parser.add_argument("--regulations-dir", default=DEFAULT_REGULATIONS_DIR)
+    parser.add_argument("--report", action="append", dest="reports", help="Inspection report PDF (repeatable)")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries to time")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Per chat-model call")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Per streamed word")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Per embeddings request")
+    parser.add_argument("--rpc-latency-ms", type=float, default=0.0, help="Per vector-store call")
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--thresholds", help="JSON file of {dotted.metric: limit}")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative regression vs baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        regulations_dir=args.regulations_dir, reports=args.reports, queries=args.queries,
+        llm_latency_ms=args.llm_latency_ms, token_latency_ms=args.token_latency_ms,
+        embed_latency_ms=args.embed_latency_ms, rpc_latency_ms=args.rpc_latency_ms,
+        parse_workers=args.parse_workers,
+    )
+    failures = []
+    if args.thresholds:
+        with open(args.thresholds, "r", encoding="utf-8") as fh:
+            failures += check_thresholds(results, json.load(fh))
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            failures += check_baseline(results, json.load(fh), args.max_regression)
+    results["failures"] = failures
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2)
+
+    ing, ret = results["ingestion"], results["retrieval"]
+    print(f"[bench] ingestion: {ing['chunks']} chunks in {ing['seconds']}s ({ing['chunks_per_s']} chunks/s)")
+    print(f"[bench] retrieval: p50 {ret['p50_ms']}ms  p95 {ret['p95_ms']}ms  p99 {ret['p99_ms']}ms")
+    for mode, stats in results["filter"].items():
+        print(f"[bench] filter[{mode}]: p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms  llm calls {stats['llm_calls']}")
+    for mode, stats in results["triage"].items():
+        print(f"[bench] triage[{mode}]: p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms  llm calls/doc {stats['mean_llm_calls']}  "
+              f"prompt tokens/doc {stats['mean_prompt_tokens']}")
+    print(f"[bench] wrote {args.output}")
+    for failure in failures:
+        print(f"[bench] FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# compare_modes.py
+"""
+Supervisor vs. deterministic pipeline on the same triage request.
+- Runs each compiled graph (graph.get_agent(), graph.get_pipeline()) on the
+  analysis prompt built from a PDF, `--runs` times each.
+- Counts chat-model calls and tool calls with a callback handler and measures
+  wall-clock time per run.
+- Prints the LLM calls and seconds the pipeline saves; --output writes JSON.
+
+Needs the same API keys as the app (Gemini, OpenAI, Supabase or a local index).
+
+Usage (from src/):
+  python compare_modes.py --pdf RAG/Regulations/test_files/2nd_synthetic_Inspection_Report_SiteB_NonCompliant.pdf
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_PDF = "RAG/Regulations/test_files/2nd_synthetic_Inspection_Report_SiteB_NonCompliant.pdf"
+
+
+class CallCounter(BaseCallbackHandler):
+    """Counts LLM and tool invocations across all nested runs (thread-safe)."""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        with self._lock:
+            self.llm_calls += 1
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        with self._lock:
+            self.tool_calls += 1
+
+
+def run_mode(graph, state: dict) -> Dict[str, float]:
+    counter = CallCounter()
+    started = time.perf_counter()
+    result = graph.invoke(state, config={"callbacks": [counter]})
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "llm_calls": counter.llm_calls,
+        "tool_calls": counter.tool_calls,
+        "report_chars": len(str(result["messages"][-1].content)),
+    }
+
+
+def _summary(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    return {
+        "runs": len(runs),
+        "median_s": round(statistics.median(r["seconds"] for r in runs), 3),
+        "mean_llm_calls": round(statistics.mean(r["llm_calls"] for r in runs), 2),
+        "mean_tool_calls": round(statistics.mean(r["tool_calls"] for r in runs), 2),
+    }
+
+
+def compare(pdf_path: str, runs: int = 1, graphs: Dict[str, object] = None) -> Dict[str, object]:
+    from triage import _analysis_input, extract_text
+
+    if graphs is None:
+        from graph import get_agent, get_pipeline
+
+        graphs = {"supervisor": get_agent(), "pipeline": get_pipeline()}
+    state = _analysis_input(Path(pdf_path).name, extract_text(pdf_path))
+    report = {name: _summary([run_mode(g, state) for _ in range(runs)]) for name, g in graphs.items()}
+    sup, pipe = report["supervisor"], report["pipeline"]
+    report["savings"] = {
+        "llm_calls": round(sup["mean_llm_calls"] - pipe["mean_llm_calls"], 2),
+        "seconds": round(sup["median_s"] - pipe["median_s"], 3),
+        "speedup": round(sup["median_s"] / pipe["median_s"], 2) if pipe["median_s"] else None,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare supervisor and pipeline graphs on one triage request.")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="Inspection report PDF to analyze")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per mode")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = compare(args.pdf, args.runs)
+    for name in ("supervisor", "pipeline"):
+        r = report[name]
+        print(f"[compare] {name}: {r['median_s']}s median, {r['mean_llm_calls']} LLM calls, {r['mean_tool_calls']} tool calls")
+    s = report["savings"]
+    print(f"[compare] pipeline saves {s['llm_calls']} LLM calls and {s['seconds']}s per run (speedup x{s['speedup']})")
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
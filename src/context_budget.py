@@ -0,0 +1,247 @@
+# context_budget.py
+"""
+Token-budgeted context compaction for the supervisor and its agents.
+
+The supervisor hands every agent the whole conversation: the triage request
+(triage.ANALYSIS_PROMPT with its examples and evidence), every handoff and,
+inside the retriever, raw JSON rows from match_regulations / lookup_citation /
+web_search with full chunk content. compaction_hook(agent) is installed as the
+pre_model_hook of each ReAct agent and of the supervisor (graph.py). It only
+changes what the model is sent (llm_input_messages); graph state and
+checkpoints keep the full history.
+
+Per model call:
+1. Consumed tool payloads (tool results the model has already answered) become
+   compact references, one line per passage: its citation and a short snippet.
+2. Passages are deduplicated across tool results: a repeat is a pointer to the
+   first reference ('[3] (repeat)'); in a payload the model has not read yet,
+   rows get a 'ref' number and a repeat's content is replaced by a pointer.
+3. Only if the history is still over the agent's budget: reference snippets
+   are dropped (citations stay), then the longest older tool results and
+   agent messages are cut in the middle (other human messages only after
+   them). The first human message (the triage request with the findings)
+   and the last PROTECTED_TAIL messages (the newest turn or handoff) are
+   never cut.
+
+Tokens are counted with the chunking tokenizer (RAG/chunking.token_length), so
+budgets are approximate for Gemini. The agent's system prompt is added after
+the hook and is not counted.
+
+Each compaction is sent as a 'context_compaction' custom callback event;
+instrumentation.py adds tokens before/after and compaction time to the node
+and run records.
+
+Environment variables (all optional):
+  CONTEXT_COMPACTION      set to 0 to send agents the full history
+  CONTEXT_BUDGET_TOKENS   budget for every agent (default: AGENT_BUDGETS)
+  CONTEXT_BUDGETS         per-agent overrides, e.g. 'gap_analyzer_agent=12000,supervisor=4000'
+  CONTEXT_SNIPPET_CHARS   snippet length in passage references (default 160)
+"""
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+COMPACTION_EVENT = "context_compaction"
+DEFAULT_BUDGET = 8000
+AGENT_BUDGETS = {
+    "supervisor": 6000,
+    "compliance_retriever_agent": 6000,
+    "web_search_agent": 4000,
+    "gap_analyzer_agent": 10000,
+    "report_generator_agent": 10000,
+}
+DEFAULT_SNIPPET_CHARS = 160
+PROTECTED_TAIL = 3
+MIN_CUT_TOKENS = 200  # a cut message keeps at least this much
+_MARKER_TOKENS = 20  # room for the "tokens omitted" marker
+
+
+def compaction_enabled() -> bool:
+    return os.getenv("CONTEXT_COMPACTION", "1").lower() not in ("0", "false", "no")
+
+
+def budget_for(agent: str) -> int:
+    for item in os.getenv("CONTEXT_BUDGETS", "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() == agent and value.strip():
+            return int(value)
+    if os.getenv("CONTEXT_BUDGET_TOKENS"):
+        return int(os.getenv("CONTEXT_BUDGET_TOKENS"))
+    return AGENT_BUDGETS.get(agent, DEFAULT_BUDGET)
+
+
+# ---------------- Token counts ----------------
+@lru_cache(maxsize=4096)
+def _tokens(text: str) -> int:
+    from RAG.chunking import token_length
+
+    return token_length(text)
+
+
+def _text(message) -> Optional[str]:
+    """Plain-text content, or None for multi-part content (left untouched)."""
+    return message.content if isinstance(message.content, str) else None
+
+
+def message_tokens(message) -> int:
+    text = _text(message)
+    tokens = _tokens(text) if text is not None else _tokens(json.dumps(message.content, default=str))
+    calls = getattr(message, "tool_calls", None)
+    return tokens + (_tokens(json.dumps(calls, default=str)) if calls else 0)
+
+
+# ---------------- Passages ----------------
+def _rows(payload) -> Optional[List[dict]]:
+    """Passage dicts of a parsed tool result: rows, match_regulations_many groups or a Tavily response."""
+    if isinstance(payload, dict):
+        return _rows(payload["results"]) if isinstance(payload.get("results"), list) else None
+    if not isinstance(payload, list):
+        return None
+    rows = []
+    for item in payload:
+        if isinstance(item, dict) and isinstance(item.get("rows"), list):
+            rows.extend(r for r in item["rows"] if isinstance(r, dict) and "content" in r)
+        elif isinstance(item, dict) and "content" in item:
+            rows.append(item)
+    return rows or None
+
+
+def _key(row: dict) -> str:
+    from RAG.embedding_cache import text_key
+
+    return str(row.get("id") or row.get("url") or text_key(str(row.get("content", ""))))
+
+
+def reference(row: dict) -> str:
+    """Short citation of a passage ('SOR/2018-66, Section 8(1), p. 12'), or a web result's title / url."""
+    from RAG.citations import doc_key, doc_label
+
+    meta = row.get("metadata") or {}
+    source = meta.get("source_pdf") or meta.get("source")
+    parts = []
+    if row.get("citation"):
+        parts.append(row["citation"])
+    elif source:
+        section = meta.get("subsection") or meta.get("section")
+        parts.append(doc_label(doc_key(str(source))) + (f", Section {section}" if section else ""))
+    elif row.get("title") or row.get("url"):
+        parts.append(str(row.get("title") or row["url"]))
+    if meta.get("page") is not None:
+        parts.append(f"p. {meta['page']}")
+    return ", ".join(parts) or "passage"
+
+
+def _snippet(text: str, chars: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= chars else text[:chars].rstrip() + "…"
+
+
+def _render(name: str, entries: List[tuple], snippets: bool) -> str:
+    lines = [f"[{name} result, already used; passages by reference]"]
+    for number, first, ref, snippet in entries:
+        if not first:
+            lines.append(f"[{number}] (repeat)")
+        else:
+            lines.append(f"[{number}] {ref}: {snippet}" if snippets and snippet else f"[{number}] {ref}")
+    return "\n".join(lines)
+
+
+# ---------------- Compaction ----------------
+def _cut(text: str, tokens: int, cut: int) -> str:
+    keep = int(len(text) * (tokens - cut) / max(tokens, 1))
+    head = keep * 2 // 3
+    return f"{text[:head]}\n…[{cut} tokens omitted to fit the context budget]…\n{text[len(text) - (keep - head):]}"
+
+
+def compact_messages(
+    messages: list, budget: int, snippet_chars: int = DEFAULT_SNIPPET_CHARS
+) -> Tuple[list, Dict[str, int]]:
+    """Compacted copy of `messages` (input objects are not modified) and what it saved."""
+    answered = max((i for i, m in enumerate(messages) if getattr(m, "type", "") == "ai"), default=-1)
+    numbers: Dict[str, int] = {}
+    out, compacted = list(messages), {}
+    stats = {"tokens_before": sum(message_tokens(m) for m in messages), "payloads_compacted": 0,
+             "passages_deduped": 0, "messages_cut": 0}
+
+    for i, message in enumerate(messages):
+        text = _text(message)
+        if getattr(message, "type", "") != "tool" or text is None:
+            continue
+        try:
+            rows = _rows(json.loads(text))
+        except ValueError:
+            rows = None
+        name = getattr(message, "name", None) or "tool"
+        if rows is None:
+            if i < answered and len(text) > 2 * snippet_chars:
+                out[i] = message.model_copy(update={"content": f"[{name} result, already used] {_snippet(text, snippet_chars)}"})
+                stats["payloads_compacted"] += 1
+            continue
+        entries = []
+        for row in rows:
+            key = _key(row)
+            first = key not in numbers
+            numbers.setdefault(key, len(numbers) + 1)
+            stats["passages_deduped"] += 0 if first else 1
+            entries.append((numbers[key], first, reference(row), _snippet(row.get("content", ""), snippet_chars)))
+        if i < answered:
+            compacted[i] = (name, entries)
+            out[i] = message.model_copy(update={"content": _render(name, entries, snippets=True)})
+            stats["payloads_compacted"] += 1
+        else:
+            payload = json.loads(text)
+            for row, (number, first, _, _) in zip(_rows(payload), entries):
+                row["ref"] = number
+                if not first:
+                    row["content"] = f"(same passage as [{number}] above)"
+            out[i] = message.model_copy(update={"content": json.dumps(payload)})
+
+    sizes = [message_tokens(m) for m in out]
+    if sum(sizes) > budget:
+        for i, (name, entries) in compacted.items():
+            out[i] = out[i].model_copy(update={"content": _render(name, entries, snippets=False)})
+            sizes[i] = message_tokens(out[i])
+    excess = sum(sizes) - budget
+    request = next((i for i, m in enumerate(out) if getattr(m, "type", "") == "human"), None)
+    older = [i for i in range(max(0, len(out) - PROTECTED_TAIL)) if i != request and _text(out[i]) is not None]
+    # Tool results and agent turns go first; a later human message only if that is not enough.
+    for i in sorted(older, key=lambda j: (getattr(out[j], "type", "") == "human", -sizes[j])):
+        if excess <= 0:
+            break
+        cut = min(excess + _MARKER_TOKENS, sizes[i] - MIN_CUT_TOKENS)
+        if cut <= 0:
+            continue
+        out[i] = out[i].model_copy(update={"content": _cut(_text(out[i]), sizes[i], cut)})
+        excess -= sizes[i] - message_tokens(out[i])
+        sizes[i] = message_tokens(out[i])
+        stats["messages_cut"] += 1
+
+    stats["tokens_after"] = sum(sizes)
+    return out, stats
+
+
+def _report(stats: dict, config) -> None:
+    from langchain_core.callbacks import dispatch_custom_event
+
+    try:
+        dispatch_custom_event(COMPACTION_EVENT, stats, config=config)
+    except RuntimeError:
+        pass  # called outside a graph run: nobody to report to
+
+
+def compaction_hook(agent: str):
+    """pre_model_hook for `agent`, or None when CONTEXT_COMPACTION=0."""
+    if not compaction_enabled():
+        return None
+    budget = budget_for(agent)
+    snippet_chars = int(os.getenv("CONTEXT_SNIPPET_CHARS", DEFAULT_SNIPPET_CHARS))
+
+    def compact_context(state, config):
+        started = time.perf_counter()
+        messages, stats = compact_messages(state["messages"], budget, snippet_chars)
+        _report({**stats, "agent": agent, "budget": budget, "seconds": round(time.perf_counter() - started, 6)}, config)
+        return {"llm_input_messages": messages}
+
+    return compact_context
@@ -0,0 +1,279 @@
+# gap_analysis.py
+"""
+Map-reduce gap analysis over the whole inspection report, run before the
+report generator (triage.py, analyze stage).
+
+- split: the report is cut into sections at its headings ("2) Emissions & LDAR",
+  "3.1 Flaring", ALL-CAPS lines, markdown #), packed up to GAP_SECTION_CHARS.
+  Sections are contiguous slices, so together they cover every character.
+  Longer reports get larger sections instead of more of them (GAP_MAX_SECTIONS),
+  which keeps the map step to one wave of calls: latency stays roughly flat
+  as the report grows.
+- map: per section, regulation retrieval (graph.match_regulations on the
+  section text) and one gap-extraction LLM call, for all sections
+  concurrently (at most GAP_MAP_CONCURRENCY at a time). Each LLM call takes
+  the caller's limit('gemini') slot (the job runner / batch provider limits),
+  so the map step never runs more Gemini calls at once than that limit.
+- reduce: the same gap raised by several sections is merged (same regulation
+  and overlapping wording, or near-identical wording), keeping the highest
+  severity; the list is ranked High > Medium > Low, then by how many sections
+  raised it. Retrieved passages are deduped the same way the pipeline does.
+
+format_findings() renders the result for the analysis prompt, which then
+replaces the old 2000-character excerpt.
+
+Cost: one gap-extraction LLM call and one retrieval per section, so up to
+GAP_MAX_SECTIONS (8) extra LLM calls per analysis on top of the graph's own.
+GAP_MAP_REDUCE=0 saves them, but the analysis then sees only the first 2000
+characters of the report.
+
+Environment variables (all optional):
+  GAP_MAP_REDUCE        1 (default) runs the map-reduce; 0 sends the 2000-character excerpt
+  GAP_SECTION_CHARS     target section size in characters (default 2500)
+  GAP_MAX_SECTIONS      sections per report before they grow instead (default 8)
+  GAP_MAP_CONCURRENCY   sections analyzed at once (default 8)
+  GAP_MATCH_COUNT       regulation passages retrieved per section (default 4)
+"""
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+SEVERITY_RANK = {"Critical": 4, "High": 3, "Medium": 2, "Low": 1}
+
+_HEADING = re.compile(
+    r"^\s*(?:#{1,6}\s+\S|\d{1,2}(?:\.\d{1,2})*[.)]?\s+[A-Z]|[A-Z][A-Z0-9 &/,()'-]{3,60}:?\s*$)"
+)
+_GAP_LINE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.*\S)")
+_SEVERITY = re.compile(r"\b(critical|high|medium|low)\b", re.IGNORECASE)
+_CITATION = re.compile(r"\b(?:SOR|DORS)\s*[/-]\s*\d{4}\s*-\s*\d+[^|;]*|\b(?:AER\s+)?Directive\s*0?\d{2,3}[^|;]*", re.IGNORECASE)
+
+
+def _unlimited(provider: str):
+    return nullcontext()
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def map_reduce_enabled() -> bool:
+    return os.getenv("GAP_MAP_REDUCE", "1").lower() not in ("0", "false", "no")
+
+
+# ---------------- Split ----------------
+def _blocks(text: str) -> List[dict]:
+    """Heading-delimited blocks: [{'title', 'start', 'end'}] covering text end to end."""
+    blocks: List[dict] = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        if not blocks or (line.strip() and _HEADING.match(line)):
+            blocks.append({"title": line.strip()[:80], "start": offset, "end": offset})
+        blocks[-1]["end"] = offset + len(line)
+        offset += len(line)
+    return blocks
+
+
+def _pieces(text: str, block: dict, size: int) -> List[dict]:
+    """Split an oversized block at line breaks (hard cut for a single oversized line)."""
+    pieces, start = [], block["start"]
+    while block["end"] - start > size:
+        cut = text.rfind("\n", start, start + size) + 1 or start + size
+        if cut <= start:
+            cut = start + size
+        pieces.append({"title": block["title"], "start": start, "end": cut})
+        start = cut
+    pieces.append({"title": block["title"], "start": start, "end": block["end"]})
+    return pieces
+
+
+def _pack(text: str, blocks: List[dict], size: int) -> List[dict]:
+    """Greedily join consecutive blocks (or pieces of oversized ones) up to `size` characters."""
+    sections: List[dict] = []
+    for block in blocks:
+        for piece in _pieces(text, block, size):
+            current = sections[-1] if sections else None
+            if current and piece["end"] - current["start"] <= size:
+                current["end"] = piece["end"]
+            else:
+                sections.append(dict(piece))
+    return sections
+
+
+def split_sections(text: str, section_chars: Optional[int] = None, max_sections: Optional[int] = None) -> List[dict]:
+    """
+    [{'index', 'title', 'start', 'end', 'text'}]; consecutive slices of `text`
+    ("".join(s['text']) == text). Section size grows past section_chars when the
+    report would otherwise need more than max_sections.
+    """
+    section_chars = section_chars or _env_int("GAP_SECTION_CHARS", 2500)
+    max_sections = max_sections or _env_int("GAP_MAX_SECTIONS", 8)
+    if not text.strip():
+        return []
+    blocks = _blocks(text)
+    size = max(section_chars, math.ceil(len(text) / max_sections))
+    sections = _pack(text, blocks, size)
+    while len(sections) > max_sections:  # packing at headings leaves slack; grow until it fits
+        size = math.ceil(size * 1.25)
+        sections = _pack(text, blocks, size)
+    for i, section in enumerate(sections):
+        section.update(index=i, text=text[section["start"]:section["end"]])
+    return sections
+
+
+# ---------------- Map ----------------
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content or [])
+
+
+def parse_section_gaps(reply: str, section_title: str) -> List[Dict[str, object]]:
+    """Gap lines of a map reply ('- title | citation | severity', or free text) -> [{'title', 'citation', 'severity', 'sections'}]."""
+    gaps = []
+    for line in (reply or "").splitlines():
+        item = _GAP_LINE.match(line)
+        if not item:
+            continue
+        parts = [p.strip() for p in item.group(1).replace("**", "").split("|")]
+        title = parts[0]
+        rest = " ".join(parts[1:])
+        severity = _SEVERITY.search(parts[-1] if len(parts) > 1 else title)
+        citation = parts[1] if len(parts) > 2 else (_CITATION.search(rest or title) or [None])[0]
+        if len(parts) == 1 and severity:
+            title = re.sub(r"\s*\((?:critical|high|medium|low)\)\s*$", "", title, flags=re.IGNORECASE)
+        gaps.append({
+            "title": title,
+            "citation": citation.strip(" .,") if citation else None,
+            "severity": severity.group(1).title() if severity else None,
+            "sections": [section_title],
+        })
+    return gaps
+
+
+def analyze_section(
+    section: dict, match_count: Optional[int] = None, limit: Optional[Callable[[str], object]] = None
+) -> dict:
+    """Retrieve regulations for one section and extract its gaps (one LLM call, inside limit('gemini'))."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    import graph
+
+    started = time.perf_counter()
+    match_count = match_count or _env_int("GAP_MATCH_COUNT", 4)
+    rows = json.loads(graph.match_regulations(section["text"][:2000], match_count))
+    rows = [{**row, "topic": section["title"]} for row in rows] if isinstance(rows, list) else []
+    passages = "\n\n".join(
+        f"[{i}] ({(row.get('metadata') or {}).get('source_pdf', '')}) {row.get('content', '')}" for i, row in enumerate(rows, 1)
+    )
+    with (limit or _unlimited)("gemini"):
+        reply = graph.get_model().invoke([
+            SystemMessage(content=graph.SECTION_GAP_PROMPT),
+            HumanMessage(content=f"Report section: {section['title']}\n{section['text']}\n\nRegulatory passages:\n{passages or 'None found.'}"),
+        ])
+    return {
+        "index": section["index"],
+        "title": section["title"],
+        "gaps": parse_section_gaps(_text(reply.content), section["title"]),
+        "passages": rows,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# ---------------- Reduce ----------------
+def _words(text: str) -> set:
+    from RAG.lexical import tokenize
+
+    return set(tokenize(text or ""))
+
+
+def _regulation(citation: Optional[str]):
+    """(document, top-level section) of a citation, so 8(1) and 8(2) count as the same rule."""
+    from RAG.citations import parse_citations
+
+    found = parse_citations(citation or "")
+    if not found:
+        return None
+    doc, label = found[0]
+    return doc, label.split("(")[0]
+
+
+def _similar(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def reduce_gaps(mapped: List[dict]) -> List[Dict[str, object]]:
+    """Merge duplicate gaps across sections (highest severity wins) and rank them."""
+    merged: List[dict] = []
+    for result in sorted(mapped, key=lambda r: r["index"]):
+        for gap in result["gaps"]:
+            words, regulation = _words(gap["title"]), _regulation(gap["citation"])
+            for kept in merged:
+                overlap = _similar(words, kept["_words"])
+                same_rule = regulation is not None and regulation == kept["_regulation"]
+                if overlap >= 0.6 or (same_rule and overlap >= 0.25):
+                    if SEVERITY_RANK.get(gap["severity"], 0) > SEVERITY_RANK.get(kept["severity"], 0):
+                        kept.update(title=gap["title"], severity=gap["severity"], citation=gap["citation"] or kept["citation"])
+                    kept["citation"] = kept["citation"] or gap["citation"]
+                    kept["sections"] += [s for s in gap["sections"] if s not in kept["sections"]]
+                    kept["_words"] |= words
+                    break
+            else:
+                merged.append({**gap, "sections": list(gap["sections"]), "_words": words, "_regulation": regulation})
+    ranked = sorted(
+        enumerate(merged), key=lambda item: (-SEVERITY_RANK.get(item[1]["severity"], 0), -len(item[1]["sections"]), item[0])
+    )
+    return [{k: v for k, v in gap.items() if not k.startswith("_")} for _, gap in ranked]
+
+
+def map_reduce_gaps(
+    full_text: str, concurrency: Optional[int] = None, limit: Optional[Callable[[str], object]] = None
+) -> Dict[str, object]:
+    """
+    Split -> map (concurrent per-section retrieval + gap extraction) -> reduce.
+    `limit(provider)` is acquired around every map LLM call; the caller must
+    not hold a gemini slot itself. Returns {'gaps', 'context', 'sections',
+    'coverage', 'timings'}.
+    """
+    import graph
+
+    started = time.perf_counter()
+    sections = split_sections(full_text)
+    workers = max(1, min(concurrency or _env_int("GAP_MAP_CONCURRENCY", 8), len(sections) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        mapped = list(pool.map(partial(analyze_section, limit=limit), sections))
+    map_s = time.perf_counter() - started
+    gaps = reduce_gaps(mapped)
+    context = graph.merge_passages({"passages": [row for result in mapped for row in result["passages"]]})["context"]
+    covered = sum(s["end"] - s["start"] for s in sections)
+    return {
+        "gaps": gaps,
+        "context": context,
+        "sections": [{"title": r["title"], "gaps": len(r["gaps"]), "seconds": r["seconds"]} for r in mapped],
+        "coverage": round(covered / len(full_text), 3) if full_text else 1.0,
+        "timings": {
+            "sections": len(sections),
+            "concurrency": workers,
+            "map_s": round(map_s, 3),
+            "reduce_s": round(time.perf_counter() - started - map_s, 3),
+        },
+    }
+
+
+def format_findings(findings: Dict[str, object]) -> str:
+    """Analysis-prompt block listing the reduced gaps and the passages they were checked against."""
+    from graph import MAPPED_FINDINGS_MARKER
+
+    lines = [f"{MAPPED_FINDINGS_MARKER} ({len(findings['sections'])} section(s); deduplicated, most severe first):"]
+    for i, gap in enumerate(findings["gaps"], 1):
+        citation = f" — {gap['citation']}" if gap.get("citation") else ""
+        lines.append(f"{i}. [{gap.get('severity') or 'Unrated'}] {gap['title']}{citation} (report sections: {'; '.join(gap['sections'])})")
+    if not findings["gaps"]:
+        lines.append("No gaps were found in any section.")
+    lines += ["", "Regulatory passages retrieved for these sections:", findings["context"]]
+    return "\n".join(lines)
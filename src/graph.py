@@ -5,31 +5,46 @@
 - Build supervisor workflow = create_supervisor(...)
 - Compile workflow for Studio multi-node diagram
 - Keep app = filter_agent as your single-agent entry
+
+Everything heavy (Gemini client, agents, compiled supervisor) is built lazily
+by cached get_*() factories on first use, so importing this module is cheap.
+The historical module attributes (model, filter_agent, ..., demo_app, agent,
+app) still work: they resolve through the factories via module __getattr__,
+which is also how LangGraph loads `graph:agent` from langgraph.json.
+Measure cold start with `python startup_profile.py`.
+
+Two compiled graphs are exported:
+- agent / demo_app: LLM-routed supervisor (create_supervisor)
+- pipeline: deterministic StateGraph for triage requests: retrieval fans out
+  concurrently per regulation topic (Send), results are merged and deduped,
+  then one gap-analysis call and one report call. Requests that already carry
+  map-reduced findings (gap_analysis.py) go straight to the report. Free-form
+  requests fall back to the supervisor. Compare both with `python compare_modes.py`.
+
+Every supervisor-side model call goes through a per-agent token budget
+(context_budget.py, pre_model_hook): consumed tool payloads become citation +
+snippet references, repeated passages are deduplicated, and the history is cut
+only when it is still over budget. The graph state keeps the full history.
+
+For triage runs, with_checkpointer() attaches a local SQLite checkpointer
+(get_checkpointer(); ANALYSIS_CHECKPOINT_PATH, ANALYSIS_CHECKPOINTS=0 to turn
+it off), so an interrupted analysis resumes instead of starting over; async
+runs use async_checkpointer() on the same file.
 """
 import os
 import json
+import operator
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Annotated, List, Optional, TypedDict
 from dotenv import load_dotenv
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph_supervisor import create_supervisor
-from langgraph.prebuilt import create_react_agent
-
-from langchain_core.messages import HumanMessage
-from langchain_core.tools import tool
-from langchain_openai import OpenAIEmbeddings
-from supabase import create_client
-
 load_dotenv()
 
-# Model
-model = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+MODEL_NAME = "gemini-2.5-flash"
 
-# ---------------- Agent 1 — Filter (no tools) ----------------
-filter_agent = create_react_agent(
-    model=model,
-    name="filter_agent",
-    tools=[],
-    prompt="""
+# ---------------- Prompts ----------------
+FILTER_PROMPT = """
 You are an expert in Oil & Gas regulatory compliance in Canada.
 Classify if the user's text is potentially relevant to compliance topics:
 - emissions (methane/VOC), LDAR
@@ -39,72 +54,21 @@ Classify if the user's text is potentially relevant to compliance topics:
 
 Respond ONLY 'Yes' or 'No' with no explanation.
 """
-)
-
-# ---------------- Base Tools ----------------
-@tool
-def web_search(query: str, max_results: int = 5) -> str:
-    """Web search (Tavily). Returns JSON with title/url/content."""
-    try:
-        from tavily import TavilyClient
-    except Exception:
-        return json.dumps({"error": "tavily package missing (pip install tavily-python)"})
-    api_key = os.getenv("TAVILY_API_KEY")
-    if not api_key:
-        return json.dumps({"error": "Missing TAVILY_API_KEY"})
-    client = TavilyClient(api_key=api_key)
-    resp = client.search(query=query, max_results=max_results)
-    return json.dumps(resp or {})
-
-@tool
-def match_regulations(query: str, match_count: int = 5) -> str:
-    """Semantic search over Supabase 'regulations' corpus (RPC). Returns JSON rows."""
-    embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
-    vector = embeddings.embed_query(query)
-
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-    client = create_client(supabase_url, supabase_key)
-
-    payload = {
-        "query_embedding": vector,
-        "match_count": match_count,
-        "filter": {"corpus": "regulations"}
-    }
-    resp = client.rpc("match_documents_oag_compliance", payload).execute()
-    return json.dumps(resp.data or [])
 
-# ---------------- Agents 2–5 ----------------
-
-# 2) Web Search agent (uses Tavily tool)
-web_search_agent = create_react_agent(
-    model=model,
-    name="web_search_agent",
-    tools=[web_search],
-    prompt="""
+WEB_SEARCH_PROMPT = """
 You search the public web for supplemental context (guidance, definitions, recent notes).
 When useful, call web_search and provide concise, cited pointers. Otherwise answer briefly.
 """
-)
 
-# 3) Compliance Retriever agent (uses Supabase RPC tool)
-compliance_retriever_agent = create_react_agent(
-    model=model,
-    name="compliance_retriever_agent",
-    tools=[match_regulations],
-    prompt="""
+RETRIEVER_PROMPT = """
 You retrieve regulatory passages relevant to Oil & Gas compliance.
-When asked for clauses/citations, call match_regulations, return concise results with references.
+For an exact citation (e.g. "SOR/2018-66, Section 8(1)", "Directive 060, Section 3.2"), call lookup_citation.
+For topics or questions, call match_regulations; for several topics, call match_regulations_many once
+with all of the queries instead of calling match_regulations repeatedly. Return concise results with references.
 Otherwise answer briefly.
 """
-)
 
-# 4) Gap Analyzer agent (no tools)
-gap_analyzer_agent = create_react_agent(
-    model=model,
-    name="gap_analyzer_agent",
-    tools=[],
-    prompt="""
+GAP_ANALYZER_PROMPT = """
 Analyze conversation context that includes:
 - internal document excerpts
 - regulatory snippets retrieved previously
@@ -112,32 +76,23 @@ Analyze conversation context that includes:
 Output a compact bullet list of potential gaps with a short rationale and severity (Low/Medium/High).
 If context is insufficient, state so briefly. Do not call tools.
 """
-)
 
-# 5) Report/Summary agent (no tools)
-report_generator_agent = create_react_agent(
-    model=model,
-    name="report_generator_agent",
-    tools=[],
-    prompt="""
+SECTION_GAP_PROMPT = """
+You review ONE section of an Oil & Gas inspection report against the regulatory passages provided.
+List the potential gaps found in this section only, one per line, as:
+- <short gap title> | <regulation citation, e.g. SOR/2018-66, Section 8(1)> | <Low/Medium/High>
+Use only facts stated in the section. If the section shows no gaps, reply exactly: NONE
+"""
+
+REPORT_GENERATOR_PROMPT = """
 Generate a concise triage report using only conversation context:
 - One-paragraph executive summary
 - Bullet list of flagged gaps (if any)
 - 2–3 recommended next actions
 Do not call any tools. Keep it business-friendly and brief.
 """
-)
 
-# ---------------- Supervisor Workflow (LangGraph-2025-2 style) ----------------
-workflow = create_supervisor(
-    agents=[
-        compliance_retriever_agent,   # retrieve clauses
-        gap_analyzer_agent,           # analyze gaps
-        report_generator_agent,       # summarize and next actions
-        web_search_agent,             # public web context
-    ],
-    model=model,
-    prompt="""
+SUPERVISOR_PROMPT = """
 You are a supervisor/router for an Oil & Gas compliance triage workflow.
 Decide which agent to run next based on the goal and conversation data:
 - compliance_retriever_agent: retrieve clauses/citations from the regulations DB.
@@ -146,21 +101,628 @@ Decide which agent to run next based on the goal and conversation data:
 - web_search_agent: fetch recent public context and cite links if relevant.
 Always move the task forward and stop when the user's goal is satisfied.
 """
-)
+
+
+# Model
+@lru_cache(maxsize=None)
+def get_model():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model=MODEL_NAME)
+
+
+def _react_agent(name: str, tools: list, prompt: str):
+    from langgraph.prebuilt import create_react_agent
+
+    from context_budget import compaction_hook
+
+    return create_react_agent(
+        model=get_model(), name=name, tools=tools, prompt=prompt, pre_model_hook=compaction_hook(name)
+    )
+
+
+# ---------------- Agent 1 — Filter (no tools) ----------------
+@lru_cache(maxsize=None)
+def get_filter_agent():
+    return _react_agent("filter_agent", [], FILTER_PROMPT)
+
+
+# ---------------- Base Tools ----------------
+# Plain functions; wrapped as LangChain tools on first use (see get_tools()).
+# Each tool has a sync and an async variant. Both reuse the process-wide
+# keep-alive HTTP pools (RAG/http_pool.py), cached embeddings and the cached
+# retrieval backend, so no call pays for a fresh client or TLS handshake.
+# Results go through the tool-result cache (exact + semantic, TTL/LRU;
+# regulation results are invalidated by the corpus generation counter).
+TAVILY_SEARCH_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com").rstrip("/") + "/search"
+
+
+def _tavily_request(query: str, max_results: int):
+    api_key = os.getenv("TAVILY_API_KEY")
+    if not api_key:
+        return None
+    return {
+        "url": TAVILY_SEARCH_URL,
+        "json": {"query": query, "max_results": max_results},
+        "headers": {"Authorization": f"Bearer {api_key}"},
+    }
+
+
+def _cached(tool: str, query: str, params: dict, corpus_bound: bool):
+    """Tool-result cache lookup (RAG/result_cache.py). Returns (cache, generation, value, vector)."""
+    from RAG.embedding_cache import get_embeddings
+    from RAG.manifest import corpus_generation
+    from RAG.result_cache import get_result_cache
+
+    cache = get_result_cache()
+    if cache is None:
+        return None, None, None, None
+    generation = corpus_generation() if corpus_bound else None
+    value, vector = cache.lookup(tool, query, params, generation, embed=get_embeddings().embed_query)
+    return cache, generation, value, vector
+
+
+async def _acached(tool: str, query: str, params: dict, corpus_bound: bool):
+    from RAG.embedding_cache import get_embeddings
+    from RAG.manifest import corpus_generation
+    from RAG.result_cache import get_result_cache
+
+    cache = get_result_cache()
+    if cache is None:
+        return None, None, None, None
+    generation = corpus_generation() if corpus_bound else None
+    value, vector = await cache.alookup(tool, query, params, generation, aembed=get_embeddings().aembed_query)
+    return cache, generation, value, vector
+
+
+def web_search(query: str, max_results: int = 5) -> str:
+    """Web search (Tavily). Returns JSON with title/url/content."""
+    from RAG.http_pool import request_with_retry
+
+    request = _tavily_request(query, max_results)
+    if request is None:
+        return json.dumps({"error": "Missing TAVILY_API_KEY"})
+    params = {"max_results": max_results}
+    cache, generation, value, vector = _cached("web_search", query, params, corpus_bound=False)
+    if value is not None:
+        return value
+    resp = request_with_retry("POST", **request)
+    value = json.dumps(resp.json() or {})
+    if cache is not None:
+        cache.put("web_search", query, value, params, vector, generation)
+    return value
+
+
+async def aweb_search(query: str, max_results: int = 5) -> str:
+    """Web search (Tavily). Returns JSON with title/url/content."""
+    from RAG.http_pool import arequest_with_retry
+
+    request = _tavily_request(query, max_results)
+    if request is None:
+        return json.dumps({"error": "Missing TAVILY_API_KEY"})
+    params = {"max_results": max_results}
+    cache, generation, value, vector = await _acached("web_search", query, params, corpus_bound=False)
+    if value is not None:
+        return value
+    resp = await arequest_with_retry("POST", **request)
+    value = json.dumps(resp.json() or {})
+    if cache is not None:
+        cache.put("web_search", query, value, params, vector, generation)
+    return value
+
+
+def _hybrid_index():
+    """Citation index for lexical fusion, or None (not built yet, or HYBRID_SEARCH=0)."""
+    from RAG.citations import get_citation_index
+
+    if os.getenv("HYBRID_SEARCH", "1") == "0":
+        return None
+    index = get_citation_index()
+    return index if len(index) else None
+
+
+def _fuse(query: str, rows: list, index, match_count: int) -> list:
+    from RAG.lexical import hybrid_rows
+
+    return hybrid_rows(query, rows, index, match_count) if index else rows[:match_count]
+
+
+def _search_params(ef_search: Optional[int], probes: Optional[int]) -> dict:
+    """ANN knobs that were set (HNSW candidate list size, IVFFlat lists scanned); unset = backend default."""
+    return {name: value for name, value in (("ef_search", ef_search), ("probes", probes)) if value}
+
+
+def match_regulations(
+    query: str, match_count: int = 5, ef_search: Optional[int] = None, probes: Optional[int] = None
+) -> str:
+    """Semantic search over the 'regulations' corpus (Supabase RPC or local index). Returns JSON rows. Leave ef_search (HNSW) and probes (IVFFlat) unset unless asked for higher recall (e.g. ef_search=200, probes=16)."""
+    from RAG.backends import get_backend
+    from RAG.embedding_cache import get_embeddings
+
+    params = {"match_count": match_count, "hybrid": _hybrid_index() is not None}
+    search = _search_params(ef_search, probes)
+    params.update(search)
+    cache, generation, value, vector = _cached("match_regulations", query, params, corpus_bound=True)
+    if value is not None:
+        return value
+    if vector is None:
+        vector = get_embeddings().embed_query(query)
+    index = _hybrid_index()
+    candidates = match_count * 2 if index else match_count
+    rows = get_backend().match(vector, match_count=candidates, filter={"corpus": "regulations"}, **search)
+    value = json.dumps(_fuse(query, rows, index, match_count))
+    if cache is not None:
+        cache.put("match_regulations", query, value, params, vector, generation)
+    return value
+
+
+async def amatch_regulations(
+    query: str, match_count: int = 5, ef_search: Optional[int] = None, probes: Optional[int] = None
+) -> str:
+    """Semantic search over the 'regulations' corpus (Supabase RPC or local index). Returns JSON rows. Leave ef_search (HNSW) and probes (IVFFlat) unset unless asked for higher recall (e.g. ef_search=200, probes=16)."""
+    from RAG.backends import get_backend
+    from RAG.embedding_cache import get_embeddings
+
+    params = {"match_count": match_count, "hybrid": _hybrid_index() is not None}
+    search = _search_params(ef_search, probes)
+    params.update(search)
+    cache, generation, value, vector = await _acached("match_regulations", query, params, corpus_bound=True)
+    if value is not None:
+        return value
+    if vector is None:
+        vector = await get_embeddings().aembed_query(query)
+    index = _hybrid_index()
+    candidates = match_count * 2 if index else match_count
+    rows = await get_backend().amatch(vector, match_count=candidates, filter={"corpus": "regulations"}, **search)
+    value = json.dumps(_fuse(query, rows, index, match_count))
+    if cache is not None:
+        cache.put("match_regulations", query, value, params, vector, generation)
+    return value
+
+
+# Batched retrieval: several queries cost one embeddings request and one
+# backend round trip (RPC match_documents_oag_compliance_many / one matrix
+# product locally). Per-query results share the match_regulations cache entries.
+def _many_cached(queries: List[str], params: dict):
+    """(cache, generation, {query: cached value or None}) for the distinct, non-empty queries."""
+    from RAG.manifest import corpus_generation
+    from RAG.result_cache import get_result_cache
+
+    cache = get_result_cache()
+    generation = corpus_generation() if cache is not None else None
+    results = {q: cache.get("match_regulations", q, params, generation) if cache else None for q in queries}
+    return cache, generation, results
+
+
+def _many_pending(cache, generation, params: dict, results: dict, missing: List[str], vectors) -> list:
+    """Semantic cache hits for the embedded misses; returns [(query, vector)] still to match."""
+    pending = []
+    for query, vector in zip(missing, vectors):
+        hit = cache.get_similar("match_regulations", vector, params, generation) if cache else None
+        if hit is not None:
+            results[query] = hit
+        else:
+            pending.append((query, vector))
+    return pending
+
+
+def _many_store(cache, generation, params: dict, results: dict, pending: list, batches, index, match_count: int) -> None:
+    for (query, vector), rows in zip(pending, batches):
+        results[query] = json.dumps(_fuse(query, rows, index, match_count))
+        if cache is not None:
+            cache.put("match_regulations", query, results[query], params, vector, generation)
+
+
+def _dedupe_queries(queries: List[str], per_query: List[list]) -> List[dict]:
+    """
+    [{'query', 'rows'}]: a passage matched by several queries is listed once,
+    under the query that ranks it highest (ties: the earlier query); every row
+    carries 'queries', all the queries that matched it.
+    """
+    best, matched = {}, {}
+    for qi, rows in enumerate(per_query):
+        for rank, row in enumerate(rows):
+            key = _passage_key(row)
+            matched.setdefault(key, []).append(queries[qi])
+            best[key] = min(best.get(key, (rank, qi)), (rank, qi))
+    return [
+        {
+            "query": query,
+            "rows": [{**row, "queries": matched[_passage_key(row)]} for row in rows if best[_passage_key(row)][1] == qi],
+        }
+        for qi, (query, rows) in enumerate(zip(queries, per_query))
+    ]
+
+
+def match_regulations_many(
+    queries: List[str], match_count: int = 5, ef_search: Optional[int] = None, probes: Optional[int] = None
+) -> str:
+    """Semantic search over the 'regulations' corpus for several queries in one call (one embedding request, one database round trip); prefer it to repeated match_regulations calls. Returns JSON [{query, rows}]; a passage matched by several queries appears once, under its best query, with all matching queries in 'queries'. ef_search / probes as in match_regulations."""
+    from RAG.backends import get_backend
+    from RAG.embedding_cache import get_embeddings
+
+    queries = list(dict.fromkeys(q for q in queries if q.strip()))
+    params = {"match_count": match_count, "hybrid": _hybrid_index() is not None}
+    search = _search_params(ef_search, probes)
+    params.update(search)
+    cache, generation, results = _many_cached(queries, params)
+    missing = [q for q in queries if results[q] is None]
+    if missing:
+        vectors = get_embeddings().embed_documents(missing)
+        pending = _many_pending(cache, generation, params, results, missing, vectors)
+        if pending:
+            index = _hybrid_index()
+            candidates = match_count * 2 if index else match_count
+            batches = get_backend().match_many(
+                [v for _, v in pending], match_count=candidates, filter={"corpus": "regulations"}, **search
+            )
+            _many_store(cache, generation, params, results, pending, batches, index, match_count)
+    return json.dumps(_dedupe_queries(queries, [json.loads(results[q]) for q in queries]))
+
+
+async def amatch_regulations_many(
+    queries: List[str], match_count: int = 5, ef_search: Optional[int] = None, probes: Optional[int] = None
+) -> str:
+    """Semantic search over the 'regulations' corpus for several queries in one call (one embedding request, one database round trip); prefer it to repeated match_regulations calls. Returns JSON [{query, rows}]; a passage matched by several queries appears once, under its best query, with all matching queries in 'queries'. ef_search / probes as in match_regulations."""
+    from RAG.backends import get_backend
+    from RAG.embedding_cache import get_embeddings
+
+    queries = list(dict.fromkeys(q for q in queries if q.strip()))
+    params = {"match_count": match_count, "hybrid": _hybrid_index() is not None}
+    search = _search_params(ef_search, probes)
+    params.update(search)
+    cache, generation, results = _many_cached(queries, params)
+    missing = [q for q in queries if results[q] is None]
+    if missing:
+        vectors = await get_embeddings().aembed_documents(missing)
+        pending = _many_pending(cache, generation, params, results, missing, vectors)
+        if pending:
+            index = _hybrid_index()
+            candidates = match_count * 2 if index else match_count
+            batches = await get_backend().amatch_many(
+                [v for _, v in pending], match_count=candidates, filter={"corpus": "regulations"}, **search
+            )
+            _many_store(cache, generation, params, results, pending, batches, index, match_count)
+    return json.dumps(_dedupe_queries(queries, [json.loads(results[q]) for q in queries]))
+
+
+def lookup_citation(citation: str, max_chunks: int = 8) -> str:
+    """Exact regulation text for a citation such as 'SOR/2018-66, Section 8(1)' or 'Directive 060, Section 3.2'. Returns JSON rows."""
+    from RAG.citations import get_citation_index
+
+    rows = get_citation_index().lookup(citation, max_chunks=max_chunks)
+    if not rows:
+        return json.dumps({"error": f"No indexed section matches {citation!r}; use match_regulations instead."})
+    return json.dumps(rows)
+
+
+async def alookup_citation(citation: str, max_chunks: int = 8) -> str:
+    """Exact regulation text for a citation such as 'SOR/2018-66, Section 8(1)' or 'Directive 060, Section 3.2'. Returns JSON rows."""
+    return lookup_citation(citation, max_chunks)
+
+
+@lru_cache(maxsize=None)
+def get_tools() -> dict:
+    from langchain_core.tools import StructuredTool
+
+    return {
+        fn.__name__: StructuredTool.from_function(func=fn, coroutine=afn)
+        for fn, afn in (
+            (web_search, aweb_search),
+            (match_regulations, amatch_regulations),
+            (match_regulations_many, amatch_regulations_many),
+            (lookup_citation, alookup_citation),
+        )
+    }
+
+# ---------------- Agents 2–5 ----------------
+
+# 2) Web Search agent (uses Tavily tool)
+@lru_cache(maxsize=None)
+def get_web_search_agent():
+    return _react_agent("web_search_agent", [get_tools()["web_search"]], WEB_SEARCH_PROMPT)
+
+
+# 3) Compliance Retriever agent (uses Supabase RPC tool)
+@lru_cache(maxsize=None)
+def get_compliance_retriever_agent():
+    tools = get_tools()
+    return _react_agent(
+        "compliance_retriever_agent",
+        [tools["lookup_citation"], tools["match_regulations"], tools["match_regulations_many"]],
+        RETRIEVER_PROMPT,
+    )
+
+
+# 4) Gap Analyzer agent (no tools)
+@lru_cache(maxsize=None)
+def get_gap_analyzer_agent():
+    return _react_agent("gap_analyzer_agent", [], GAP_ANALYZER_PROMPT)
+
+
+# 5) Report/Summary agent (no tools)
+@lru_cache(maxsize=None)
+def get_report_generator_agent():
+    return _react_agent("report_generator_agent", [], REPORT_GENERATOR_PROMPT)
+
+
+# ---------------- Supervisor Workflow (LangGraph-2025-2 style) ----------------
+@lru_cache(maxsize=None)
+def get_workflow():
+    from langgraph_supervisor import create_supervisor
+
+    from context_budget import compaction_hook
+
+    return create_supervisor(
+        agents=[
+            get_compliance_retriever_agent(),   # retrieve clauses
+            get_gap_analyzer_agent(),           # analyze gaps
+            get_report_generator_agent(),       # summarize and next actions
+            get_web_search_agent(),             # public web context
+        ],
+        model=get_model(),
+        prompt=SUPERVISOR_PROMPT,
+        pre_model_hook=compaction_hook("supervisor"),
+    )
+
 
 # Compile for Studio multi-node diagram (like LangGraph-2025-2)
-demo_app = workflow.compile()
-# Alias for minimal manifest (single entry: graph:agent)
-agent = demo_app
+# Both compiled graphs carry the local instrumentation handler (instrumentation.py)
+# as default config: per-node latency, LLM calls, tokens, tool calls, cache hits.
+@lru_cache(maxsize=None)
+def get_agent():
+    from instrumentation import instrumented
+
+    return instrumented(get_workflow().compile(name="agent"))
+
+
+# ---------------- Deterministic Pipeline ----------------
+# Fixed retriever → gap analyzer → report path for triage requests; saves the
+# supervisor's routing call on every hop and runs the retrieval concurrently.
+PIPELINE_TOPICS = {
+    "ldar": "leak detection and repair (LDAR) survey frequency and repair deadlines",
+    "pneumatics": "pneumatic controllers and high-bleed device emission limits",
+    "venting_flaring": "venting limits, flaring, flare routing and vapour recovery requirements",
+    "water": "produced water spills, releases, notification and disposal requirements",
+}
+TRIAGE_REQUEST_MARKER = "Analyze this inspection report"
+# Set by gap_analysis.format_findings: the request already carries the
+# map-reduced gaps and passages for the whole report, so only the report runs.
+MAPPED_FINDINGS_MARKER = "Findings from every section of the report"
+
+
+@lru_cache(maxsize=None)
+def _pipeline_state():
+    """State schema, built on first use (add_messages pulls in langchain_core)."""
+    from langgraph.graph.message import add_messages
+
+    class PipelineState(TypedDict, total=False):
+        messages: Annotated[list, add_messages]
+        document: str
+        passages: Annotated[List[dict], operator.add]
+        context: str
+        gaps: str
+        llm_calls: Annotated[int, operator.add]
+
+    return PipelineState
+
+
+def _pipeline_request(state) -> Optional[str]:
+    """The triage request text, or None for free-form requests (supervisor fallback)."""
+    if state.get("document"):
+        return state["document"]
+    humans = [m for m in state.get("messages", []) if getattr(m, "type", "") == "human"]
+    if humans and TRIAGE_REQUEST_MARKER in humans[-1].content:
+        return humans[-1].content
+    return None
+
+
+def _route_request(state):
+    from langgraph.types import Send
+
+    request = _pipeline_request(state)
+    if request is None:
+        return "supervisor"
+    if MAPPED_FINDINGS_MARKER in request:
+        return "report_generator_agent"
+    match_count = int(os.getenv("PIPELINE_MATCH_COUNT", 5))
+    return [
+        Send("compliance_retriever_agent", {"topic": topic, "query": query, "match_count": match_count})
+        for topic, query in PIPELINE_TOPICS.items()
+    ]
+
+
+def _retrieve_topic(branch: dict) -> dict:
+    rows = json.loads(match_regulations(branch["query"], branch["match_count"]))
+    return {"passages": [{**row, "topic": branch["topic"]} for row in rows]}
+
+
+def _passage_key(row: dict) -> str:
+    from RAG.embedding_cache import text_key
+
+    return str(row.get("id") or text_key(row.get("content", "")))
+
+
+def merge_passages(state) -> dict:
+    """Dedupe across topics (keep best similarity, remember every topic) and cap the context."""
+    merged = {}
+    for row in state.get("passages", []):
+        key = _passage_key(row)
+        best = merged.get(key)
+        if best is None:
+            merged[key] = {**row, "topics": [row["topic"]]}
+            continue
+        if row["topic"] not in best["topics"]:
+            best["topics"].append(row["topic"])
+        if row.get("similarity", 0) > best.get("similarity", 0):
+            merged[key] = {**row, "topics": best["topics"]}
+    ranked = sorted(merged.values(), key=lambda r: r.get("similarity", 0), reverse=True)
+    ranked = ranked[: int(os.getenv("PIPELINE_MAX_PASSAGES", 12))]
+    lines = []
+    for i, row in enumerate(ranked, 1):
+        meta = row.get("metadata") or {}
+        ref = ", ".join(str(v) for v in (meta.get("source_pdf") or meta.get("source"), meta.get("page")) if v is not None)
+        lines.append(f"[{i}] ({ref}; topics: {', '.join(row['topics'])}) {row.get('content', '')}")
+    return {"context": "\n\n".join(lines) or "No regulatory passages found."}
+
+
+def _llm_step(prompt: str, name: str, content: str):
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    reply = get_model().invoke([SystemMessage(content=prompt), HumanMessage(content=content)])
+    reply.name = name
+    return reply
+
+
+def _analyze_gaps(state) -> dict:
+    request = _pipeline_request(state)
+    reply = _llm_step(
+        GAP_ANALYZER_PROMPT,
+        "gap_analyzer_agent",
+        f"{request}\n\nRetrieved regulatory passages:\n{state['context']}",
+    )
+    return {"gaps": reply.content, "llm_calls": 1}
+
+
+def _generate_report(state) -> dict:
+    parts = [_pipeline_request(state)]
+    if state.get("context"):
+        parts.append(f"Retrieved regulatory passages:\n{state['context']}")
+    if state.get("gaps"):
+        parts.append(f"Gap analysis:\n{state['gaps']}")
+    reply = _llm_step(REPORT_GENERATOR_PROMPT, "report_generator_agent", "\n\n".join(parts))
+    return {"messages": [reply], "llm_calls": 1}
+
+
+def _supervisor_fallback(state) -> dict:
+    result = get_agent().invoke({"messages": state["messages"]})
+    return {"messages": result["messages"][len(state["messages"]):]}
+
+
+@lru_cache(maxsize=None)
+def get_pipeline():
+    from langgraph.graph import END, START, StateGraph
+
+    from instrumentation import instrumented
+
+    builder = StateGraph(_pipeline_state())
+    builder.add_node("compliance_retriever_agent", _retrieve_topic)
+    builder.add_node("merge_passages", merge_passages)
+    builder.add_node("gap_analyzer_agent", _analyze_gaps)
+    builder.add_node("report_generator_agent", _generate_report)
+    builder.add_node("supervisor", _supervisor_fallback)
+    builder.add_conditional_edges(
+        START, _route_request, ["compliance_retriever_agent", "report_generator_agent", "supervisor"]
+    )
+    builder.add_edge("compliance_retriever_agent", "merge_passages")
+    builder.add_edge("merge_passages", "gap_analyzer_agent")
+    builder.add_edge("gap_analyzer_agent", "report_generator_agent")
+    builder.add_edge("report_generator_agent", END)
+    builder.add_edge("supervisor", END)
+    return instrumented(builder.compile(name="pipeline"))
+
+
+def get_analysis_graph():
+    """Graph used by the triage flow: ANALYSIS_GRAPH=pipeline selects the deterministic pipeline."""
+    return get_pipeline() if os.getenv("ANALYSIS_GRAPH", "supervisor") == "pipeline" else get_agent()
+
+
+# ---------------- Checkpoints ----------------
+# Triage runs are checkpointed per document (thread_id = document hash, see
+# triage.py), so an interrupted analysis resumes from the last completed node.
+# The exported graphs stay checkpointer-free: LangGraph Studio / the LangGraph
+# server bring their own persistence.
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    """Local SQLite checkpointer, or None (ANALYSIS_CHECKPOINTS=0, or langgraph-checkpoint-sqlite missing)."""
+    if os.getenv("ANALYSIS_CHECKPOINTS", "1") == "0":
+        return None
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError:
+        print("[graph] langgraph-checkpoint-sqlite is not installed; analysis runs will not be resumable")
+        return None
+    import sqlite3
+
+    return SqliteSaver(sqlite3.connect(_checkpoint_path(), check_same_thread=False))
+
+
+def _checkpoint_path() -> str:
+    from pathlib import Path
+
+    path = os.getenv("ANALYSIS_CHECKPOINT_PATH", ".cache/checkpoints.sqlite3")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def with_checkpointer(compiled_graph):
+    """The same compiled graph with the local checkpointer attached (unchanged when checkpoints are off)."""
+    checkpointer = get_checkpointer()
+    return compiled_graph if checkpointer is None else compiled_graph.copy(update={"checkpointer": checkpointer})
+
+
+@asynccontextmanager
+async def async_checkpointer():
+    """
+    Checkpointer for one async run, or None. SqliteSaver has no async methods,
+    so an AsyncSqliteSaver is opened on the same file for the duration of the
+    run (its connection belongs to the running loop); other savers are used as is.
+    """
+    checkpointer = get_checkpointer()
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        yield checkpointer
+        return
+    if not isinstance(checkpointer, SqliteSaver):
+        yield checkpointer
+        return
+    async with AsyncSqliteSaver.from_conn_string(_checkpoint_path()) as saver:
+        yield saver
+
 
 # ---------------- Exports ----------------
-# Keep single-agent Yes/No entry (if you want to demo it separately later)
-app = filter_agent
+# demo_app/agent: compiled supervisor (minimal manifest entry is graph:agent)
+# pipeline: deterministic fan-out retrieval → gap analysis → report
+# app: single-agent Yes/No entry (if you want to demo it separately later)
+_LAZY_EXPORTS = {
+    "model": get_model,
+    "filter_agent": get_filter_agent,
+    "web_search_agent": get_web_search_agent,
+    "compliance_retriever_agent": get_compliance_retriever_agent,
+    "gap_analyzer_agent": get_gap_analyzer_agent,
+    "report_generator_agent": get_report_generator_agent,
+    "workflow": get_workflow,
+    "demo_app": get_agent,
+    "agent": get_agent,
+    "pipeline": get_pipeline,
+    "app": get_filter_agent,
+}
+
+
+def __getattr__(name: str):
+    factory = _LAZY_EXPORTS.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return factory()
 
 
 # Utility function for Streamlit app
 def evaluate_document_theme(text: str) -> str:
-    """Filter agent: returns 'Yes' or 'No' for compliance relevance."""
-    state = {"messages": [HumanMessage(content=text)]}
-    res = filter_agent.invoke(state)
+    """Returns 'Yes' or 'No' for compliance relevance.
+
+    Clear cases are decided by the local pre-classifier (prefilter.py); only
+    ambiguous documents reach the filter agent, with a bounded sample of the text.
+    """
+    from langchain_core.messages import HumanMessage
+
+    from prefilter import get_classifier, representative_sample
+
+    decision = get_classifier().classify(text)
+    if decision["label"] is not None:
+        return decision["label"]
+    sample = representative_sample(text, int(os.getenv("PREFILTER_SAMPLE_CHARS", 6000)))
+    state = {"messages": [HumanMessage(content=sample)]}
+    res = get_filter_agent().invoke(state)
     return res["messages"][-1].content
@@ -0,0 +1,417 @@
+# instrumentation.py
+"""
+Local, SaaS-free instrumentation for the agent graphs.
+- GraphInstrumentation is a LangChain callback handler attached to the compiled
+  graphs (graph.get_agent(), graph.get_pipeline()) as default config, so every
+  invoke/stream is measured, including the LangGraph server entry points.
+- Per root run it records wall time, and per agent node: wall time, LLM calls,
+  prompt/completion tokens, tool calls; per tool: calls, seconds, errors; and the
+  embedding / tool-result cache hits observed during the run.
+- Context compaction (context_budget.py) is reported per node and per run:
+  history tokens before / after the agents' budgets and the time it took.
+  Nested nodes (a ReAct agent's own 'agent'/'tools' steps) are attributed to the
+  top-level node that contains them.
+- Exports: one JSON line per run (GRAPH_METRICS_JSONL), Prometheus text
+  exposition written to a file after each run (GRAPH_METRICS_PROM) and
+  optionally served over HTTP at /metrics (GRAPH_METRICS_PORT).
+
+Cache hits are read from the process-wide caches' counters, so runs that overlap
+in time share them.
+
+Environment variables (all optional):
+  GRAPH_METRICS_DISABLED  '1' to skip instrumentation
+  GRAPH_METRICS_JSONL     default '.cache/graph_metrics.jsonl' ('' disables)
+  GRAPH_METRICS_PROM      default '.cache/graph_metrics.prom'  ('' disables)
+  GRAPH_METRICS_PORT      serve /metrics on this port (default: off)
+
+Usage (from src/): summarize recorded runs, slowest nodes and token hogs first
+  python instrumentation.py --jsonl .cache/graph_metrics.jsonl
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_JSONL_PATH = ".cache/graph_metrics.jsonl"
+DEFAULT_PROM_PATH = ".cache/graph_metrics.prom"
+
+
+def _agent_of(metadata: Optional[dict]) -> Optional[str]:
+    """Top-level graph node a run belongs to (first checkpoint namespace segment)."""
+    metadata = metadata or {}
+    ns = metadata.get("langgraph_checkpoint_ns") or ""
+    if ns:
+        return ns.split("|")[0].split(":")[0]
+    return metadata.get("langgraph_node")
+
+
+def _usage(response) -> Dict[str, int]:
+    """Prompt/completion tokens from an LLMResult (message usage_metadata or llm_output)."""
+    for generations in response.generations or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return {"prompt": usage.get("input_tokens", 0), "completion": usage.get("output_tokens", 0)}
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return {"prompt": usage.get("prompt_tokens", 0), "completion": usage.get("completion_tokens", 0)}
+
+
+def _cache_counters() -> Dict[str, int]:
+    """Current hit/miss counters of the caches that already exist in this process."""
+    counters: Dict[str, int] = {}
+    from RAG.embedding_cache import get_embedding_cache
+    from RAG.result_cache import get_result_cache
+
+    if get_embedding_cache.cache_info().currsize:
+        cache = get_embedding_cache()
+        counters["embedding_hit"], counters["embedding_miss"] = cache.hits, cache.misses
+    if get_result_cache.cache_info().currsize and get_result_cache() is not None:
+        stats = get_result_cache().stats()
+        counters["tool_result_hit"] = stats["exact_hits"]
+        counters["tool_result_semantic_hit"] = stats["semantic_hits"]
+        counters["tool_result_miss"] = stats["misses"]
+    return counters
+
+
+def _empty_node() -> Dict[str, float]:
+    return {
+        "runs": 0, "wall_s": 0.0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "tool_calls": 0,
+        "compactions": 0, "context_tokens_before": 0, "context_tokens_after": 0, "compaction_s": 0.0,
+    }
+
+
+def _context_totals(nodes: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """Compaction totals over nodes: tokens before / after / saved and seconds."""
+    before = sum(n.get("context_tokens_before", 0) for n in nodes.values())
+    after = sum(n.get("context_tokens_after", 0) for n in nodes.values())
+    return {
+        "compactions": sum(n.get("compactions", 0) for n in nodes.values()),
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": before - after,
+        "saved_ratio": round((before - after) / before, 4) if before else 0.0,
+        "compaction_s": round(sum(n.get("compaction_s", 0.0) for n in nodes.values()), 6),
+    }
+
+
+class MetricsRegistry:
+    """Cumulative counters over finished runs, rendered as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.graphs: Dict[str, Dict[str, float]] = {}
+        self.nodes: Dict[str, Dict[str, float]] = {}
+        self.tools: Dict[str, Dict[str, float]] = {}
+        self.cache: Dict[str, int] = {}
+
+    def observe(self, record: Dict[str, object]) -> None:
+        with self._lock:
+            graph = self.graphs.setdefault(record["graph"], {"runs": 0, "wall_s": 0.0, "errors": 0})
+            graph["runs"] += 1
+            graph["wall_s"] += record["wall_s"]
+            graph["errors"] += 1 if record.get("error") else 0
+            for name, node in record["nodes"].items():
+                total = self.nodes.setdefault(name, _empty_node())
+                for key, value in node.items():
+                    total[key] += value
+            for name, tool in record["tools"].items():
+                total = self.tools.setdefault(name, {"calls": 0, "wall_s": 0.0, "errors": 0})
+                for key, value in tool.items():
+                    total[key] += value
+            for key, value in record["cache"].items():
+                self.cache[key] = self.cache.get(key, 0) + value
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {round(value, 6)}")
+
+        with self._lock:
+            metric("graph_runs_total", "counter", "Finished graph runs.",
+                   [({"graph": g}, v["runs"]) for g, v in self.graphs.items()])
+            metric("graph_run_errors_total", "counter", "Graph runs that raised.",
+                   [({"graph": g}, v["errors"]) for g, v in self.graphs.items()])
+            metric("graph_run_seconds_total", "counter", "Wall time of graph runs.",
+                   [({"graph": g}, v["wall_s"]) for g, v in self.graphs.items()])
+            metric("graph_node_runs_total", "counter", "Top-level node executions.",
+                   [({"node": n}, v["runs"]) for n, v in self.nodes.items()])
+            metric("graph_node_seconds_total", "counter", "Wall time spent in each top-level node.",
+                   [({"node": n}, v["wall_s"]) for n, v in self.nodes.items()])
+            metric("graph_llm_calls_total", "counter", "Chat model calls per node.",
+                   [({"node": n}, v["llm_calls"]) for n, v in self.nodes.items()])
+            metric("graph_llm_tokens_total", "counter", "LLM tokens per node.",
+                   [({"node": n, "kind": kind}, v[f"{kind}_tokens"]) for n, v in self.nodes.items()
+                    for kind in ("prompt", "completion")])
+            metric("graph_context_tokens_total", "counter", "Agent history tokens before / after context compaction.",
+                   [({"node": n, "stage": stage}, v[f"context_tokens_{stage}"]) for n, v in self.nodes.items()
+                    for stage in ("before", "after")])
+            metric("graph_context_compaction_seconds_total", "counter", "Time spent compacting agent context.",
+                   [({"node": n}, v["compaction_s"]) for n, v in self.nodes.items()])
+            metric("graph_tool_calls_total", "counter", "Tool invocations.",
+                   [({"tool": t}, v["calls"]) for t, v in self.tools.items()])
+            metric("graph_tool_seconds_total", "counter", "Wall time spent in each tool.",
+                   [({"tool": t}, v["wall_s"]) for t, v in self.tools.items()])
+            metric("graph_tool_errors_total", "counter", "Tool invocations that raised.",
+                   [({"tool": t}, v["errors"]) for t, v in self.tools.items()])
+            metric("graph_cache_events_total", "counter", "Embedding / tool-result cache events during graph runs.",
+                   [({"cache": k.rsplit("_", 1)[0], "event": k.rsplit("_", 1)[1]}, v) for k, v in self.cache.items()])
+        return "\n".join(lines) + "\n"
+
+
+class GraphInstrumentation(BaseCallbackHandler):
+    """Callback handler measuring each root graph run; see module docstring."""
+
+    def __init__(
+        self,
+        jsonl_path: Optional[str] = DEFAULT_JSONL_PATH,
+        prom_path: Optional[str] = DEFAULT_PROM_PATH,
+        registry: Optional[MetricsRegistry] = None,
+    ):
+        self.jsonl_path = jsonl_path or None
+        self.prom_path = prom_path or None
+        self.registry = registry or MetricsRegistry()
+        self.records: List[Dict[str, object]] = []  # most recent runs, newest last
+        self.max_records = 100
+        self._lock = threading.Lock()
+        self._runs: Dict[UUID, Dict[str, object]] = {}   # root run id -> in-flight record
+        self._root: Dict[UUID, UUID] = {}                  # any run id -> root run id
+        self._open: Dict[UUID, tuple] = {}                 # node/llm/tool run id -> (kind, name, agent, started)
+
+    # ---- run tree bookkeeping ----
+    def _root_of(self, run_id: UUID, parent_run_id: Optional[UUID]) -> Optional[UUID]:
+        root = self._root.get(parent_run_id) if parent_run_id else None
+        if root is not None:
+            self._root[run_id] = root
+        return root
+
+    def _node(self, root: UUID, agent: Optional[str]) -> Dict[str, float]:
+        return self._runs[root]["nodes"].setdefault(agent or "graph", _empty_node())
+
+    # ---- chains: root runs and top-level nodes ----
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, name=None, **kwargs):
+        with self._lock:
+            if parent_run_id is None:
+                self._root[run_id] = run_id
+                self._runs[run_id] = {
+                    "run_id": str(run_id),
+                    "graph": name or (serialized or {}).get("name") or "graph",
+                    "started_at": time.time(),
+                    "_t0": time.perf_counter(),
+                    "_cache0": _cache_counters(),
+                    "nodes": {},
+                    "tools": {},
+                }
+                return
+            root = self._root_of(run_id, parent_run_id)
+            if root is not None and parent_run_id == root and name and not name.startswith("__"):
+                self._open[run_id] = ("node", name, name, time.perf_counter())  # top-level node task
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id, error=None)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    # ---- LLM calls ----
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_leaf("llm", run_id, parent_run_id, metadata, None)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_leaf("llm", run_id, parent_run_id, metadata, None)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+            root = self._root.pop(run_id, None)
+            if opened is None or root not in self._runs:
+                return
+            node = self._node(root, opened[2])
+            usage = _usage(response)
+            node["llm_calls"] += 1
+            node["prompt_tokens"] += usage["prompt"]
+            node["completion_tokens"] += usage["completion"]
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+            root = self._root.pop(run_id, None)
+            if opened is not None and root in self._runs:
+                self._node(root, opened[2])["llm_calls"] += 1
+
+    # ---- context compaction (context_budget.py) ----
+    def on_custom_event(self, name, data, *, run_id, tags=None, metadata=None, **kwargs):
+        from context_budget import COMPACTION_EVENT
+
+        if name != COMPACTION_EVENT:
+            return
+        with self._lock:
+            root = self._root.get(run_id)
+            if root not in self._runs:
+                return
+            node = self._node(root, _agent_of(metadata) or data.get("agent"))
+            node["compactions"] += 1
+            node["context_tokens_before"] += data.get("tokens_before", 0)
+            node["context_tokens_after"] += data.get("tokens_after", 0)
+            node["compaction_s"] = round(node["compaction_s"] + data.get("seconds", 0.0), 6)
+
+    # ---- tools ----
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, name=None, **kwargs):
+        self._start_leaf("tool", run_id, parent_run_id, metadata, name or (serialized or {}).get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, failed=False)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, failed=True)
+
+    def _start_leaf(self, kind, run_id, parent_run_id, metadata, name) -> None:
+        with self._lock:
+            if self._root_of(run_id, parent_run_id) is not None:
+                self._open[run_id] = (kind, name, _agent_of(metadata), time.perf_counter())
+
+    def _end_tool(self, run_id: UUID, failed: bool) -> None:
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+            root = self._root.pop(run_id, None)
+            if opened is None or root not in self._runs:
+                return
+            _, name, agent, started = opened
+            self._node(root, agent)["tool_calls"] += 1
+            tool = self._runs[root]["tools"].setdefault(name or "tool", {"calls": 0, "wall_s": 0.0, "errors": 0})
+            tool["calls"] += 1
+            tool["wall_s"] = round(tool["wall_s"] + time.perf_counter() - started, 6)
+            tool["errors"] += 1 if failed else 0
+
+    def _end(self, run_id: UUID, error) -> None:
+        record = None
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+            root = self._root.pop(run_id, None)
+            if opened is not None and root in self._runs:
+                node = self._node(root, opened[1])
+                node["runs"] += 1
+                node["wall_s"] = round(node["wall_s"] + time.perf_counter() - opened[3], 6)
+            if root == run_id and run_id in self._runs:
+                record = self._runs.pop(run_id)
+                self._root = {k: v for k, v in self._root.items() if v != run_id}
+        if record is not None:
+            self._finish(record, error)
+
+    def _finish(self, record: Dict[str, object], error) -> None:
+        record["wall_s"] = round(time.perf_counter() - record.pop("_t0"), 6)
+        before, after = record.pop("_cache0"), _cache_counters()
+        record["cache"] = {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0)}
+        record["error"] = repr(error) if error else None
+        record["context"] = _context_totals(record["nodes"])
+        self.registry.observe(record)
+        with self._lock:
+            self.records = (self.records + [record])[-self.max_records:]
+        self.export(record)
+
+    # ---- exporters ----
+    def export(self, record: Dict[str, object]) -> None:
+        if self.jsonl_path:
+            Path(self.jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        if self.prom_path:
+            Path(self.prom_path).parent.mkdir(parents=True, exist_ok=True)
+            tmp = f"{self.prom_path}.tmp"
+            with self._lock:
+                Path(tmp).write_text(self.registry.to_prometheus(), encoding="utf-8")
+                os.replace(tmp, self.prom_path)
+
+
+def serve_metrics(registry: MetricsRegistry, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve Prometheus text at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="graph-metrics", daemon=True).start()
+    print(f"[metrics] Serving Prometheus metrics on :{port}/metrics")
+    return server
+
+
+@lru_cache(maxsize=None)
+def get_instrumentation() -> Optional[GraphInstrumentation]:
+    """Process-wide handler, or None when GRAPH_METRICS_DISABLED=1."""
+    if os.getenv("GRAPH_METRICS_DISABLED", "0") == "1":
+        return None
+    handler = GraphInstrumentation(
+        jsonl_path=os.getenv("GRAPH_METRICS_JSONL", DEFAULT_JSONL_PATH),
+        prom_path=os.getenv("GRAPH_METRICS_PROM", DEFAULT_PROM_PATH),
+    )
+    if os.getenv("GRAPH_METRICS_PORT"):
+        serve_metrics(handler.registry, int(os.getenv("GRAPH_METRICS_PORT")))
+    return handler
+
+
+def instrumented(compiled_graph):
+    """Attach the process-wide handler to a compiled graph as default config (stays a graph)."""
+    handler = get_instrumentation()
+    return compiled_graph if handler is None else compiled_graph.with_config(callbacks=[handler])
+
+
+def summarize(records: List[Dict[str, object]]) -> Dict[str, object]:
+    """Per-node and per-tool totals over recorded runs, sorted slowest first."""
+    registry = MetricsRegistry()
+    for record in records:
+        registry.observe(record)
+    nodes = sorted(registry.nodes.items(), key=lambda kv: kv[1]["wall_s"], reverse=True)
+    tools = sorted(registry.tools.items(), key=lambda kv: kv[1]["wall_s"], reverse=True)
+    return {
+        "runs": len(records), "graphs": registry.graphs, "nodes": dict(nodes), "tools": dict(tools),
+        "cache": registry.cache, "context": _context_totals(registry.nodes),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize recorded graph runs (JSONL).")
+    parser.add_argument("--jsonl", default=os.getenv("GRAPH_METRICS_JSONL", DEFAULT_JSONL_PATH))
+    args = parser.parse_args()
+
+    lines = Path(args.jsonl).read_text(encoding="utf-8").splitlines() if Path(args.jsonl).exists() else []
+    summary = summarize([json.loads(line) for line in lines if line.strip()])
+    print(f"[metrics] {summary['runs']} run(s)")
+    for name, node in summary["nodes"].items():
+        print(
+            f"[metrics]   {name:<30} {node['wall_s']:>9.2f}s  {node['llm_calls']:>4} LLM  "
+            f"{node['prompt_tokens']:>8} in / {node['completion_tokens']:>7} out tokens  {node['tool_calls']:>4} tools"
+        )
+    for name, tool in summary["tools"].items():
+        print(f"[metrics]   tool {name:<25} {tool['wall_s']:>9.2f}s  {tool['calls']:>4} calls  {tool['errors']} errors")
+    context = summary["context"]
+    if context["compactions"]:
+        print(
+            f"[metrics]   context {context['tokens_before']} -> {context['tokens_after']} tokens "
+            f"({context['saved_ratio']:.0%} saved) over {context['compactions']} model calls, {context['compaction_s']:.3f}s"
+        )
+    if summary["cache"]:
+        print(f"[metrics]   cache {summary['cache']}")
@@ -0,0 +1,291 @@
+# jobs.py
+"""
+Local background job subsystem for the Streamlit app.
+- JobStore: persistent queue in SQLite (survives browser refreshes and app restarts).
+  Job states: queued -> running -> done | rejected | failed.
+  Per-stage progress (triage.STAGES) is stored as JSON next to the job, plus a
+  live snapshot of the streamed analysis (active agent, hand-offs, partial text)
+  and the analysis timings (time-to-first-token, seconds per agent).
+- JobRunner: worker thread pool that claims queued jobs and runs triage.triage_document,
+  with per-provider concurrency limits (semaphores) around the external calls.
+- Jobs left 'running' by a crashed process are re-queued when a runner starts.
+
+Environment variables (all optional):
+  JOBS_DB_PATH          default '.cache/jobs.sqlite3'
+  JOBS_UPLOAD_DIR       default 'RAG/KnowledgeBase'  (one sub-folder per job)
+  JOBS_WORKERS          default 2
+  JOBS_LIMIT_GEMINI     default 2   concurrent stages calling Gemini
+  JOBS_LIMIT_OPENAI     default 4   concurrent stages calling OpenAI embeddings
+  JOBS_LIMIT_SUPABASE   default 4   concurrent stages writing to Supabase
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import nullcontext
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from triage import STAGES
+
+DEFAULT_DB_PATH = ".cache/jobs.sqlite3"
+DEFAULT_UPLOAD_DIR = "RAG/KnowledgeBase"
+PROVIDERS = ["gemini", "openai", "supabase"]
+FINAL_STATES = ("done", "rejected", "failed")
+
+
+class JobStore:
+    """SQLite-backed job queue. Safe to share between the UI and worker threads."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id         TEXT PRIMARY KEY,
+                name       TEXT NOT NULL,
+                pdf_path   TEXT NOT NULL,
+                state      TEXT NOT NULL,
+                stage      TEXT,
+                progress   TEXT NOT NULL,
+                relevance  TEXT,
+                report     TEXT,
+                error      TEXT,
+                live       TEXT,
+                timings    TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("live", "timings"):
+            if column not in columns:  # databases created before streaming support
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, created_at)")
+        self._conn.commit()
+
+    def submit(self, name: str, pdf_path: str, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        progress = {stage: {"status": "pending"} for stage in STAGES}
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, name, pdf_path, state, progress, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, name, pdf_path, json.dumps(progress), now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, object]]:
+        """Atomically move the oldest queued job to 'running' and return it."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET state = 'running', started_at = ?, updated_at = ? WHERE id = ?",
+                (now, now, row["id"]),
+            )
+            self._conn.commit()
+        return self.get(row["id"])
+
+    def update_stage(self, job_id: str, stage: str, status: str) -> None:
+        now = time.time()
+        with self._lock:
+            (raw,) = self._conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            progress = json.loads(raw)
+            entry = progress.setdefault(stage, {})
+            entry["status"] = status
+            if status == "running":
+                entry["started_at"] = now
+            elif "started_at" in entry:
+                entry["seconds"] = round(now - entry["started_at"], 2)
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ?",
+                (stage, json.dumps(progress), now, job_id),
+            )
+            self._conn.commit()
+
+    def update_live(self, job_id: str, live: Dict[str, object]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET live = ?, updated_at = ? WHERE id = ?", (json.dumps(live), time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def finish(
+        self,
+        job_id: str,
+        state: str,
+        relevance: str = None,
+        report: str = None,
+        error: str = None,
+        timings: Dict[str, object] = None,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, relevance = ?, report = ?, error = ?, timings = ?, updated_at = ? WHERE id = ?",
+                (state, relevance, report, error, json.dumps(timings) if timings else None, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def requeue_running(self) -> int:
+        """Return jobs interrupted mid-run (process exit) to the queue, resetting their progress."""
+        progress = json.dumps({stage: {"status": "pending"} for stage in STAGES})
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = 'queued', stage = NULL, progress = ?, live = NULL, updated_at = ? WHERE state = 'running'",
+                (progress, time.time()),
+            )
+            self._conn.commit()
+        return cur.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, object]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [_row_to_job(r) for r in rows]
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, object]:
+    job = dict(row)
+    job["progress"] = json.loads(job["progress"])
+    job["live"] = json.loads(job["live"]) if job["live"] else None
+    job["timings"] = json.loads(job["timings"]) if job["timings"] else None
+    done = sum(1 for s in job["progress"].values() if s["status"] in ("done", "skipped", "reused"))
+    job["fraction"] = done / len(job["progress"]) if job["progress"] else 0.0
+    return job
+
+
+class JobRunner:
+    """Worker pool draining a JobStore. `run_job(pdf_path, name, on_stage, limit, on_update)` does the work."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = 2,
+        limits: Optional[Dict[str, int]] = None,
+        run_job: Optional[Callable[..., Dict[str, object]]] = None,
+        poll_interval: float = 0.5,
+    ):
+        self.store = store
+        self.workers = max(1, workers)
+        self.limits = {p: max(1, n) for p, n in (limits or {}).items()}
+        self.semaphores = {p: threading.BoundedSemaphore(n) for p, n in self.limits.items()}
+        self.run_job = run_job
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def limit(self, provider: str):
+        """Context manager bounding concurrent calls to `provider` across all workers."""
+        return self.semaphores.get(provider) or nullcontext()
+
+    def start(self) -> "JobRunner":
+        if self._threads:
+            return self
+        requeued = self.store.requeue_running()
+        if requeued:
+            print(f"[jobs] Re-queued {requeued} interrupted job(s)")
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def notify(self) -> None:
+        """Wake idle workers after a submit instead of waiting for the next poll."""
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            job = self.store.claim()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, object]) -> None:
+        job_id = job["id"]
+        run_job = self.run_job
+        if run_job is None:
+            from triage import triage_document as run_job
+        try:
+            result = run_job(
+                job["pdf_path"],
+                job["name"],
+                on_stage=lambda stage, status: self.store.update_stage(job_id, stage, status),
+                limit=self.limit,
+                on_update=lambda live: self.store.update_live(job_id, live),
+            )
+        except Exception as exc:
+            print(f"[jobs] Job {job_id} ({job['name']}) failed: {exc}")
+            current = self.store.get(job_id)["stage"]
+            if current:
+                self.store.update_stage(job_id, current, "failed")
+            self.store.finish(job_id, "failed", error="".join(traceback.format_exception_only(type(exc), exc)).strip())
+            return
+        state = "done" if result.get("relevant") else "rejected"
+        self.store.finish(
+            job_id, state, relevance=result.get("relevance"), report=result.get("report"), timings=result.get("timings")
+        )
+
+
+def save_upload(name: str, data: bytes, upload_dir: Optional[str] = None) -> Dict[str, str]:
+    """Persist an uploaded PDF under its own job folder; returns {'job_id', 'pdf_path'}."""
+    job_id = uuid.uuid4().hex[:12]
+    folder = Path(upload_dir or os.getenv("JOBS_UPLOAD_DIR", DEFAULT_UPLOAD_DIR)) / job_id
+    folder.mkdir(parents=True, exist_ok=True)
+    pdf_path = folder / os.path.basename(name)
+    pdf_path.write_bytes(data)
+    return {"job_id": job_id, "pdf_path": str(pdf_path)}
+
+
+@lru_cache(maxsize=None)
+def get_job_store() -> JobStore:
+    return JobStore(os.getenv("JOBS_DB_PATH", DEFAULT_DB_PATH))
+
+
+@lru_cache(maxsize=None)
+def get_job_runner() -> JobRunner:
+    """Process-wide worker pool (started on first use)."""
+    limits = {p: int(os.getenv(f"JOBS_LIMIT_{p.upper()}", 2 if p == "gemini" else 4)) for p in PROVIDERS}
+    runner = JobRunner(get_job_store(), workers=int(os.getenv("JOBS_WORKERS", 2)), limits=limits)
+    return runner.start()
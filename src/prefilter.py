@@ -0,0 +1,258 @@
+# prefilter.py
+"""
+Tiered relevance classifier in front of the filter_agent LLM call.
+
+Tier 1 (local, milliseconds):
+- keyword/phrase scoring over the compliance topics from the filter prompt
+  (methane/VOC, LDAR, venting/flaring, spills/effluents/water, monitoring/reporting);
+- a small hashed-feature (unigram + bigram) logistic model trained at first
+  use on seed phrases for the same topics vs. off-topic text.
+Clear cases are decided locally: strong keyword evidence (or keywords plus a
+confident model) is a Yes, but only with oil & gas evidence (domain_score:
+specific emissions / LDAR / venting-flaring / spill phrases); no domain
+vocabulary at all is a No. Generic compliance wording (compliance, monitoring,
+reporting, operator, ...) fits any audit, so a document matching mostly that
+escalates. Only ambiguous documents escalate.
+
+Tier 2 (LLM): the filter agent gets a bounded, representative sample of the
+document (head, the most keyword-dense paragraphs, tail) instead of the full text.
+
+Decision-tier counters (local_yes / local_no / llm) are exposed by stats().
+
+Environment variables (all optional):
+  PREFILTER_MODE        'tiered' (default), 'local' (never escalate) or 'llm' (always escalate)
+  PREFILTER_YES         model probability for a local Yes (default 0.8)
+  PREFILTER_NO          model probability below which weak keyword evidence is a local No (default 0.2)
+  PREFILTER_DOMAIN_MIN  domain_score needed for a local Yes (default 2.0)
+  PREFILTER_SAMPLE_CHARS  max characters sent to the LLM (default 6000)
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+TOPIC_PHRASES: Dict[str, Dict[str, float]] = {
+    "emissions": {
+        "methane": 2.0, "voc": 1.5, "volatile organic": 1.5, "fugitive": 1.5, "ghg": 1.0,
+        "greenhouse gas": 1.0, "emission": 1.0, "pneumatic": 1.5, "high-bleed": 2.0, "low-bleed": 2.0,
+        "compressor": 0.5, "scf/hr": 1.5,
+    },
+    "ldar": {
+        "ldar": 2.5, "leak detection": 2.0, "leak survey": 2.0, "ogi": 1.0, "optical gas imaging": 2.0,
+        "repair": 0.5,
+    },
+    "venting_flaring": {
+        "venting": 2.0, "vent": 1.0, "flaring": 2.0, "flare": 1.5, "vapour recovery": 2.0,
+        "vapor recovery": 2.0, "vru": 1.5, "combustor": 1.0, "solution gas": 1.5,
+    },
+    "water_spills": {
+        "spill": 1.5, "produced water": 2.0, "effluent": 1.5, "discharge": 1.0, "release": 0.5,
+        "wastewater": 1.0, "disposal well": 1.5, "contamination": 1.0,
+    },
+    # Generic compliance vocabulary: counts toward the keyword score, never toward domain_score.
+    "reporting": {
+        "inspection report": 1.5, "compliance": 1.0, "non-compliance": 1.5, "directive 060": 2.5,
+        "directive 086": 2.0, "sor/2018-66": 2.5, "aer": 1.0, "regulation": 0.5, "monitoring": 0.5,
+        "reporting": 0.5, "corrective action": 1.0, "wellsite": 1.5, "battery": 0.5, "operator": 0.3,
+    },
+}
+
+DOMAIN_TOPICS = ("emissions", "ldar", "venting_flaring", "water_spills")
+
+POSITIVE_SEEDS = [
+    "methane emissions from pneumatic devices at the wellsite",
+    "voc emissions and fugitive leaks detected at the separator",
+    "ldar survey completed quarterly with optical gas imaging camera",
+    "leak detection and repair program records and repair deadlines",
+    "high-bleed pneumatic controllers replaced with low-bleed devices",
+    "tank venting volumes exceed the monthly limit and require flare routing",
+    "solution gas flaring and venting reported under aer directive 060",
+    "vapour recovery unit installed on storage tanks to reduce venting",
+    "flare stack combustion efficiency and flare volumes measured",
+    "produced water spill reported to the regulator with cleanup plan",
+    "effluent discharge to surface water and wastewater disposal well",
+    "release of hydrocarbons and produced water overflow at the battery",
+    "inspection report for facility compliance with sor/2018-66",
+    "emission monitoring and annual reporting obligations for operators",
+    "non-compliance findings and corrective actions at the gas plant",
+    "greenhouse gas reporting for upstream oil and gas facilities",
+    "compressor seal vent emissions and fugitive emission survey",
+    "groundwater contamination monitoring near the oil well pad",
+    "regulatory inspection of oil and gas wellsite equipment",
+    "methane regulations require surveys three times per year",
+]
+
+NEGATIVE_SEEDS = [
+    "the world cup final between argentina and france ended in penalties",
+    "lionel messi scored two goals in the championship match",
+    "quarterly earnings beat analyst expectations and the stock rose",
+    "the recipe calls for two cups of flour and a pinch of salt",
+    "our marketing team launched a new social media campaign",
+    "the hotel offers a pool spa and free breakfast for guests",
+    "the novel follows a detective solving a murder in london",
+    "software release notes describe new user interface features",
+    "the band announced a world tour with concerts in europe",
+    "students must submit their history essays by friday",
+    "the museum exhibit features renaissance paintings and sculpture",
+    "travel itinerary includes flights hotel and car rental",
+    "the basketball team won the playoff game in overtime",
+    "employee handbook vacation policy and dress code",
+    "the smartphone has a new camera and longer battery life",
+    "mortgage rates increased and housing sales slowed",
+    "the wedding reception will be held in the garden",
+    "weather forecast calls for sunshine and mild temperatures",
+    "the restaurant menu includes pasta pizza and dessert",
+    "customer support ticket about a forgotten password",
+]
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9/\-\.]*[a-z0-9]|[a-z0-9]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the their this to was were will with".split()
+)
+_DIM = 1 << 12
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _features(text: str) -> np.ndarray:
+    """Hashed unigram + bigram counts, sublinear tf, L2-normalized."""
+    tokens = [t for t in _tokens(text) if t not in _STOPWORDS]
+    vec = np.zeros(_DIM, dtype=np.float32)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=4).digest(), "little")
+        vec[h % _DIM] += 1.0
+    np.log1p(vec, out=vec)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def _train(epochs: int = 300, lr: float = 0.5, l2: float = 1e-3) -> Tuple[np.ndarray, float]:
+    positives = POSITIVE_SEEDS + [p for topic in TOPIC_PHRASES.values() for p in topic]
+    X = np.vstack([_features(t) for t in positives + NEGATIVE_SEEDS])
+    y = np.array([1.0] * len(positives) + [0.0] * len(NEGATIVE_SEEDS), dtype=np.float32)
+    w = np.zeros(_DIM, dtype=np.float32)
+    b = 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(X @ w + b)))
+        grad = p - y
+        w -= lr * (X.T @ grad / len(y) + l2 * w)
+        b -= lr * float(grad.mean())
+    return w, b
+
+
+def _topic_scores(text: str, topics=TOPIC_PHRASES, min_weight: float = 0.0) -> Dict[str, float]:
+    lowered = " " + " ".join(_tokens(text)) + " "
+    scores: Dict[str, float] = {}
+    for topic in topics:
+        score = 0.0
+        for phrase, weight in TOPIC_PHRASES[topic].items():
+            if weight < min_weight:
+                continue
+            hits = lowered.count(f" {phrase} ") + (lowered.count(f" {phrase}s ") if " " not in phrase else 0)
+            if hits:
+                score += weight * (1 + math.log(hits))
+        if score:
+            scores[topic] = round(score, 2)
+    return scores
+
+
+def keyword_score(text: str) -> Tuple[float, Dict[str, float]]:
+    """Weighted phrase hits per topic (repeats are log-damped). Returns (total, per-topic scores)."""
+    topics = _topic_scores(text)
+    return round(sum(topics.values()), 2), topics
+
+
+def domain_score(text: str) -> float:
+    """Keyword evidence from the oil & gas topics only, without generic words (weight below 1.0)."""
+    return round(sum(_topic_scores(text, DOMAIN_TOPICS, min_weight=1.0).values(), 0.0), 2)
+
+
+def representative_sample(text: str, max_chars: int = 6000) -> str:
+    """Head + most keyword-dense paragraphs + tail, in document order, within max_chars."""
+    if len(text) <= max_chars:
+        return text
+    paragraphs = [p for p in re.split(r"\n\s*\n|\n(?=[A-Z0-9])", text) if p.strip()]
+    budget = max_chars
+    head, tail = paragraphs[0][: max_chars // 4], paragraphs[-1][-(max_chars // 8):]
+    budget -= len(head) + len(tail)
+    ranked = sorted(
+        range(1, len(paragraphs) - 1),
+        key=lambda i: keyword_score(paragraphs[i])[0] / (1 + len(paragraphs[i]) / 500),
+        reverse=True,
+    )
+    chosen = []
+    for i in ranked:
+        if keyword_score(paragraphs[i])[0] <= 0 or len(paragraphs[i]) > budget:
+            continue
+        chosen.append(i)
+        budget -= len(paragraphs[i])
+    body = [paragraphs[i] for i in sorted(chosen)]
+    return "\n[...]\n".join([head, *body, tail])
+
+
+class TieredClassifier:
+    def __init__(
+        self, yes_threshold: float = 0.8, no_threshold: float = 0.2, mode: str = "tiered", domain_min: float = 2.0
+    ):
+        self.yes_threshold = yes_threshold
+        self.no_threshold = no_threshold
+        self.domain_min = domain_min
+        self.mode = mode
+        self.weights, self.bias = _train()
+        self.counts = {"local_yes": 0, "local_no": 0, "llm": 0}
+        self._lock = threading.Lock()
+
+    def probability(self, text: str) -> float:
+        z = float(_features(text) @ self.weights + self.bias)
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def classify(self, text: str) -> Dict[str, object]:
+        """Local decision: label 'Yes'/'No', or None when the LLM tier should decide."""
+        prob = self.probability(text)
+        kw_total, topics = keyword_score(text)
+        domain = domain_score(text)
+        label = None
+        if self.mode != "llm":
+            strong = (prob >= self.yes_threshold and kw_total >= 3.0) or (kw_total >= 10.0 and len(topics) >= 2)
+            if strong and domain >= self.domain_min:
+                label = "Yes"
+            elif (kw_total < 1.0 and prob < self.yes_threshold) or (kw_total < 3.0 and prob <= self.no_threshold):
+                label = "No"
+            elif self.mode == "local":
+                label = "Yes" if domain > 0 and (prob >= 0.5 or kw_total >= 3.0) else "No"
+        tier = "llm" if label is None else f"local_{label.lower()}"
+        self.record(tier)
+        return {
+            "label": label, "tier": tier, "probability": round(prob, 4), "keyword_score": kw_total,
+            "domain_score": domain, "topics": topics,
+        }
+
+    def record(self, tier: str) -> None:
+        with self._lock:
+            self.counts[tier] = self.counts.get(tier, 0) + 1
+
+    def stats(self) -> Dict[str, float]:
+        total = sum(self.counts.values())
+        return {**self.counts, "total": total, "escalation_rate": round(self.counts["llm"] / total, 4) if total else 0.0}
+
+
+@lru_cache(maxsize=None)
+def get_classifier() -> TieredClassifier:
+    return TieredClassifier(
+        yes_threshold=float(os.getenv("PREFILTER_YES", 0.8)),
+        no_threshold=float(os.getenv("PREFILTER_NO", 0.2)),
+        mode=os.getenv("PREFILTER_MODE", "tiered").lower(),
+        domain_min=float(os.getenv("PREFILTER_DOMAIN_MIN", 2.0)),
+    )
+
+
+def stats() -> Dict[str, float]:
+    return get_classifier().stats()
@@ -0,0 +1,94 @@
+# startup_profile.py
+"""
+Cold-start profile for the app entry points.
+- Each probe runs in a fresh interpreter with `-X importtime`, so already-imported
+  modules never hide the real cost.
+- Measures: `import graph`, building the compiled supervisor (get_agent()),
+  and importing the Streamlit script (bare mode, no server).
+- Reports the slowest top-level imports of each probe.
+- Writes a JSON report; --max-*-ms budgets make the run exit 1 on regression.
+
+Usage (from src/):
+  python startup_profile.py
+  python startup_profile.py --output .cache/startup_profile.json --max-import-ms 300 --max-app-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+SRC_DIR = Path(__file__).resolve().parent
+
+PROBES = {
+    "import_graph": "import graph",
+    "build_agent": "import graph; graph.get_agent()",
+    "import_streamlit_app": "import streamlit_app",
+}
+
+
+def _parse_importtime(stderr: str, top: int, preloaded=()) -> List[Dict[str, float]]:
+    """Top-level (directly imported) modules by cumulative import time."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue  # nested import; already counted in its parent's cumulative time
+        if name.strip() in preloaded:
+            continue  # interpreter bootstrap, not part of the probe
+        entries.append({"module": name.strip(), "ms": round(int(cumulative) / 1000, 1)})
+    return sorted(entries, key=lambda e: e["ms"], reverse=True)[:top]
+
+
+def run_probe(code: str, top: int = 10) -> Dict[str, object]:
+    timed = (
+        "import sys, time, json\n"
+        "_pre = sorted(sys.modules)\n"
+        "_t = time.perf_counter()\n"
+        f"{code}\n"
+        "print(json.dumps({'ms': (time.perf_counter() - _t) * 1000, 'preloaded': _pre}))\n"
+    )
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "startup-profile-placeholder")  # constructing clients makes no calls
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", timed],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Probe failed ({code!r}):\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {"ms": round(result["ms"], 1), "slowest_imports": _parse_importtime(proc.stderr, top, set(result["preloaded"]))}
+
+
+def profile(top: int = 10) -> Dict[str, object]:
+    return {name: run_probe(code, top) for name, code in PROBES.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile cold-start import and build time.")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list per probe")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="Budget for `import graph`")
+    parser.add_argument("--max-build-ms", type=float, default=None, help="Budget for import + get_agent()")
+    parser.add_argument("--max-app-ms", type=float, default=None, help="Budget for importing streamlit_app")
+    args = parser.parse_args()
+
+    report = profile(args.top)
+    for name, result in report.items():
+        print(f"[startup] {name}: {result['ms']} ms")
+        for entry in result["slowest_imports"][:5]:
+            print(f"[startup]   {entry['ms']:>8} ms  {entry['module']}")
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    budgets = {"import_graph": args.max_import_ms, "build_agent": args.max_build_ms, "import_streamlit_app": args.max_app_ms}
+    over = [f"{k}={report[k]['ms']}ms > {v}ms" for k, v in budgets.items() if v is not None and report[k]["ms"] > v]
+    if over:
+        print(f"[startup] Budget exceeded: {', '.join(over)}")
+        sys.exit(1)
@@ -1,152 +1,136 @@
 # streamlit_app.py
 import streamlit as st
 import os
-import shutil
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_core.messages import HumanMessage
-from graph import evaluate_document_theme, agent  # Import the supervisor workflow
-from RAG.rag import run_rag_pipeline
+
+# Uploads are queued as background jobs (jobs.py) and processed by a worker
+# pool, so the page stays responsive, several PDFs can run at once and
+# finished reports survive a browser refresh. Heavy imports (LangChain,
+# Gemini, Supabase) happen in the workers, not on page render.
+from jobs import DEFAULT_UPLOAD_DIR, FINAL_STATES, get_job_runner, get_job_store, save_upload
+from triage import STAGES, has_gaps
+
+
+@st.cache_resource(show_spinner=False)
+def load_job_runner():
+    """Worker pool, started once per server process (not on every rerun)."""
+    return get_job_runner()
+
 
 # Use English folder names for consistency
-UPLOAD_DIR = "RAG/KnowledgeBase"
+UPLOAD_DIR = os.getenv("JOBS_UPLOAD_DIR", DEFAULT_UPLOAD_DIR)
 REGULATIONS_DIR = "RAG/Regulations"  # place regulatory PDFs here (preloaded corpus)
 
-# Ensure base folders exist
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(REGULATIONS_DIR, exist_ok=True)
+STATE_LABELS = {
+    "queued": "⏳ Queued",
+    "running": "⚙️ Running",
+    "done": "✅ Done",
+    "rejected": "🚫 Not relevant",
+    "failed": "❌ Failed",
+}
+STAGE_ICONS = {"pending": "·", "running": "⚙️", "done": "✅", "skipped": "⏭️", "reused": "♻️", "failed": "❌"}
 
-st.title("Oil & Gas Compliance Triage (Canada)")
-st.write("Upload a PDF to analyze whether it is relevant for compliance verification (methane/VOC, LDAR, venting/flaring, discharges/effluents, reporting).")
 
-uploaded_file = st.file_uploader("Upload your PDF", type=["pdf"])
+def render_live(live):
+    """Streamed analysis so far: agent hand-offs and the active agent's tokens."""
+    if not live or not live.get("agent"):
+        return
+    st.caption("Agents: " + " → ".join(live["handoffs"]))
+    st.markdown(f"**{live['agent']}** is writing…")
+    st.markdown(live["text"].get(live["agent"], ""))
 
-if uploaded_file:
-    # Clean the KnowledgeBase folder
-    if os.path.exists(UPLOAD_DIR):
-        shutil.rmtree(UPLOAD_DIR)
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-    # Save uploaded file
-    pdf_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-    with open(pdf_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-
-    # Extract text for initial filtering
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-    full_text = "\n".join([doc.page_content for doc in documents])
-
-    st.info("Analyzing document relevance for Oil & Gas compliance...")
-    result = evaluate_document_theme(full_text)
-    st.write(f"Filter agent result: **{result}**")
-
-    if "yes" in result.lower():
-        st.success("The document is potentially relevant. Running ingestion pipeline to Supabase (RAG)...")
-        run_rag_pipeline(pdf_path)
-        st.success("✅ Document processed and stored in Supabase for future RAG queries.")
-        
-        # NEW: Run the multi-agent compliance analysis
-        st.info("🔍 Running compliance gap analysis...")
-        
-        # Prepare the analysis request
-        analysis_prompt = f"""
-        Analyze this inspection report for Oil & Gas compliance:
-        
-        Document: {uploaded_file.name}
-        
-        CRITICAL: You MUST output the FULL DETAILED REPORT in your final response. Do not just say "analysis complete".
-        
-        Instructions:
-        1. Retrieve relevant regulatory clauses from SOR/2018-66 (federal methane regulations) and AER Directive 060 (Alberta flaring/venting).
-        2. Compare document against regulations and identify gaps with:
-           - Specific regulation citation (e.g., "SOR/2018-66, Section 8(1)")
-           - Severity (Low/Medium/High)
-           - Brief rationale
-        3. If NO significant gaps: provide SHORT compliance checklist (3-5 categories with ✅).
-        4. If gaps found: YOU MUST provide the COMPLETE detailed report with:
-           - Executive summary paragraph
-           - Each gap listed with:
-             * Gap title
-             * Regulation citation
-             * Severity level
-             * Detailed rationale
-           - 2-3 recommended corrective actions
-        
-        Document excerpt (first 2000 chars):
-        {full_text[:2000]}
-        
-        EXAMPLE FORMAT FOR COMPLIANT DOCUMENTS:
-        **Compliance Status: COMPLIANT ✅**
-        
-        - ✅ LDAR Program: Quarterly surveys completed (SOR/2018-66, Section 6)
-        - ✅ Pneumatic Devices: All low-bleed or instrument air (SOR/2018-66, Section 8)
-        - ✅ Venting/Flaring: VRU installed, <100 m³/month (AER Directive 060)
-        - ✅ Water Management: Closed-loop system, licensed disposal (AER Directive 086)
-        - ✅ Documentation: Current ERP, trained staff
-        
-        **Conclusion**: Operations meet regulatory requirements. Continue current practices.
-        
-        EXAMPLE FORMAT FOR NON-COMPLIANT DOCUMENTS (YOU MUST USE THIS EXACT STRUCTURE):
-        
-        **Executive Summary**
-        Site B demonstrates multiple high-severity compliance gaps requiring immediate corrective action. Key violations include overdue LDAR surveys, prohibited high-bleed pneumatic devices, and excessive venting without flare routing.
-        
-        **Identified Compliance Gaps:**
-        
-        1. **Gap**: LDAR Survey Frequency Non-Compliance
-           **Regulation**: SOR/2018-66, Section 6 - Requires quarterly (3-month) LDAR surveys
-           **Severity**: HIGH
-           **Rationale**: Last survey completed October 2023 (18 months ago). Facility is 15 months overdue for required quarterly inspections, risking undetected fugitive methane emissions.
-        
-        2. **Gap**: Prohibited High-Bleed Pneumatic Devices
-           **Regulation**: SOR/2018-66, Section 8(1) - Prohibits high-bleed devices (>6 scf/hr) after January 1, 2023
-           **Severity**: HIGH
-           **Rationale**: 12 high-bleed pneumatic controllers currently in operation (4 separator controls, 6 tank level controls, 2 compressor controls). All must be replaced with low-bleed (<6 scf/hr) or instrument air systems.
-        
-        3. **Gap**: Excessive Venting Without Flare Routing
-           **Regulation**: AER Directive 060, Section 3.2 - Requires flare routing for venting >500 m³/month
-           **Severity**: HIGH
-           **Rationale**: Facility vents 1,200 m³/month directly to atmosphere (2.4x the threshold). No flare system installed. Immediate flare installation or vapor recovery required.
-        
-        4. **Gap**: Unauthorized Water Discharge
-           **Regulation**: AER Directive 086 - Requires immediate notification of produced water releases
-           **Severity**: MEDIUM
-           **Rationale**: 15 m³ produced water overflow on Sept 10. Verbal notification only, formal AER notification not submitted within required timeframe.
-        
-        **Recommended Corrective Actions:**
-        1. **Immediate**: Schedule comprehensive LDAR survey within 30 days and establish quarterly survey calendar
-        2. **Priority**: Replace all 12 high-bleed pneumatic devices with compliant low-bleed or instrument air systems by Q1 2026
-        3. **Critical**: Install flare system or vapor recovery unit to eliminate atmospheric venting, target completion Q2 2026
-        
-        OUTPUT THE FULL REPORT ABOVE. DO NOT just say "analysis complete".
-        """
-        
-        # Invoke the supervisor workflow
-        with st.spinner("Agents working: retriever → gap analyzer → report generator..."):
-            state = {"messages": [HumanMessage(content=analysis_prompt)]}
-            result_state = agent.invoke(state)
-            
-           # Extract the final report from messages
-            final_report = result_state["messages"][-1].content
-
-        # Display the compliance report
-        st.markdown("---")
-        st.subheader("📋 Compliance Analysis Report")
-        st.markdown(final_report)
-        
-        # Check if report indicates compliance or gaps
-        if any(keyword in final_report.lower() for keyword in ["gap", "deficiency", "non-compliant", "violation", "high", "medium"]):
-            st.warning("⚠️ Potential compliance gaps identified. Review recommended actions.")
-            # Download button for the report
-            st.download_button(
-                label="📥 Download Compliance Report",
-                data=final_report,
-                file_name=f"compliance_report_{uploaded_file.name.replace('.pdf', '')}.txt",
-                mime="text/plain"
-            )
-        else:
-            st.success("✅ No significant compliance gaps identified. Operations appear compliant with regulations.")
-            st.info("You may continue normal operations. Maintain current monitoring and documentation practices.")
-        
+def render_timings(timings):
+    if not timings:
+        return
+    parts = [f"total {timings['total_s']:.1f}s"] if timings.get("total_s") is not None else []
+    if timings.get("map_reduce"):
+        parts.append(f"{timings['map_reduce']['sections']} report section(s) mapped in {timings['map_reduce']['map_s']:.1f}s")
+    if timings.get("first_token_s") is not None:
+        parts.append(f"first token {timings['first_token_s']:.1f}s")
+    if timings.get("first_report_token_s") is not None:
+        parts.append(f"first report token {timings['first_report_token_s']:.1f}s")
+    parts += [f"{agent} {seconds:.1f}s" for agent, seconds in timings.get("per_agent_s", {}).items()]
+    st.caption("⏱️ " + " · ".join(parts))
+
+
+def render_report(job):
+    final_report = job["report"] or ""
+    st.subheader("📋 Compliance Analysis Report")
+    st.markdown(final_report)
+
+    # Check if report indicates compliance or gaps
+    if has_gaps(final_report):
+        st.warning("⚠️ Potential compliance gaps identified. Review recommended actions.")
+        # Download button for the report
+        st.download_button(
+            label="📥 Download Compliance Report",
+            data=final_report,
+            file_name=f"compliance_report_{job['name'].replace('.pdf', '')}.txt",
+            mime="text/plain",
+            key=f"download_{job['id']}",
+        )
     else:
-        st.warning("The document does not appear relevant for Oil & Gas compliance. It will not be processed.")
\ No newline at end of file
+        st.success("✅ No significant compliance gaps identified. Operations appear compliant with regulations.")
+        st.info("You may continue normal operations. Maintain current monitoring and documentation practices.")
+
+
+@st.fragment(run_every="1s")
+def job_list(store):
+    jobs = store.list()
+    if not jobs:
+        st.caption("No jobs yet.")
+        return
+    for job in jobs:
+        label = f"{STATE_LABELS.get(job['state'], job['state'])} — {job['name']}"
+        with st.expander(label, expanded=job["state"] not in FINAL_STATES):
+            st.progress(job["fraction"])
+            stages = []
+            for stage in STAGES:
+                entry = job["progress"].get(stage, {"status": "pending"})
+                seconds = f" ({entry['seconds']}s)" if "seconds" in entry else ""
+                stages.append(f"{STAGE_ICONS.get(entry['status'], '')} {stage}{seconds}")
+            st.caption("  →  ".join(stages))
+            if job["relevance"]:
+                st.write(f"Filter agent result: **{job['relevance']}**")
+            if job["state"] == "running" and job["stage"] == "analyze":
+                render_live(job["live"])
+            elif job["state"] == "done":
+                render_timings(job["timings"])
+                render_report(job)
+            elif job["state"] == "rejected":
+                st.warning("The document does not appear relevant for Oil & Gas compliance. It was not processed.")
+            elif job["state"] == "failed":
+                st.error(job["error"] or "Job failed")
+            if job["state"] in FINAL_STATES and st.button("Remove", key=f"remove_{job['id']}"):
+                store.delete(job["id"])
+                st.rerun(scope="fragment")
+
+
+def main():
+    # The worker pool, job database and folders are set up here, not at import.
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(REGULATIONS_DIR, exist_ok=True)
+    runner = load_job_runner()
+    store = get_job_store()
+
+    st.title("Oil & Gas Compliance Triage (Canada)")
+    st.write("Upload PDFs to analyze whether they are relevant for compliance verification (methane/VOC, LDAR, venting/flaring, discharges/effluents, reporting).")
+
+    with st.form("upload", clear_on_submit=True):
+        uploaded_files = st.file_uploader("Upload your PDFs", type=["pdf"], accept_multiple_files=True)
+        submitted = st.form_submit_button("Analyze")
+
+    if submitted and uploaded_files:
+        for uploaded_file in uploaded_files:
+            saved = save_upload(uploaded_file.name, uploaded_file.getbuffer(), UPLOAD_DIR)
+            store.submit(uploaded_file.name, saved["pdf_path"], job_id=saved["job_id"])
+        runner.notify()
+        st.success(f"Queued {len(uploaded_files)} document(s). Progress updates below; you can leave and come back later.")
+
+    st.markdown("---")
+    st.subheader("Jobs")
+    job_list(store)
+
+
+if __name__ == "__main__":  # `streamlit run src/streamlit_app.py`
+    main()
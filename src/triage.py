@@ -0,0 +1,492 @@
+# triage.py
+"""
+Compliance triage flow for one uploaded PDF, shared by the Streamlit app and the
+background job workers (jobs.py).
+
+Stages (in order): extract -> filter -> ingest -> analyze.
+- extract: PDF text via PyPDFLoader
+- filter:  evaluate_document_theme (local pre-classifier, LLM only when ambiguous)
+- ingest:  run_rag_pipeline (embeddings + retrieval backend)
+- analyze: map-reduce gap analysis over every section of the report
+  (gap_analysis.py; GAP_MAP_REDUCE=0 sends only the first 2000 characters),
+  then graph.get_analysis_graph() (supervisor, or the deterministic
+  pipeline with ANALYSIS_GRAPH=pipeline) on the analysis prompt, streamed
+  (stream_mode messages + updates, with subgraphs) so agent hand-offs and
+  tokens can be shown as they arrive; records time-to-first-token and time
+  per agent. Set ANALYSIS_STREAMING=0 to fall back to a single invoke().
+
+Each stage declares the external providers it talks to (STAGE_PROVIDERS) so a
+caller can throttle them; `limit(provider)` must return a context manager.
+The analyze stage holds its gemini slot for the graph run only: the gap
+map-reduce before it takes one slot per LLM call.
+
+Work is memoized per document (sha256 of the PDF) in the artifact store
+(RAG/artifacts.py): parsed pages, chunks, the filter decision, the ingestion,
+the map-reduced findings and the final report. Findings and report are keyed
+with the regulations corpus generation, so they are recomputed after the
+corpus changes. A reused stage is reported as on_stage(stage, 'reused').
+The analysis graph runs with a local checkpointer under a thread id derived
+from the document hash (graph.with_checkpointer), so a run interrupted
+mid-analysis resumes from its last completed node.
+"""
+import os
+import re
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+STAGES = ["extract", "filter", "ingest", "analyze"]
+
+REPORT_AGENT = "report_generator_agent"
+LIVE_TEXT_CHARS = 4000  # tail of each agent's streamed text kept in live snapshots
+
+STAGE_PROVIDERS = {
+    "extract": [],
+    "filter": ["gemini"],
+    "ingest": ["openai", "supabase"],
+    "analyze": ["gemini"],
+}
+
+GAP_KEYWORDS = ["gap", "deficiency", "non-compliant", "violation", "high", "medium"]
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.*\S)")
+_SEVERITY = re.compile(r"\b(critical|high|medium|low)\b", re.IGNORECASE)
+
+ANALYSIS_PROMPT = """
+        Analyze this inspection report for Oil & Gas compliance:
+
+        Document: {document_name}
+
+        CRITICAL: You MUST output the FULL DETAILED REPORT in your final response. Do not just say "analysis complete".
+
+        Instructions:
+        1. Retrieve relevant regulatory clauses from SOR/2018-66 (federal methane regulations) and AER Directive 060 (Alberta flaring/venting).
+        2. Compare document against regulations and identify gaps with:
+           - Specific regulation citation (e.g., "SOR/2018-66, Section 8(1)")
+           - Severity (Low/Medium/High)
+           - Brief rationale
+        3. If NO significant gaps: provide SHORT compliance checklist (3-5 categories with ✅).
+        4. If gaps found: YOU MUST provide the COMPLETE detailed report with:
+           - Executive summary paragraph
+           - Each gap listed with:
+             * Gap title
+             * Regulation citation
+             * Severity level
+             * Detailed rationale
+           - 2-3 recommended corrective actions
+
+        {evidence}
+
+        EXAMPLE FORMAT FOR COMPLIANT DOCUMENTS:
+        **Compliance Status: COMPLIANT ✅**
+
+        - ✅ LDAR Program: Quarterly surveys completed (SOR/2018-66, Section 6)
+        - ✅ Pneumatic Devices: All low-bleed or instrument air (SOR/2018-66, Section 8)
+        - ✅ Venting/Flaring: VRU installed, <100 m³/month (AER Directive 060)
+        - ✅ Water Management: Closed-loop system, licensed disposal (AER Directive 086)
+        - ✅ Documentation: Current ERP, trained staff
+
+        **Conclusion**: Operations meet regulatory requirements. Continue current practices.
+
+        EXAMPLE FORMAT FOR NON-COMPLIANT DOCUMENTS (YOU MUST USE THIS EXACT STRUCTURE):
+
+        **Executive Summary**
+        Site B demonstrates multiple high-severity compliance gaps requiring immediate corrective action. Key violations include overdue LDAR surveys, prohibited high-bleed pneumatic devices, and excessive venting without flare routing.
+
+        **Identified Compliance Gaps:**
+
+        1. **Gap**: LDAR Survey Frequency Non-Compliance
+           **Regulation**: SOR/2018-66, Section 6 - Requires quarterly (3-month) LDAR surveys
+           **Severity**: HIGH
+           **Rationale**: Last survey completed October 2023 (18 months ago). Facility is 15 months overdue for required quarterly inspections, risking undetected fugitive methane emissions.
+
+        2. **Gap**: Prohibited High-Bleed Pneumatic Devices
+           **Regulation**: SOR/2018-66, Section 8(1) - Prohibits high-bleed devices (>6 scf/hr) after January 1, 2023
+           **Severity**: HIGH
+           **Rationale**: 12 high-bleed pneumatic controllers currently in operation (4 separator controls, 6 tank level controls, 2 compressor controls). All must be replaced with low-bleed (<6 scf/hr) or instrument air systems.
+
+        3. **Gap**: Excessive Venting Without Flare Routing
+           **Regulation**: AER Directive 060, Section 3.2 - Requires flare routing for venting >500 m³/month
+           **Severity**: HIGH
+           **Rationale**: Facility vents 1,200 m³/month directly to atmosphere (2.4x the threshold). No flare system installed. Immediate flare installation or vapor recovery required.
+
+        4. **Gap**: Unauthorized Water Discharge
+           **Regulation**: AER Directive 086 - Requires immediate notification of produced water releases
+           **Severity**: MEDIUM
+           **Rationale**: 15 m³ produced water overflow on Sept 10. Verbal notification only, formal AER notification not submitted within required timeframe.
+
+        **Recommended Corrective Actions:**
+        1. **Immediate**: Schedule comprehensive LDAR survey within 30 days and establish quarterly survey calendar
+        2. **Priority**: Replace all 12 high-bleed pneumatic devices with compliant low-bleed or instrument air systems by Q1 2026
+        3. **Critical**: Install flare system or vapor recovery unit to eliminate atmospheric venting, target completion Q2 2026
+
+        OUTPUT THE FULL REPORT ABOVE. DO NOT just say "analysis complete".
+        """
+
+
+def build_analysis_prompt(document_name: str, full_text: str, findings: Optional[Dict[str, object]] = None) -> str:
+    """findings: gap_analysis.map_reduce_gaps() result; without it only the first 2000 chars are sent."""
+    if findings is None:
+        evidence = f"Document excerpt (first 2000 chars):\n{full_text[:2000]}"
+    else:
+        from gap_analysis import format_findings
+
+        evidence = format_findings(findings) + "\nThese findings cover the whole report: go straight to the report."
+    return ANALYSIS_PROMPT.format(document_name=document_name, evidence=evidence)
+
+
+def map_reduce_findings(full_text: str, limit=None) -> Optional[Dict[str, object]]:
+    """Whole-report gap findings, or None with GAP_MAP_REDUCE=0. limit: see triage_document."""
+    from gap_analysis import map_reduce_enabled, map_reduce_gaps
+
+    return map_reduce_gaps(full_text, limit=limit) if map_reduce_enabled() else None
+
+
+def has_gaps(report: str) -> bool:
+    """Heuristic used by the UI to flag reports that mention gaps."""
+    return any(keyword in report.lower() for keyword in GAP_KEYWORDS)
+
+
+def extract_gaps(report: str) -> List[Dict[str, Optional[str]]]:
+    """List items of a report that read as gaps: [{'text', 'severity'}] (severity None if unstated)."""
+    gaps = []
+    for line in (report or "").splitlines():
+        item = _LIST_ITEM.match(line)
+        if not item:
+            continue
+        text = item.group(1).replace("**", "").strip()
+        severity = _SEVERITY.search(text)
+        if severity or any(keyword in text.lower() for keyword in GAP_KEYWORDS[:4]):
+            gaps.append({"text": text, "severity": severity.group(1).title() if severity else None})
+    return gaps
+
+
+def extract_pages(pdf_path: str) -> List[Dict[str, object]]:
+    """PDF pages as [{'page_content', 'metadata'}] (plain dicts, so they can be stored as artifacts)."""
+    from langchain_community.document_loaders import PyPDFLoader
+
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in PyPDFLoader(pdf_path).load()]
+
+
+def extract_text(pdf_path: str) -> str:
+    return "\n".join(page["page_content"] for page in extract_pages(pdf_path))
+
+
+def _documents(items: List[Dict[str, object]]):
+    from langchain_core.documents import Document
+
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in items]
+
+
+def analysis_variant() -> Dict[str, object]:
+    """Settings a stored findings / report depends on, besides the document and the corpus generation."""
+    from gap_analysis import map_reduce_enabled
+    from graph import MODEL_NAME
+
+    return {
+        "model": MODEL_NAME,
+        "graph": os.getenv("ANALYSIS_GRAPH", "supervisor"),
+        "map_reduce": map_reduce_enabled(),
+    }
+
+
+def _analysis_input(document_name: str, full_text: str, findings=None):
+    from langchain_core.messages import HumanMessage
+
+    return {"messages": [HumanMessage(content=build_analysis_prompt(document_name, full_text, findings))]}
+
+
+def _start(agent, thread_id: Optional[str], document_name: str, full_text: str, findings=None):
+    """
+    (agent, input, config, finished messages) for one analysis run. With a
+    thread_id and checkpoints on, an interrupted thread resumes (input None)
+    and a finished one hands back its messages instead of running again.
+    """
+    if agent is None:
+        from graph import get_analysis_graph
+
+        agent = get_analysis_graph()
+    payload = _analysis_input(document_name, full_text, findings)
+    if not thread_id:
+        return agent, payload, None, None
+    from graph import with_checkpointer
+
+    agent = with_checkpointer(agent)
+    if agent.checkpointer is None:
+        return agent, payload, None, None
+    config = {"configurable": {"thread_id": thread_id}}
+    payload, finished = _resume(payload, agent.get_state(config))
+    return agent, payload, config, finished
+
+
+def _resume(payload, state):
+    """(input, finished messages) for a checkpointed thread in `state`."""
+    if state.next:
+        return None, None
+    if state.values.get("messages"):
+        return None, state.values["messages"]
+    return payload, None
+
+
+def run_analysis(document_name: str, full_text: str, agent=None, findings=None, thread_id: Optional[str] = None) -> str:
+    """Invoke the analysis graph (supervisor or pipeline) and return the final report text."""
+    agent, payload, config, finished = _start(agent, thread_id, document_name, full_text, findings)
+    if finished:
+        return finished[-1].content
+    result_state = agent.invoke(payload, config)
+    return result_state["messages"][-1].content
+
+
+def _text(content) -> str:
+    """Message content as plain text (Gemini may return a list of parts)."""
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content or [])
+
+
+class AnalysisStream:
+    """
+    Consumes supervisor stream events (namespace, mode, chunk) and tracks:
+    - the active agent and each hand-off between agents
+    - streamed text per agent
+    - timings: first token, first report token, seconds per agent segment
+    on_update(snapshot) is called at most every `update_interval` seconds.
+    """
+
+    def __init__(self, on_update: Optional[Callable[[Dict[str, object]], None]] = None, update_interval: float = 0.25):
+        self.on_update = on_update
+        self.update_interval = update_interval
+        self.started = time.perf_counter()
+        self.agent: Optional[str] = None
+        self.segments: List[Dict[str, object]] = []
+        self.text: Dict[str, str] = {}
+        self.first_token_s: Optional[float] = None
+        self.first_report_token_s: Optional[float] = None
+        self.messages: list = []
+        self._last_update = 0.0
+
+    def _elapsed(self) -> float:
+        return round(time.perf_counter() - self.started, 3)
+
+    def _switch(self, agent: str) -> None:
+        if agent == self.agent:
+            return
+        now = self._elapsed()
+        if self.segments:
+            self.segments[-1]["seconds"] = round(now - self.segments[-1]["start_s"], 3)
+        self.segments.append({"agent": agent, "start_s": now})
+        self.agent = agent
+        self._publish(force=True)
+
+    def feed(self, namespace, mode: str, chunk) -> None:
+        if mode == "updates":
+            if not namespace:
+                for update in chunk.values():
+                    if update and update.get("messages"):
+                        self.messages = update["messages"]
+            return
+        message, metadata = chunk
+        agent = namespace[-1].split(":")[0] if namespace else metadata.get("langgraph_node", "supervisor")
+        token = _text(getattr(message, "content", ""))
+        if not token or type(message).__name__ != "AIMessageChunk":
+            return
+        self._switch(agent)
+        if self.first_token_s is None:
+            self.first_token_s = self._elapsed()
+        if agent == REPORT_AGENT and self.first_report_token_s is None:
+            self.first_report_token_s = self._elapsed()
+        self.text[agent] = (self.text.get(agent, "") + token)[-LIVE_TEXT_CHARS:]
+        self._publish()
+
+    def _publish(self, force: bool = False) -> None:
+        if self.on_update is None:
+            return
+        now = time.perf_counter()
+        if force or now - self._last_update >= self.update_interval:
+            self._last_update = now
+            self.on_update(self.snapshot())
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "agent": self.agent,
+            "handoffs": [s["agent"] for s in self.segments],
+            "text": dict(self.text),
+        }
+
+    def finish(self) -> Dict[str, object]:
+        if self.segments and "seconds" not in self.segments[-1]:
+            self.segments[-1]["seconds"] = round(self._elapsed() - self.segments[-1]["start_s"], 3)
+        if self.on_update is not None:
+            self.on_update(self.snapshot())
+        per_agent: Dict[str, float] = {}
+        for segment in self.segments:
+            per_agent[segment["agent"]] = round(per_agent.get(segment["agent"], 0.0) + segment["seconds"], 3)
+        report = _text(self.messages[-1].content) if self.messages else self.text.get(REPORT_AGENT, "")
+        return {
+            "report": report,
+            "timings": {
+                "total_s": self._elapsed(),
+                "first_token_s": self.first_token_s,
+                "first_report_token_s": self.first_report_token_s,
+                "per_agent_s": per_agent,
+                "segments": self.segments,
+            },
+        }
+
+
+def stream_analysis(
+    document_name: str, full_text: str, agent=None, on_update=None, findings=None, thread_id: Optional[str] = None
+) -> Dict[str, object]:
+    """Streamed run_analysis: returns {'report', 'timings'}; on_update gets live snapshots."""
+    agent, payload, config, finished = _start(agent, thread_id, document_name, full_text, findings)
+    stream = AnalysisStream(on_update)
+    if finished:
+        stream.messages = finished
+        return stream.finish()
+    for namespace, mode, chunk in agent.stream(payload, config, stream_mode=["messages", "updates"], subgraphs=True):
+        stream.feed(namespace, mode, chunk)
+    return stream.finish()
+
+
+async def astream_analysis(
+    document_name: str, full_text: str, agent=None, on_update=None, findings=None, thread_id: Optional[str] = None
+) -> Dict[str, object]:
+    """Async stream_analysis, checkpointed the same way when given a thread_id."""
+    from graph import async_checkpointer
+
+    if agent is None:
+        from graph import get_analysis_graph
+
+        agent = get_analysis_graph()
+    payload, config, finished = _analysis_input(document_name, full_text, findings), None, None
+    stream = AnalysisStream(on_update)
+    async with async_checkpointer() if thread_id else nullcontext() as checkpointer:
+        if checkpointer is not None:
+            agent = agent.copy(update={"checkpointer": checkpointer})
+            config = {"configurable": {"thread_id": thread_id}}
+            payload, finished = _resume(payload, await agent.aget_state(config))
+        if finished:
+            stream.messages = finished
+            return stream.finish()
+        async for namespace, mode, chunk in agent.astream(
+            payload, config, stream_mode=["messages", "updates"], subgraphs=True
+        ):
+            stream.feed(namespace, mode, chunk)
+    return stream.finish()
+
+
+def triage_document(
+    pdf_path: str,
+    document_name: str,
+    on_stage: Optional[Callable[[str, str], None]] = None,
+    limit: Optional[Callable[[str], object]] = None,
+    on_update: Optional[Callable[[Dict[str, object]], None]] = None,
+    pages: Optional[List[Dict[str, object]]] = None,
+) -> Dict[str, object]:
+    """
+    Run all stages for one PDF. on_stage(stage, status) is called with
+    'running' / 'done' / 'skipped' / 'reused' (served from the artifact store);
+    on_update receives live analysis snapshots.
+    Pass pages (extract_pages output) when the PDF was already parsed (e.g. in
+    a process pool); ingestion reuses them, so each PDF is parsed once.
+    Returns {'relevance', 'relevant', 'report', 'gaps', 'timings'}; gaps is the
+    map-reduced, severity-ranked list (None with GAP_MAP_REDUCE=0).
+    """
+    from graph import MODEL_NAME, evaluate_document_theme
+    from RAG.artifacts import get_artifact_store, variant_key
+    from RAG.manifest import corpus_generation, file_sha256
+    from RAG.rag import run_rag_pipeline
+
+    on_stage = on_stage or (lambda stage, status: None)
+    limit = limit or (lambda provider: nullcontext())
+    store = get_artifact_store()
+    document = file_sha256(Path(pdf_path)) if store is not None else None
+
+    @contextmanager
+    def hold(name: str):
+        with ExitStack() as stack:
+            for provider in STAGE_PROVIDERS[name]:
+                stack.enter_context(limit(provider))
+            yield
+
+    def stage(name: str, fn, held: bool = True):
+        on_stage(name, "running")
+        with hold(name) if held else nullcontext():
+            value = fn()
+        on_stage(name, "done")
+        return value
+
+    def memo(kind: str, compute, variant=None, generation=None):
+        """(value, reused): compute() runs once per (document, kind, variant, generation)."""
+        if document is None:
+            return compute(), False
+        value = store.get(document, kind, variant, generation)
+        if value is not None:
+            return value, True
+        value = compute()
+        if value is not None:
+            store.put(document, kind, value, variant, generation)
+        return value, False
+
+    def cached_stage(name: str, kind: str, fn, variant=None, generation=None, held: bool = True):
+        value, reused = memo(kind, lambda: stage(name, fn, held), variant, generation)
+        if reused:
+            on_stage(name, "reused")
+        return value
+
+    if pages is None:
+        pages = cached_stage("extract", "pages", lambda: extract_pages(pdf_path))
+    else:
+        parsed = pages
+        pages, _ = memo("pages", lambda: parsed)
+        on_stage("extract", "done")
+    full_text = "\n".join(page["page_content"] for page in pages)
+    relevance = cached_stage(
+        "filter", "filter", lambda: evaluate_document_theme(full_text),
+        {"model": MODEL_NAME, "prefilter": os.getenv("PREFILTER_MODE", "tiered")},
+    )
+    if "yes" not in relevance.lower():
+        on_stage("ingest", "skipped")
+        on_stage("analyze", "skipped")
+        return {"relevance": relevance, "relevant": False, "report": None, "timings": None}
+
+    profile = os.getenv("REPORT_CHUNK_PROFILE", "inspection")
+
+    def ingest() -> Dict[str, object]:
+        stored = store.get(document, "chunks", {"profile": profile}) if document else None
+        chunks = run_rag_pipeline(pdf_path, documents=_documents(pages), chunks=_documents(stored) if stored else None)
+        if document is not None and stored is None:
+            store.put(document, "chunks", [{"page_content": c.page_content, "metadata": c.metadata} for c in chunks],
+                      {"profile": profile})
+        return {"chunks": len(chunks)}
+
+    cached_stage("ingest", "ingest", ingest, {"backend": os.getenv("RETRIEVAL_BACKEND", "supabase"), "profile": profile})
+
+    variant = analysis_variant()
+    generation = corpus_generation() if document else None
+    thread_id = f"{document}:{generation}:{variant_key(variant)}" if document else None
+
+    def analyze() -> Dict[str, object]:
+        # The map calls take a gemini slot each, so the stage's own slot is held only for the graph run.
+        findings, _ = memo("findings", lambda: map_reduce_findings(full_text, limit), variant, generation)
+        with hold("analyze"):
+            if os.getenv("ANALYSIS_STREAMING", "1") == "0":
+                report = run_analysis(document_name, full_text, findings=findings, thread_id=thread_id)
+                analysis = {"report": report, "timings": None}
+            else:
+                analysis = stream_analysis(
+                    document_name, full_text, on_update=on_update, findings=findings, thread_id=thread_id
+                )
+        if findings is not None:
+            analysis["gaps"] = findings["gaps"]
+            analysis["timings"] = {**(analysis["timings"] or {}), "map_reduce": findings["timings"]}
+        return analysis
+
+    analysis = cached_stage("analyze", "report", analyze, variant, generation, held=False)
+    return {
+        "relevance": relevance,
+        "relevant": True,
+        "report": analysis["report"],
+        "gaps": analysis.get("gaps"),
+        "timings": analysis["timings"],
+    }
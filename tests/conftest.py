@@ -0,0 +1,28 @@
+"""Shared pytest setup: make `src/` importable the same way the app and LangGraph load it."""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+# Per-document artifacts and analysis checkpoints would otherwise persist in
+# .cache between runs; the tests that exercise them use a tmp store.
+os.environ.setdefault("ARTIFACT_STORE_DISABLED", "1")
+os.environ.setdefault("ANALYSIS_CHECKPOINTS", "0")
+# Graph runs would append to the repo's .cache/graph_metrics.{jsonl,prom};
+# tests/test_instrumentation.py writes its own under tmp_path.
+os.environ.setdefault("GRAPH_METRICS_DISABLED", "1")
+# Importing jobs / streamlit_app must not touch the repo's job database or
+# upload folder (.cache/jobs.sqlite3, RAG/KnowledgeBase).
+_TMP_DIR = tempfile.mkdtemp(prefix="oag-tests-")
+atexit.register(shutil.rmtree, _TMP_DIR, True)
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_TMP_DIR, "jobs.sqlite3"))
+os.environ.setdefault("JOBS_UPLOAD_DIR", os.path.join(_TMP_DIR, "uploads"))
+# Likewise for the embedding cache (.cache/embeddings.sqlite3 relative to the
+# working directory, e.g. src/ for the subprocess tests).
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(_TMP_DIR, "embeddings.sqlite3"))
@@ -0,0 +1,40 @@
+"""Test doubles shared across test modules"""
+import json
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Replays scripted AIMessages; streams content word by word, tool calls on the last chunk."""
+
+    responses: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=next(self.responses))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = next(self.responses)
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            calls = [
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": j} for j, c in enumerate(message.tool_calls)
+            ] if last else []
+            chunk = AIMessageChunk(
+                content=word + ("" if last else " "),
+                tool_call_chunks=calls,
+                usage_metadata=message.usage_metadata if last else None,
+            )
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
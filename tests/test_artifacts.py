@@ -0,0 +1,134 @@
+"""Tests for document-hash memoization of triage work and resumable analysis runs"""
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+import graph
+import triage
+from RAG import artifacts, rag
+from RAG.artifacts import ArtifactStore
+from RAG.backends import LocalBackend
+from RAG.manifest import bump_corpus_generation
+from tests.fakes import ScriptedChatModel
+
+SITE_B = Path(__file__).resolve().parent.parent / "src/RAG/Regulations/test_files/2nd_synthetic_Inspection_Report_SiteB_NonCompliant.pdf"
+
+
+class Replies:
+    """Scripted model replies; an Exception item is raised once, in its turn."""
+
+    def __init__(self, *items):
+        self.items = list(items)
+        self.calls = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.items[self.calls]
+        self.calls += 1
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+def test_store_keys_on_variant_and_corpus_generation(tmp_path):
+    store = ArtifactStore(str(tmp_path / "a.sqlite3"), max_entries=3)
+    store.put("doc", "chunks", [{"page_content": "x", "metadata": {"page": 0}}], {"profile": "inspection"})
+    store.put("doc", "report", {"report": "old"}, generation=1)
+
+    reopened = ArtifactStore(str(tmp_path / "a.sqlite3"), max_entries=3)
+    assert reopened.get("doc", "chunks", {"profile": "inspection"}) == [{"page_content": "x", "metadata": {"page": 0}}]
+    assert reopened.get("doc", "chunks", {"profile": "legacy"}) is None
+    assert reopened.get("doc", "report", generation=1) == {"report": "old"}
+    assert reopened.get("doc", "report", generation=2) is None  # corpus changed: dropped
+    assert reopened.get("doc", "report", generation=1) is None
+    assert reopened.stats()["invalidated"] == 1
+
+    for i in range(4):
+        reopened.put(f"other{i}", "filter", "Yes")
+    assert len(reopened) == 3 and reopened.get("doc", "chunks", {"profile": "inspection"}) is None
+    assert reopened.forget("other3") == 1
+
+
+@pytest.fixture
+def offline_triage(tmp_path, monkeypatch):
+    """triage_document on the deterministic pipeline with a tmp artifact store and in-memory checkpoints."""
+    from bench.fakes import FakeEmbeddings
+
+    store = ArtifactStore(str(tmp_path / "artifacts.sqlite3"))
+    saver = InMemorySaver()
+    calls = {"filter": 0, "parse": 0, "retrieval": 0}
+    extract_pages = triage.extract_pages
+
+    def counted_pages(path):
+        calls["parse"] += 1
+        return extract_pages(path)
+
+    def fake_filter(text):
+        calls["filter"] += 1
+        return "Yes"
+
+    def fake_match(query, match_count=5):
+        calls["retrieval"] += 1
+        return json.dumps([{"id": 1, "content": "LDAR surveys three times per year", "metadata": {"source_pdf": "SOR-2018-66.pdf"}, "similarity": 0.9}])
+
+    monkeypatch.setattr(artifacts, "get_artifact_store", lambda: store)
+    monkeypatch.setattr(graph, "get_checkpointer", lambda: saver)
+    monkeypatch.setattr(triage, "extract_pages", counted_pages)
+    monkeypatch.setattr(graph, "evaluate_document_theme", fake_filter)
+    monkeypatch.setattr(graph, "match_regulations", fake_match)
+    monkeypatch.setattr(rag, "get_backend", lambda: LocalBackend(path=None))
+    monkeypatch.setattr(rag, "get_embeddings", lambda: FakeEmbeddings())
+    monkeypatch.setattr(rag, "PyPDFLoader", lambda path: pytest.fail("upload parsed a second time"))
+    monkeypatch.setenv("CORPUS_GENERATION_PATH", str(tmp_path / "generation"))
+    monkeypatch.setenv("ANALYSIS_GRAPH", "pipeline")
+    monkeypatch.setenv("GAP_MAP_REDUCE", "0")
+
+    def run(folder: str, replies: Replies):
+        monkeypatch.setattr(graph, "get_model", lambda: ScriptedChatModel(responses=replies))
+        pdf = tmp_path / folder / "site_b.pdf"
+        pdf.parent.mkdir(exist_ok=True)
+        shutil.copy(SITE_B, pdf)
+        stages = []
+        result = triage.triage_document(str(pdf), pdf.name, on_stage=lambda s, status: stages.append((s, status)))
+        return result, [(s, status) for s, status in stages if status != "running"]
+
+    return run, calls, store
+
+
+def test_reupload_reuses_every_stage_until_the_corpus_changes(offline_triage, tmp_path):
+    run, calls, store = offline_triage
+    first, stages = run("job1", Replies(AIMessage(content="- LDAR overdue (High)"), AIMessage(content="LDAR overdue report")))
+    assert first["report"] == "LDAR overdue report" and stages == [(s, "done") for s in triage.STAGES]
+    assert calls == {"filter": 1, "parse": 1, "retrieval": 4}
+
+    again, stages = run("job2", Replies())  # another upload folder, same bytes; no model calls left
+    assert again["report"] == first["report"] and again["relevant"]
+    assert stages == [(s, "reused") for s in triage.STAGES]
+    assert calls == {"filter": 1, "parse": 1, "retrieval": 4}
+
+    bump_corpus_generation(str(tmp_path / "generation"))
+    fresh, stages = run("job3", Replies(AIMessage(content="- LDAR overdue (High)"), AIMessage(content="new corpus report")))
+    assert fresh["report"] == "new corpus report"
+    assert stages == [("extract", "reused"), ("filter", "reused"), ("ingest", "reused"), ("analyze", "done")]
+    assert calls["filter"] == 1 and calls["parse"] == 1 and calls["retrieval"] == 8
+    assert store.stats()["invalidated"] == 1
+
+
+def test_interrupted_analysis_resumes_from_last_completed_node(offline_triage):
+    run, calls, _ = offline_triage
+    replies = Replies(AIMessage(content="- LDAR overdue (High)"), RuntimeError("gemini quota exhausted"))
+    with pytest.raises(RuntimeError):
+        run("job1", replies)
+    assert replies.calls == 2 and calls["retrieval"] == 4
+
+    resumed = Replies(AIMessage(content="report after resume"))
+    result, stages = run("job2", resumed)
+    assert result["report"] == "report after resume"
+    assert resumed.calls == 1 and calls["retrieval"] == 4  # only the report node ran again
+    assert stages[-1] == ("analyze", "done")
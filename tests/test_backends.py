@@ -0,0 +1,124 @@
+"""Tests for the pluggable retrieval backends (local index)"""
+import numpy as np
+
+from src.RAG.backends import LocalBackend, jsonb_contains
+
+
+def _rows(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.normal(size=(n, dim)).astype(np.float32)
+    return [
+        {
+            "id": f"id-{i}",
+            "content": f"chunk {i}",
+            "metadata": {"corpus": "regulations" if i % 2 == 0 else "uploads", "source_pdf": f"doc{i % 3}.pdf", "page": i},
+            "embedding": vecs[i].tolist(),
+        }
+        for i in range(n)
+    ], vecs
+
+
+def test_jsonb_contains_semantics():
+    meta = {"corpus": "regulations", "tags": ["ldar", "methane"], "loc": {"prov": "AB", "site": 3}}
+    assert jsonb_contains(meta, {})
+    assert jsonb_contains(meta, {"corpus": "regulations"})
+    assert jsonb_contains(meta, {"tags": ["ldar"]})
+    assert jsonb_contains(meta, {"loc": {"prov": "AB"}})
+    assert not jsonb_contains(meta, {"corpus": "uploads"})
+    assert not jsonb_contains(meta, {"tags": ["venting"]})
+    assert not jsonb_contains({"flag": 1}, {"flag": True})
+
+
+def test_local_match_equals_brute_force_with_filter():
+    rows, vecs = _rows(60)
+    backend = LocalBackend(path=None)
+    backend.upsert(rows)
+    query = vecs[10] + 0.01
+
+    got = backend.match(query, match_count=5, filter={"corpus": "regulations"})
+    unit = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    scores = unit @ (query / np.linalg.norm(query))
+    expected = [f"id-{i}" for i in np.argsort(-scores) if i % 2 == 0][:5]
+
+    assert [r["id"] for r in got] == expected
+    assert got[0]["id"] == "id-10" and got[0]["metadata"]["corpus"] == "regulations"
+    assert got[0]["similarity"] >= got[-1]["similarity"]
+
+
+def test_upsert_is_idempotent_and_delete_source(tmp_path):
+    rows, _ = _rows(30)
+    backend = LocalBackend(path=str(tmp_path / "idx"))
+    backend.upsert(rows)
+    backend.upsert(rows[:5])
+    assert len(backend) == 30
+
+    backend.delete_source("doc0.pdf", corpus="regulations")
+    backend.delete(["id-1"])
+    backend.flush()
+
+    reloaded = LocalBackend(path=str(tmp_path / "idx"))
+    assert isinstance(reloaded._vectors, np.memmap)
+    remaining = {r["id"] for r in reloaded.match(rows[0]["embedding"], match_count=100)}
+    assert "id-0" not in remaining and "id-1" not in remaining and "id-3" in remaining
+    assert len(reloaded) == 30 - 5 - 1
+
+
+def test_ivf_mode_keeps_high_recall(tmp_path):
+    rows, vecs = _rows(2000, dim=32, seed=1)
+    exact = LocalBackend(path=None)
+    exact.upsert(rows)
+    ivf = LocalBackend(path=str(tmp_path / "ivf"), ivf_lists=16, ivf_probes=6)
+    ivf.upsert(rows)
+    ivf.flush()
+    assert ivf._lists is not None
+
+    hits = total = 0
+    for q in vecs[:50]:
+        truth = {r["id"] for r in exact.match(q, match_count=10)}
+        got = {r["id"] for r in ivf.match(q, match_count=10)}
+        hits += len(truth & got)
+        total += len(truth)
+    assert hits / total >= 0.7
+
+
+def test_probes_override_per_call(tmp_path):
+    rows, vecs = _rows(2000, dim=32, seed=2)
+    exact = LocalBackend(path=None)
+    exact.upsert(rows)
+    ivf = LocalBackend(path=str(tmp_path / "ivf"), ivf_lists=16, ivf_probes=1)
+    ivf.upsert(rows)
+    ivf.flush()
+
+    for q in vecs[:20]:
+        truth = [r["id"] for r in exact.match(q, match_count=10)]
+        assert [r["id"] for r in ivf.match(q, match_count=10, probes=16)] == truth
+    assert ivf.ivf_probes == 1
+
+
+def test_match_many_equals_match_per_query(tmp_path):
+    rows, vecs = _rows(2000, dim=32, seed=3)
+    exact = LocalBackend(path=None)
+    exact.upsert(rows)
+    ivf = LocalBackend(path=str(tmp_path / "ivf"), ivf_lists=16, ivf_probes=4)
+    ivf.upsert(rows)
+    ivf.flush()
+
+    queries = vecs[:8] + 0.01
+    for backend in (exact, ivf):
+        batched = backend.match_many(queries, match_count=5, filter={"corpus": "regulations"})
+        single = [backend.match(q, match_count=5, filter={"corpus": "regulations"}) for q in queries]
+        assert [[r["id"] for r in rs] for rs in batched] == [[r["id"] for r in rs] for rs in single]
+    assert exact.match_many([], match_count=5) == []
+
+
+def test_match_leaves_the_callers_query_untouched():
+    rows, vecs = _rows(40)
+    backend = LocalBackend(path=None)
+    backend.upsert(rows)
+    query = vecs[3] * 5.0
+    queries = vecs[:4] * 3.0
+    before, before_many = query.copy(), queries.copy()
+
+    backend.match(query, match_count=3)
+    backend.match_many(queries, match_count=3)
+    assert np.array_equal(query, before) and np.array_equal(queries, before_many)
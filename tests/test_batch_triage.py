@@ -0,0 +1,158 @@
+"""Tests for the checkpointed batch triage command"""
+import json
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import triage
+from src.RAG.batch_triage import ProviderLimits, batch_triage, load_checkpoint
+
+TEST_FILES = Path(__file__).resolve().parent.parent / "src/RAG/Regulations/test_files"
+REPORT = "**Gaps**\n- LDAR survey overdue (High)\n- Pneumatics not inventoried (Medium)\n\n1. Schedule survey"
+
+
+@pytest.fixture
+def reports(tmp_path):
+    folder = tmp_path / "reports"
+    folder.mkdir()
+    for i, pdf in enumerate(sorted(TEST_FILES.glob("*.pdf"))):
+        shutil.copy(pdf, folder / f"site_{i}.pdf")
+    (folder / "notes.txt").write_text("ignored")
+    return folder
+
+
+def _fake_triage(fail=()):
+    seen = []
+
+    def run(pdf_path, name, on_stage=None, limit=None, on_update=None, pages=None):
+        seen.append((name, pages))
+        on_stage("filter", "running")
+        with limit("gemini"):
+            on_stage("filter", "done")
+        if name in fail:
+            raise RuntimeError("gemini quota exhausted")
+        relevant = name != "site_0.pdf"
+        return {"relevance": "Yes" if relevant else "No", "relevant": relevant,
+                "report": REPORT if relevant else None, "timings": {"total_s": 0.1} if relevant else None}
+
+    return run, seen
+
+
+def test_writes_one_record_per_report_with_gaps(reports, tmp_path, monkeypatch):
+    run, seen = _fake_triage()
+    monkeypatch.setattr(triage, "triage_document", run)
+    output = tmp_path / "out.jsonl"
+
+    summary = batch_triage(str(reports), output=str(output), workers=2, parse_workers=1)
+
+    assert (summary["done"], summary["not_relevant"], summary["failed"]) == (1, 1, 0)
+    assert all(pages and "inspection" in pages[0]["page_content"].lower() for _, pages in seen)  # parsed in the pool
+    records = {r["document"]: r for r in map(json.loads, output.read_text().splitlines())}
+    assert records["site_0.pdf"]["status"] == "not_relevant" and records["site_0.pdf"]["gaps"] == []
+    done = records["site_1.pdf"]
+    assert done["status"] == "done" and done["has_gaps"]
+    assert done["gaps"] == [
+        {"text": "LDAR survey overdue (High)", "severity": "High"},
+        {"text": "Pneumatics not inventoried (Medium)", "severity": "Medium"},
+    ]
+    assert "filter" in done["timings"] and done["timings"]["analysis"] == {"total_s": 0.1}
+
+
+@pytest.fixture
+def parsed_document(monkeypatch):
+    """triage_document on already parsed pages, with ingestion and the graph run faked out."""
+    import graph
+    from RAG import rag
+
+    ingested = []
+    monkeypatch.setattr(triage, "extract_pages", lambda path: pytest.fail("parsed a second time"))
+    monkeypatch.setattr(rag, "PyPDFLoader", lambda path: pytest.fail("parsed a second time"))
+    monkeypatch.setattr(graph, "evaluate_document_theme", lambda text: "Yes")
+    monkeypatch.setattr(rag, "run_rag_pipeline", lambda path, documents=None, chunks=None: ingested.append(documents) or documents)
+    monkeypatch.setattr(triage, "stream_analysis", lambda *args, **kwargs: {"report": REPORT, "timings": None})
+    pages = [{"page_content": "LDAR survey overdue at Site B", "metadata": {"page": 0}}]
+    return pages, ingested
+
+
+def test_pages_parsed_in_the_pool_are_reused_for_ingestion(parsed_document, monkeypatch):
+    pages, ingested = parsed_document
+    monkeypatch.setenv("GAP_MAP_REDUCE", "0")
+    result = triage.triage_document("site.pdf", "site.pdf", pages=pages)
+    assert result["report"] == REPORT
+    assert [d.page_content for d in ingested[0]] == ["LDAR survey overdue at Site B"]
+
+
+def test_analyze_stage_leaves_the_gemini_slot_to_the_map_calls(parsed_document, monkeypatch):
+    import gap_analysis
+
+    pages, _ = parsed_document
+    limits = ProviderLimits({"gemini": 1})
+    free = []
+
+    def slot_free():
+        taken = limits.semaphores["gemini"].acquire(blocking=False)
+        if taken:
+            limits.semaphores["gemini"].release()
+        return taken
+
+    def map_reduce_gaps(text, limit=None):
+        free.append(("map", slot_free()))
+        return {"gaps": [], "timings": {}}
+
+    def stream_analysis(*args, **kwargs):
+        free.append(("graph", slot_free()))
+        return {"report": REPORT, "timings": None}
+
+    monkeypatch.setattr(gap_analysis, "map_reduce_gaps", map_reduce_gaps)
+    monkeypatch.setattr(triage, "stream_analysis", stream_analysis)
+    triage.triage_document("site.pdf", "site.pdf", limit=limits.limit, pages=pages)
+    assert free == [("map", True), ("graph", False)]
+
+
+def test_resume_skips_recorded_reports_and_retries_failures(reports, tmp_path, monkeypatch):
+    output = tmp_path / "out.jsonl"
+    run, _ = _fake_triage(fail={"site_1.pdf"})
+    monkeypatch.setattr(triage, "triage_document", run)
+    first = batch_triage(str(reports), output=str(output), parse_workers=0)
+    assert (first["not_relevant"], first["failed"]) == (1, 1)
+    with open(output, "a", encoding="utf-8") as fh:
+        fh.write('{"document": "torn')  # crash mid-write
+
+    run, seen = _fake_triage()
+    monkeypatch.setattr(triage, "triage_document", run)
+    second = batch_triage(str(reports), output=str(output), parse_workers=0)
+    assert second["skipped"] == 1 and second["done"] == 1
+    assert [name for name, _ in seen] == ["site_1.pdf"]
+    assert {r["status"] for r in load_checkpoint(str(output)).values()} == {"done", "not_relevant"}
+
+    assert batch_triage(str(reports), output=str(output), parse_workers=0)["skipped"] == 2
+
+
+def test_provider_limits_cap_concurrency_and_pace():
+    limits = ProviderLimits({"gemini": 1}, {"openai": 600})
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        with limits.limit("gemini"):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 1
+
+    started = time.monotonic()
+    for _ in range(3):
+        with limits.limit("openai"):
+            pass
+    assert time.monotonic() - started >= 0.19  # 600/min -> 0.1s apart
@@ -0,0 +1,64 @@
+"""Tests for the offline benchmark harness and its regression checks"""
+import json
+import shutil
+
+from src.bench import run
+
+SITE_B = run.DEFAULT_REPORTS[1]
+
+
+def test_offline_run_exercises_every_stage_without_network(tmp_path):
+    import graph
+    from RAG import backends
+
+    originals = (graph.get_model, backends.get_backend)
+    regulations = tmp_path / "regs"
+    regulations.mkdir()
+    shutil.copy(SITE_B, regulations / "site_b.pdf")
+
+    results = run.run_benchmarks(regulations_dir=str(regulations), reports=[SITE_B], queries=5, parse_workers=1)
+
+    assert results["ingestion"]["chunks"] > 0 and results["ingestion"]["chunks_per_s"] > 0
+    assert results["retrieval"]["n"] == 5 and results["retrieval"]["empty_results"] == 0
+    assert results["filter"]["tiered"]["llm_calls"] == 0
+    assert results["filter"]["llm"]["llm_calls"] == 1
+    assert results["filter"]["llm"]["labels"] == {"2nd_synthetic_Inspection_Report_SiteB_NonCompliant.pdf": "Yes"}
+    supervisor, pipeline = results["triage"]["supervisor"], results["triage"]["pipeline"]
+    assert supervisor["runs"][0]["relevant"] and supervisor["runs"][0]["report_chars"] > 0
+    assert pipeline["mean_llm_calls"] == 2 < supervisor["mean_llm_calls"]
+    assert (graph.get_model, backends.get_backend) == originals  # fakes are removed afterwards
+
+
+def test_threshold_and_baseline_checks():
+    results = {"retrieval": {"p95_ms": 12.0}, "ingestion": {"chunks_per_s": 80.0},
+               "triage": {"pipeline": {"mean_llm_calls": 3}}}
+    assert run.check_thresholds(results, {"retrieval.p95_ms": 20}) == []
+    assert run.check_thresholds(results, {"retrieval.p95_ms": 10, "ingestion.chunks_per_s": 100, "x.y": 1}) == [
+        "retrieval.p95_ms: 12.0 > 10",
+        "ingestion.chunks_per_s: 80.0 < 100",
+        "x.y: missing from results",
+    ]
+
+    baseline = {"retrieval": {"p95_ms": 8.0}, "ingestion": {"chunks_per_s": 120.0},
+                "triage": {"pipeline": {"mean_llm_calls": 2}}}
+    failures = run.check_baseline(results, baseline, max_regression=0.25)
+    assert [f.split(":")[0] for f in failures] == [
+        "ingestion.chunks_per_s", "retrieval.p95_ms", "triage.pipeline.mean_llm_calls"
+    ]
+    # Sub-millisecond latency changes are noise, not regressions.
+    assert run.check_baseline({"retrieval": {"p95_ms": 0.9}}, {"retrieval": {"p95_ms": 0.5}}, 0.25) == []
+
+
+def test_main_exits_nonzero_on_threshold_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(run, "run_benchmarks", lambda **kwargs: {
+        "ingestion": {"chunks": 1, "seconds": 1, "chunks_per_s": 1.0},
+        "retrieval": {"p50_ms": 1.0, "p95_ms": 50.0, "p99_ms": 60.0},
+        "filter": {}, "triage": {},
+    })
+    thresholds = tmp_path / "thresholds.json"
+    thresholds.write_text(json.dumps({"retrieval.p95_ms": 20}))
+    output = tmp_path / "results.json"
+
+    assert run.main(["--output", str(output), "--thresholds", str(thresholds)]) == 1
+    assert json.loads(output.read_text())["failures"] == ["retrieval.p95_ms: 50.0 > 20"]
+    assert run.main(["--output", str(output)]) == 0
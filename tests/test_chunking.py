@@ -0,0 +1,73 @@
+"""Tests for the chunking profiles and their comparison report"""
+import json
+import shutil
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from src.RAG.chunking import chunk_documents, chunk_page_stream, compare_profiles, get_profile
+from src.RAG.ingest_regulations import _chunk_pages
+from src.RAG.pipeline import parse_pdf
+
+REGULATIONS = Path(__file__).resolve().parent.parent / "src/RAG/Regulations"
+SOR_PAGE = "Sections 7-9 Articles 7-9\n" + "\n".join(
+    f"Marginal note {n}\n{n} (1) An operator must inspect component {n}. " + "The inspection must be recorded. " * 25
+    + f"\n(2) Records for section {n} must be kept for five years."
+    for n in (7, 8, 9)
+)
+
+
+def test_chunks_start_at_section_boundaries_and_record_the_profile():
+    page = Document(page_content=SOR_PAGE, metadata={"page": 3})
+    chunks = chunk_documents([page], "regulations")
+
+    assert all(c.metadata["chunk_profile"] == "regulations" and c.metadata["page"] == 3 for c in chunks)
+    for chunk in chunks:
+        start = chunk.metadata["start_index"]
+        assert SOR_PAGE[start:start + len(chunk.page_content)] == chunk.page_content
+    starts = [c.page_content.split("\n")[0] for c in chunks]
+    assert {"Marginal note 8", "Marginal note 9"} <= set(starts)  # notes stay with their section
+    assert all(get_profile("regulations").chunk_size * 1.2 >= len(c.page_content) / 4 for c in chunks)
+    assert len(chunks) < len(chunk_documents([page], "legacy"))
+
+
+def test_a_clause_running_over_a_page_break_stays_in_one_chunk():
+    cut = SOR_PAGE.index("Records for section 7 must ") + len("Records for section 7 must ")
+    first, second = SOR_PAGE[:cut], SOR_PAGE[cut:]
+    pages = [Document(page_content=first, metadata={"page": 3}), Document(page_content=second, metadata={"page": 4})]
+    chunks = list(chunk_page_stream(pages, lambda batch: chunk_documents(batch, "regulations")))
+
+    clause = [c for c in chunks if "Records for section 7 must" in c.page_content]
+    assert len(clause) == 1 and "be kept for five years" in clause[0].page_content
+    assert clause[0].metadata["page"] == 3
+    start = clause[0].metadata["start_index"]
+    assert clause[0].page_content.startswith(first[start:start + 40])
+    later = [c for c in chunks if c.metadata["page"] == 4]
+    assert later and all(
+        second[c.metadata["start_index"]:c.metadata["start_index"] + len(c.page_content)] == c.page_content
+        for c in later
+    )
+
+
+def test_regulations_profile_halves_chunks_and_keeps_structure():
+    pdf = str(REGULATIONS / "SOR-2018-66.pdf")
+    _, profiled = parse_pdf(pdf, _chunk_pages)
+    _, legacy = parse_pdf(pdf, lambda pages, path: _chunk_pages(pages, path, profile="legacy"))
+    assert len(profiled) < 0.7 * len(legacy)
+    assert {c.metadata["chunk_profile"] for c in profiled} == {"regulations"}
+    assert any(c.page_content.startswith("Pneumatic controllers — bleed rate") for c in profiled)
+
+
+def test_compare_profiles_reports_counts_storage_and_hit_rate(tmp_path):
+    from src.bench.fakes import FakeEmbeddings
+
+    shutil.copy(REGULATIONS / "SOR-2018-66.pdf", tmp_path / "SOR-2018-66.pdf")
+    report = compare_profiles(str(tmp_path), ["regulations", "legacy"], embeddings=FakeEmbeddings(), max_queries=30)
+
+    regulations, legacy = report["regulations"], report["legacy"]
+    assert regulations["queries"] == legacy["queries"] == 30
+    assert regulations["chunks_vs_legacy"] < 0.7 and legacy["chunks_vs_legacy"] == 1.0
+    assert regulations["storage_bytes"] < legacy["storage_bytes"]
+    assert regulations["tokens_embedded"] < legacy["tokens_embedded"]
+    assert 0 < regulations["hit_rate"] <= 1 and 0 < legacy["hit_rate"] <= 1
+    json.dumps(report)
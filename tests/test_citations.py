@@ -0,0 +1,119 @@
+"""Tests for regulation structure parsing, the citation index and BM25 fusion"""
+import json
+from pathlib import Path
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.RAG.citations import CitationIndex, annotate_structure, doc_key, parse_citations
+from src.RAG.lexical import BM25Index, hybrid_rows
+
+REGULATIONS = Path(__file__).resolve().parent.parent / "src/RAG/Regulations"
+
+SOR_PAGES = [
+    "TABLE OF PROVISIONS\n1 Purpose\n2 Definitions\n8 Leak detection",
+    "Sections 7-8 Articles 7-8\nConserved gas — use\n7 Hydrocarbon gas that has been captured must be conserved.\n"
+    "LDAR inspections\n8 (1) An operator must inspect each equipment component three times a year.\n"
+    "(2) The inspections must be at least 60 days apart.",
+    "Section 8 Article 8\n(3) A record of each inspection must be made.",
+]
+DIRECTIVE_PAGES = [
+    "Contents\n1 Introduction ....................... 1\n2 Permits ....................... 2\n",
+    "1 Introduction\nThis directive sets out requirements for venting.\n"
+    "Directive 060 (June 2025)  2 2 Permits\nThe licensee must obtain a permit.\n"
+    "2.1 Conditions That Require a Permit\n1) A permit is required for sour gas.\n2) A permit is required above the threshold.",
+]
+
+
+def _chunks(pages, source_pdf):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=20, add_start_index=True)
+    chunks = []
+    for page, text in enumerate(pages):
+        for chunk in splitter.create_documents([text], metadatas=[{"page": page}]):
+            chunk.metadata["chunk_id"] = f"{source_pdf}-{page}-{chunk.metadata['start_index']}"
+            chunks.append(chunk)
+    return chunks
+
+
+def _index():
+    index = CitationIndex()
+    for name, pages in (("SOR-2018-66.pdf", SOR_PAGES), ("Directive060.pdf", DIRECTIVE_PAGES)):
+        chunks = _chunks(pages, name)
+        annotate_structure(chunks, name)
+        index.add_document(name, chunks)
+    return index
+
+
+def test_parse_citations_and_document_keys():
+    assert doc_key("SOR-2018-66.pdf") == doc_key("DORS/2018-66") == "sor-2018-66"
+    assert doc_key("Directive060.pdf") == doc_key("AER Directive 060") == "directive-060"
+    assert parse_citations("SOR/2018-66, Section 8(1) and Directive 060, Section 3.3.1(2)") == [
+        ("sor-2018-66", "8(1)"), ("directive-060", "3.3.1(2)")
+    ]
+    assert parse_citations("see section 37(2)(a) of SOR-2018-66") == [("sor-2018-66", "37(2)(a)")]
+    assert parse_citations("Section 8") == [(None, "8")]
+    assert parse_citations("Directive 060 requirements") == []
+
+
+def test_structure_annotation_and_exact_lookup(tmp_path):
+    index = _index()
+    rows = index.lookup("SOR/2018-66, Section 8(2)")
+    assert "60 days apart" in rows[0]["content"]
+    assert rows[0]["citation"] == "SOR/2018-66, Section 8(2)"
+    assert rows[0]["metadata"]["heading"] == "LDAR inspections"
+
+    whole = index.lookup("SOR/2018-66 s. 8")
+    assert {r["metadata"]["page"] for r in whole} == {1, 2}  # section 8 continues on the next page
+    assert index.lookup("SOR/2018-66, Section 8(3)")[0]["metadata"]["page"] == 2
+    assert index.lookup("SOR/2018-66, Section 8(1)(b)")[0]["citation"] == "SOR/2018-66, Section 8(1)"  # parent fallback
+    assert index.lookup("SOR/2018-66, Section 1") == []  # table of contents is not indexed
+
+    permit = index.lookup("D060 2.1(2)")
+    assert permit[0]["metadata"]["section"] == "2.1" and "above the threshold" in "".join(r["content"] for r in permit)
+    assert {r["metadata"]["source_pdf"] for r in index.lookup("Section 2.1")} == {"Directive060.pdf"}
+
+    index.save(str(tmp_path / "index.json"))
+    reloaded = CitationIndex.load(str(tmp_path / "index.json"))
+    assert reloaded.lookup("SOR/2018-66, Section 8(2)") == rows
+
+
+def test_lookup_tool_needs_no_embedding(monkeypatch, tmp_path):
+    import graph
+    from RAG import embedding_cache
+
+    _index().save(str(tmp_path / "index.json"))
+    monkeypatch.setenv("CITATION_INDEX_PATH", str(tmp_path / "index.json"))
+    monkeypatch.setattr(embedding_cache, "get_embeddings", lambda *a: (_ for _ in ()).throw(AssertionError("embedded")))
+
+    rows = json.loads(graph.lookup_citation("Directive 060, Section 2.1"))
+    assert rows[0]["citation"] == "Directive 060, Section 2.1"
+    assert "error" in json.loads(graph.lookup_citation("SOR/2018-66, Section 99"))
+
+
+def test_bm25_and_hybrid_fusion():
+    bm25 = BM25Index([("a", "pneumatic pump permit"), ("b", "leak inspection three times a year"), ("c", "flare stack")])
+    assert bm25.search("leak inspection", k=2)[0][0] == "b"
+
+    index = _index()
+    vector_rows = [{"id": "v1", "content": "unrelated", "metadata": {}, "similarity": 0.9}]
+    fused = hybrid_rows("Section 8(2) inspections 60 days apart", vector_rows, index, match_count=3)
+    assert len(fused) == 3
+    assert fused[0].get("citation") == "SOR/2018-66, Section 8(2)" and "rrf" in fused[0]
+    assert "v1" in {r["id"] for r in fused}
+
+
+def test_real_regulations_resolve_to_their_pages():
+    from src.RAG.ingest_regulations import _chunk_pages
+    from src.RAG.manifest import assign_chunk_ids
+    from src.RAG.pipeline import parse_pdf
+
+    index = CitationIndex()
+    for pdf in ("SOR-2018-66.pdf", "Directive060.pdf"):
+        _, chunks = parse_pdf(str(REGULATIONS / pdf), _chunk_pages)
+        assign_chunk_ids(pdf, chunks)
+        annotate_structure(chunks, pdf)
+        index.add_document(pdf, chunks)
+
+    pneumatics = index.lookup("SOR/2018-66, Section 37", max_chunks=20)
+    assert {r["metadata"]["page"] for r in pneumatics} == {37, 38}
+    assert any("Pneumatic controllers" in (r["metadata"]["heading"] or "") for r in pneumatics)
+    assert index.lookup("Directive 060, Section 8.6.1")[-1]["metadata"]["section"].startswith("8.6.1")
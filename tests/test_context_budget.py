@@ -0,0 +1,130 @@
+"""Tests for token-budgeted context compaction between agents"""
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from src.context_budget import budget_for, compact_messages, compaction_hook
+from src.instrumentation import GraphInstrumentation
+from tests.fakes import ScriptedChatModel
+
+LDAR = {"id": "a", "content": "Surveys must be conducted three times per year. " * 8,
+        "metadata": {"source_pdf": "SOR-2018-66.pdf", "page": 12, "section": "8", "subsection": "8(1)"}}
+VENT = {"id": "b", "content": "Vented volumes above 500 m3/month must be routed to flare. " * 8,
+        "metadata": {"source_pdf": "Directive060.pdf", "page": 40, "section": "3.2"}}
+FLARE = {"id": "c", "content": "Flares must meet the combustion efficiency requirements. " * 8,
+         "metadata": {"source_pdf": "Directive060.pdf", "page": 41}}
+
+
+def _call(name, args, call_id):
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}])
+
+
+def _history():
+    return [
+        HumanMessage(content="Analyze this inspection report for Oil & Gas compliance"),
+        _call("match_regulations", {"query": "ldar"}, "1"),
+        ToolMessage(content=json.dumps([LDAR, VENT]), name="match_regulations", tool_call_id="1"),
+        _call("match_regulations_many", {"queries": ["venting", "flaring"]}, "2"),
+        ToolMessage(content=json.dumps([{"query": "venting", "rows": [VENT]}, {"query": "flaring", "rows": [FLARE]}]),
+                    name="match_regulations_many", tool_call_id="2"),
+    ]
+
+
+def test_consumed_payloads_become_references_and_passages_are_deduped():
+    history = _history()
+    raw = [m.content for m in history]
+    compacted, stats = compact_messages(history, budget=10_000)
+
+    assert [m.content for m in history] == raw  # state is never modified
+    consumed = compacted[2].content
+    assert consumed.startswith("[match_regulations result, already used")
+    assert "[1] SOR/2018-66, Section 8(1), p. 12: Surveys must be conducted" in consumed
+    assert "[2] Directive 060, Section 3.2, p. 40" in consumed and "…" in consumed
+
+    live = json.loads(compacted[4].content)  # not answered yet: full rows, repeats by pointer
+    assert live[0]["rows"][0] == {**VENT, "content": "(same passage as [2] above)", "ref": 2}
+    assert live[1]["rows"][0]["ref"] == 3 and live[1]["rows"][0]["content"] == FLARE["content"]
+    assert (stats["payloads_compacted"], stats["passages_deduped"], stats["messages_cut"]) == (1, 1, 0)
+    assert stats["tokens_after"] < stats["tokens_before"]
+
+
+def test_over_budget_history_is_cut_in_the_middle_but_not_the_newest_turn():
+    notes = AIMessage(content="notes " + "gap note. " * 1500, name="gap_analyzer_agent")
+    history = _history()[:1] + [notes] + _history()[1:]
+    compacted, stats = compact_messages(history, budget=1500)
+
+    assert "tokens omitted to fit the context budget" in compacted[1].content
+    assert compacted[1].content.startswith("notes gap note.")
+    assert "[1] SOR/2018-66, Section 8(1), p. 12\n" in compacted[3].content  # snippets dropped first
+    assert [m.content for m in compacted[-3:]][1:] == [history[-2].content, compacted[-1].content]
+    assert "tokens omitted" not in compacted[-1].content
+    assert stats["messages_cut"] == 1 and stats["tokens_after"] <= 1500
+
+
+def test_the_triage_request_with_its_findings_is_never_cut():
+    request = HumanMessage(content="Analyze this report. Findings:\n" + "F-12 gas detector bypassed on skid 4. " * 400)
+    handoff = HumanMessage(content="Earlier report for context: " + "unrelated paragraph. " * 600)
+    notes = AIMessage(content="notes " + "gap note. " * 600, name="gap_analyzer_agent")
+    history = [request, handoff, notes] + _history()[1:]
+    compacted, stats = compact_messages(history, budget=4000)
+
+    assert compacted[0].content == request.content
+    assert "tokens omitted" in compacted[2].content  # agent turns are cut before a later human message
+    assert "tokens omitted" in compacted[1].content and stats["messages_cut"] == 2
+    assert all("tokens omitted" not in m.content for m in compacted[-3:])
+
+
+def test_budgets_from_environment(monkeypatch):
+    assert budget_for("gap_analyzer_agent") == 10000 and budget_for("unknown_agent") == 8000
+    monkeypatch.setenv("CONTEXT_BUDGET_TOKENS", "3000")
+    monkeypatch.setenv("CONTEXT_BUDGETS", "supervisor=1200, report_generator_agent=9000")
+    assert budget_for("supervisor") == 1200 and budget_for("report_generator_agent") == 9000
+    assert budget_for("gap_analyzer_agent") == 3000
+    monkeypatch.setenv("CONTEXT_COMPACTION", "0")
+    assert compaction_hook("supervisor") is None
+
+
+class RecordingChatModel(ScriptedChatModel):
+    seen: list = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.seen.append(list(messages))
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def test_hook_compacts_model_input_and_instrumentation_reports_savings():
+    from langgraph.prebuilt import create_react_agent
+    from langgraph_supervisor import create_supervisor
+
+    @tool
+    def match_regulations(query: str) -> str:
+        """Search regulations."""
+        return json.dumps([LDAR, VENT])
+
+    supervisor = ScriptedChatModel(responses=iter([
+        _call("transfer_to_compliance_retriever_agent", {}, "s1"),
+        AIMessage(content="done"),
+    ]))
+    retriever = RecordingChatModel(responses=iter([
+        _call("match_regulations", {"query": "ldar"}, "r1"),
+        _call("match_regulations", {"query": "venting"}, "r2"),
+        AIMessage(content="found"),
+    ]), seen=[])
+    agent = create_react_agent(model=retriever, tools=[match_regulations], name="compliance_retriever_agent", prompt="r",
+                               pre_model_hook=compaction_hook("compliance_retriever_agent"))
+    handler = GraphInstrumentation(jsonl_path=None, prom_path=None)
+    graph = create_supervisor(agents=[agent], model=supervisor, prompt="s", pre_model_hook=compaction_hook("supervisor"))
+    graph.compile(name="agent").with_config(callbacks=[handler]).invoke({"messages": [HumanMessage(content="hi")]})
+
+    last_input = retriever.seen[-1]
+    assert last_input[-3].content.startswith("[match_regulations result, already used")
+    assert json.loads(last_input[-1].content)[0]["content"] == "(same passage as [1] above)"
+
+    (record,) = handler.records
+    ret = record["nodes"]["compliance_retriever_agent"]
+    assert ret["compactions"] == 3 and ret["context_tokens_after"] < ret["context_tokens_before"]
+    assert record["nodes"]["supervisor"]["compactions"] == 2
+    assert record["context"]["tokens_saved"] == ret["context_tokens_before"] - ret["context_tokens_after"] + (
+        record["nodes"]["supervisor"]["context_tokens_before"] - record["nodes"]["supervisor"]["context_tokens_after"])
+    assert 'graph_context_tokens_total{node="compliance_retriever_agent",stage="before"}' in handler.registry.to_prometheus()
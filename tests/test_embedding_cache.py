@@ -0,0 +1,72 @@
+"""Tests for the persistent embedding cache"""
+from langchain_core.embeddings import Embeddings
+
+from src.RAG.embedding_cache import CachedEmbeddings, EmbeddingCache, text_key
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic provider stand-in that records every call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text)), 1.0, 0.5]
+
+
+def _cached(tmp_path, max_entries=100, batch_size=2):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_entries=max_entries)
+    provider = CountingEmbeddings()
+    return CachedEmbeddings(provider, cache, batch_size=batch_size), provider
+
+
+def test_text_key_normalizes_whitespace():
+    assert text_key("  LDAR   survey\n") == text_key("LDAR survey")
+
+
+def test_only_misses_reach_provider_in_batches(tmp_path):
+    emb, provider = _cached(tmp_path)
+    first = emb.embed_documents(["a", "bb", "a", "ccc"])
+    assert provider.calls == [["a", "bb"], ["ccc"]]
+    assert first[0] == first[2]
+
+    provider.calls.clear()
+    again = emb.embed_documents(["bb", "dddd"])
+    assert provider.calls == [["dddd"]]
+    assert again[0] == first[1]
+    assert emb.cache.hits >= 1 and emb.cache.misses >= 4
+
+
+def test_query_and_documents_share_cache(tmp_path):
+    emb, provider = _cached(tmp_path)
+    emb.embed_documents(["venting limits"])
+    provider.calls.clear()
+    assert emb.embed_query("venting limits") == [14.0, 1.0, 0.5]
+    assert provider.calls == []
+
+
+def test_cache_persists_across_instances(tmp_path):
+    emb, _ = _cached(tmp_path)
+    emb.embed_documents(["methane"])
+    emb.cache.close()
+
+    emb2, provider2 = _cached(tmp_path)
+    emb2.embed_documents(["methane"])
+    assert provider2.calls == []
+
+
+def test_lru_eviction_keeps_recent_entries(tmp_path):
+    emb, _ = _cached(tmp_path, max_entries=2, batch_size=10)
+    emb.embed_documents(["one"])
+    emb.embed_documents(["two"])
+    emb.embed_query("one")  # refresh 'one'
+    emb.embed_documents(["three"])
+
+    assert len(emb.cache) == 2
+    assert emb.cache.evictions == 1
+    assert text_key("two") not in emb.cache.get_many(emb.model_name, [text_key("two")])
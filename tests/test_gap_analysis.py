@@ -0,0 +1,131 @@
+"""Tests for the map-reduce gap analysis over whole inspection reports"""
+import json
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+import gap_analysis
+import graph
+from tests.fakes import ScriptedChatModel
+
+REPORT = "Title: Site B\n\n1) Scope\nOil battery.\n\n2) Emissions & LDAR\n- No LDAR survey since 2023.\n\n" \
+         "3) Venting & Flaring\n- Routine venting 1,200 m3/month.\n\nPRELIMINARY CONCERNS\n- LDAR frequency inadequate.\n"
+
+REPLIES = {
+    "2) Emissions & LDAR": "- LDAR survey overdue | SOR/2018-66, Section 9(1) | Medium",
+    "3) Venting & Flaring": "- Routine venting above limit | AER Directive 060, Section 8.3 | High",
+    "PRELIMINARY CONCERNS": "- LDAR survey frequency overdue | SOR/2018-66, Section 9(2) | High",
+}
+
+
+class SectionModel:
+    """Replies per section title and records how many calls overlap."""
+
+    def __init__(self):
+        self.active = self.peak = self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, messages):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        title = messages[1].content.split("\n")[0].replace("Report section: ", "")
+        return AIMessage(content=REPLIES.get(title, "NONE"))
+
+
+def test_sections_cover_the_whole_report_and_grow_instead_of_multiplying():
+    sections = gap_analysis.split_sections(REPORT, section_chars=60, max_sections=8)
+    assert "".join(s["text"] for s in sections) == REPORT
+    assert [s["title"] for s in sections] == ["Title: Site B", "2) Emissions & LDAR", "3) Venting & Flaring", "PRELIMINARY CONCERNS"]
+
+    long_report = "\n".join(f"{i}) Area {i}\n" + "Inspection note. " * 40 for i in range(1, 60))
+    sections = gap_analysis.split_sections(long_report, section_chars=500, max_sections=8)
+    assert len(sections) <= 8 and "".join(s["text"] for s in sections) == long_report
+    assert gap_analysis.split_sections("  \n") == []
+
+
+def test_parse_and_reduce_dedupe_and_rank_by_severity():
+    assert gap_analysis.parse_section_gaps("NONE", "s") == []
+    assert gap_analysis.parse_section_gaps("- Pneumatics not inventoried (Medium)\n- **Flare pilots out** | Directive 060 | Low", "s") == [
+        {"title": "Pneumatics not inventoried", "citation": None, "severity": "Medium", "sections": ["s"]},
+        {"title": "Flare pilots out", "citation": "Directive 060", "severity": "Low", "sections": ["s"]},
+    ]
+    mapped = [
+        {"index": i, "gaps": gap_analysis.parse_section_gaps(reply, title)}
+        for i, (title, reply) in enumerate(REPLIES.items())
+    ]
+    gaps = gap_analysis.reduce_gaps(mapped)
+    assert [(g["title"], g["severity"]) for g in gaps] == [
+        ("LDAR survey frequency overdue", "High"),  # same rule raised twice: highest severity wins, ranked first
+        ("Routine venting above limit", "High"),
+    ]
+    assert gaps[0]["sections"] == ["2) Emissions & LDAR", "PRELIMINARY CONCERNS"]
+
+
+def test_map_reduce_runs_sections_concurrently_within_the_limit(monkeypatch):
+    model, queries = SectionModel(), []
+    monkeypatch.setattr(graph, "get_model", lambda: model)
+    monkeypatch.setattr(graph, "match_regulations", lambda query, match_count=5: queries.append(query) or json.dumps(
+        [{"id": len(queries) % 2, "content": "Inspect three times a year", "metadata": {"source_pdf": "SOR-2018-66.pdf", "page": 9}, "similarity": 0.8}]
+    ))
+    monkeypatch.setenv("GAP_SECTION_CHARS", "60")
+
+    findings = gap_analysis.map_reduce_gaps(REPORT, concurrency=2)
+
+    assert model.calls == len(queries) == 4 and model.peak == 2
+    assert findings["coverage"] == 1.0 and findings["timings"]["sections"] == 4
+    assert [g["severity"] for g in findings["gaps"]] == ["High", "High"]
+    assert findings["context"].count("Inspect three times a year") == 2  # passages deduped by id
+    block = gap_analysis.format_findings(findings)
+    assert block.startswith(graph.MAPPED_FINDINGS_MARKER)
+    assert "1. [High] LDAR survey frequency overdue — SOR/2018-66, Section 9(2)" in block
+
+
+def test_pipeline_goes_straight_to_the_report_with_mapped_findings(monkeypatch):
+    from triage import run_analysis
+
+    findings = {"gaps": [{"title": "LDAR overdue", "citation": None, "severity": "High", "sections": ["2)"]}],
+                "context": "[1] (SOR-2018-66.pdf, 9) text", "sections": [{"title": "2)"}]}
+    monkeypatch.setattr(graph, "match_regulations", lambda *a, **k: (_ for _ in ()).throw(AssertionError("retrieved")))
+    model = ScriptedChatModel(responses=iter([AIMessage(content="Executive summary: LDAR overdue.")]))
+    monkeypatch.setattr(graph, "get_model", lambda: model)
+
+    assert run_analysis("site.pdf", "full text", agent=graph.get_pipeline(), findings=findings) == "Executive summary: LDAR overdue."
+
+
+def test_map_reduce_is_on_unless_disabled(monkeypatch):
+    from triage import analysis_variant, map_reduce_findings
+
+    monkeypatch.delenv("GAP_MAP_REDUCE", raising=False)
+    monkeypatch.setattr(gap_analysis, "map_reduce_gaps", lambda text, limit=None: {"gaps": []})
+    assert map_reduce_findings(REPORT) == {"gaps": []} and analysis_variant()["map_reduce"] is True
+    monkeypatch.setenv("GAP_MAP_REDUCE", "0")
+    assert map_reduce_findings(REPORT) is None and analysis_variant()["map_reduce"] is False
+
+
+def test_every_map_call_takes_a_gemini_slot(monkeypatch):
+    from contextlib import contextmanager
+
+    from src.RAG.batch_triage import ProviderLimits
+
+    model, taken = SectionModel(), []
+    limits = ProviderLimits({"gemini": 1})
+
+    @contextmanager
+    def limit(provider):
+        with limits.limit(provider):
+            taken.append(provider)
+            yield
+
+    monkeypatch.setattr(graph, "get_model", lambda: model)
+    monkeypatch.setattr(graph, "match_regulations", lambda query, match_count=5: "[]")
+    monkeypatch.setenv("GAP_SECTION_CHARS", "60")
+
+    findings = gap_analysis.map_reduce_gaps(REPORT, concurrency=4, limit=limit)
+    assert findings["timings"]["concurrency"] == 4
+    assert taken == ["gemini"] * 4 and model.calls == 4 and model.peak == 1
@@ -0,0 +1,102 @@
+"""Tests for the shared HTTP pools, retries and async tool paths"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.RAG import http_pool
+from src.RAG.backends import SupabaseBackend
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setenv("HTTP_BACKOFF_S", "0")
+    monkeypatch.setenv("HTTP_RETRIES", "2")
+
+
+def _flaky_handler(failures):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) <= failures:
+            return httpx.Response(503)
+        return httpx.Response(200, json=[{"id": "1", "similarity": 0.9}])
+
+    return handler, calls
+
+
+def test_sync_retry_recovers_from_5xx():
+    handler, calls = _flaky_handler(failures=2)
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    resp = http_pool.request_with_retry("POST", "https://x/rpc", client=client, json={})
+    assert resp.json()[0]["id"] == "1"
+    assert len(calls) == 3
+
+
+def test_sync_retry_gives_up():
+    handler, calls = _flaky_handler(failures=10)
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.HTTPStatusError):
+        http_pool.request_with_retry("GET", "https://x/", client=client)
+    assert len(calls) == 3
+
+
+def test_async_supabase_match_shares_one_pool(monkeypatch):
+    handler, calls = _flaky_handler(failures=1)
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        http_pool._async_clients[asyncio.get_running_loop()] = client
+        backend = SupabaseBackend(client=None, url="https://proj.supabase.co/", key="k")
+        results = await asyncio.gather(*[backend.amatch([0.1, 0.2], 3, {"corpus": "regulations"}) for _ in range(20)])
+        await client.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert all(r[0]["id"] == "1" for r in results)
+    assert len(calls) == 21  # one retried 503, then 20 successes over the same client
+    body = json.loads(calls[-1].content)
+    assert calls[-1].url.path == "/rest/v1/rpc/match_documents_oag_compliance"
+    assert calls[-1].headers["apikey"] == "k"
+    assert body == {"query_embedding": [0.1, 0.2], "match_count": 3, "filter": {"corpus": "regulations"}}
+
+
+def test_tools_expose_async_coroutines():
+    from src.graph import get_tools
+
+    tools = get_tools()
+    assert tools["match_regulations"].coroutine is not None
+    assert tools["web_search"].coroutine is not None
+
+
+def test_async_pool_is_per_event_loop():
+    async def pool():
+        return http_pool.get_async_http_client()
+
+    async def same_loop():
+        first = await pool()
+        assert await pool() is first
+        await http_pool.aclose_async_http_client()
+        assert first.is_closed and (await pool()) is not first
+        await http_pool.aclose_async_http_client()
+        return first
+
+    first, second = asyncio.run(same_loop()), asyncio.run(pool())
+    assert second is not first and not second.is_closed  # a new loop never reuses a dead loop's connections
+
+
+def test_loop_local_client_sends_through_the_running_loops_pool():
+    handler, calls = _flaky_handler(failures=0)
+
+    async def run():
+        http_pool._async_clients[asyncio.get_running_loop()] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        handle = http_pool.LoopLocalAsyncClient()
+        response = await handle.post("https://x/embeddings", json={})
+        await http_pool.aclose_async_http_client()
+        return response
+
+    for _ in range(2):  # the same handle works from a second loop
+        assert asyncio.run(run()).json()[0]["id"] == "1"
+    assert len(calls) == 2
@@ -0,0 +1,93 @@
+"""Tests for the pipelined bulk-ingestion engine"""
+from pathlib import Path
+
+from src.RAG.ingest_regulations import _chunk_pages
+from src.RAG.backends import LocalBackend
+from src.RAG.pipeline import FileTask, IngestionEngine
+
+TEST_FILES = Path(__file__).resolve().parent.parent / "src/RAG/Regulations/test_files"
+
+
+class RecordingSink:
+    def __init__(self):
+        self.batches = []
+        self.deleted = []
+        self.sources_cleared = []
+
+    def upsert(self, rows):
+        self.batches.append(rows)
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+    def delete_source(self, source_pdf, corpus="regulations", source_path=None):
+        self.sources_cleared.append(source_pdf)
+
+    def flush(self):
+        pass
+
+
+class BatchEmbeddings:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def embed_documents(self, texts):
+        self.batch_sizes.append(len(texts))
+        return [[1.0, 0.0] for _ in texts]
+
+
+def _tasks():
+    return [FileTask(p, "sha-" + p.name, None) for p in sorted(TEST_FILES.glob("*.pdf"))]
+
+
+def test_engine_batches_and_commits_every_file():
+    sink, emb, committed = RecordingSink(), BatchEmbeddings(), []
+    engine = IngestionEngine(
+        sink, emb, _chunk_pages,
+        parse_workers=2, embed_concurrency=2, embed_batch_size=4, upsert_batch_size=7, queue_size=1,
+        on_file_done=committed.append, log=lambda _: None,
+    )
+    tasks = _tasks()
+    stats = engine.run(tasks)
+
+    rows = [r for batch in sink.batches for r in batch]
+    assert stats.files == len(tasks) and stats.pages > 0
+    assert stats.rows == stats.chunks == len(rows)
+    assert max(emb.batch_sizes) <= 4
+    assert all(len(batch) <= 7 for batch in sink.batches)
+    assert sorted(t.name for t in committed) == sorted(t.name for t in tasks)
+    assert sorted(sink.sources_cleared) == sorted(t.name for t in tasks)
+    for task in tasks:
+        indexes = [c.metadata["chunk_index"] for c in task.upsert]
+        assert indexes == list(range(len(indexes)))
+
+    report = stats.report()
+    assert report["pages_per_s"] > 0 and report["rows_per_s"] > 0
+
+
+def test_engine_surfaces_stage_errors():
+    class FailingEmbeddings:
+        def embed_documents(self, texts):
+            raise RuntimeError("provider down")
+
+    engine = IngestionEngine(RecordingSink(), FailingEmbeddings(), _chunk_pages, parse_workers=0, log=lambda _: None)
+    try:
+        engine.run(_tasks())
+    except RuntimeError as exc:
+        assert "provider down" in str(exc)
+    else:
+        raise AssertionError("expected the embedding failure to propagate")
+
+
+def test_local_backend_commits_after_flush(tmp_path):
+    backend = LocalBackend(path=str(tmp_path / "idx"))
+    committed = []
+
+    def on_done(task):
+        assert (tmp_path / "idx" / "vectors.npy").exists()  # persisted before the manifest moves
+        committed.append(task.name)
+
+    engine = IngestionEngine(backend, BatchEmbeddings(), _chunk_pages, parse_workers=0, on_file_done=on_done, log=lambda _: None)
+    stats = engine.run(_tasks())
+    assert len(committed) == 2
+    assert len(LocalBackend(path=str(tmp_path / "idx"))) == stats.rows
@@ -0,0 +1,164 @@
+"""Tests for incremental, manifest-driven regulation ingestion"""
+import shutil
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.RAG.ingest_regulations import ingest_regulations
+
+FIXTURE_PDF = Path(__file__).resolve().parent.parent / "src/RAG/Regulations/test_files/2nd_synthetic_Inspection_Report_SiteB_NonCompliant.pdf"
+
+
+@pytest.fixture(autouse=True)
+def generation_file(tmp_path, monkeypatch):
+    path = tmp_path / "corpus_generation"
+    monkeypatch.setenv("CORPUS_GENERATION_PATH", str(path))
+    monkeypatch.setenv("CITATION_INDEX_PATH", str(tmp_path / "citation_index.json"))
+    return path
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.embedded = 0
+        self.cache = MagicMock()
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [[0.0] * 3 for _ in texts]
+
+
+def _upserted_ids(client):
+    ids = []
+    for call in client.table.return_value.upsert.call_args_list:
+        ids.extend(row["id"] for row in call.args[0])
+    return ids
+
+
+def _run(directory, manifest, client, **kwargs):
+    fake = FakeEmbeddings()
+    with patch("src.RAG.ingest_regulations.get_embeddings", return_value=fake):
+        summary = ingest_regulations(str(directory), manifest_file=str(manifest), client=client, **kwargs)
+    return summary, fake
+
+
+def test_rerun_is_idempotent(tmp_path):
+    docs = tmp_path / "regs"
+    docs.mkdir()
+    shutil.copy(FIXTURE_PDF, docs / "site.pdf")
+    manifest = tmp_path / "manifest.json"
+
+    client = MagicMock()
+    first, fake = _run(docs, manifest, client)
+    assert first["new"] == 1 and first["upserted"] > 0
+    assert fake.embedded == first["upserted"]
+    ids = _upserted_ids(client)
+    assert len(ids) == len(set(ids))
+
+    client2 = MagicMock()
+    second, fake2 = _run(docs, manifest, client2)
+    assert second["unchanged"] == 1 and second["upserted"] == 0
+    assert fake2.embedded == 0
+    client2.table.return_value.upsert.assert_not_called()
+
+    client3 = MagicMock()
+    _run(docs, manifest, client3, incremental=False)
+    assert sorted(_upserted_ids(client3)) == sorted(ids)  # deterministic IDs
+
+
+def test_corpus_generation_bumps_only_on_change(tmp_path, generation_file):
+    from src.RAG.manifest import corpus_generation
+
+    docs = tmp_path / "regs"
+    docs.mkdir()
+    shutil.copy(FIXTURE_PDF, docs / "site.pdf")
+    manifest = tmp_path / "manifest.json"
+
+    first, _ = _run(docs, manifest, MagicMock())
+    assert first["generation"] == corpus_generation(str(generation_file)) == 1
+    second, _ = _run(docs, manifest, MagicMock())
+    assert "generation" not in second
+    assert corpus_generation(str(generation_file)) == 1
+
+
+def test_removed_pdf_deletes_its_chunks(tmp_path):
+    docs = tmp_path / "regs"
+    docs.mkdir()
+    shutil.copy(FIXTURE_PDF, docs / "site.pdf")
+    manifest = tmp_path / "manifest.json"
+    first, _ = _run(docs, manifest, MagicMock())
+
+    (docs / "site.pdf").unlink()
+    client = MagicMock()
+    summary, _ = _run(docs, manifest, client)
+    assert summary["removed"] == 1
+    assert summary["deleted"] == first["upserted"]
+    client.table.return_value.delete.return_value.in_.assert_called()
+
+
+def test_dry_run_writes_nothing(tmp_path):
+    docs = tmp_path / "regs"
+    docs.mkdir()
+    shutil.copy(FIXTURE_PDF, docs / "site.pdf")
+    manifest = tmp_path / "manifest.json"
+
+    summary, fake = _run(docs, manifest, None, dry_run=True)
+    assert summary["new"] == 1 and summary["upserted"] > 0
+    assert fake.embedded == 0
+    assert not manifest.exists()
+
+
+def test_citation_index_is_written_and_backfilled_without_re_embedding(tmp_path, generation_file, capsys):
+    from src.RAG.citations import CitationIndex
+    from src.RAG.manifest import corpus_generation
+
+    docs = tmp_path / "regs"
+    docs.mkdir()
+    shutil.copy(FIXTURE_PDF, docs / "site.pdf")
+    manifest = tmp_path / "manifest.json"
+    index_file = tmp_path / "citation_index.json"
+
+    first, _ = _run(docs, manifest, MagicMock())
+    assert len(CitationIndex.load(str(index_file))) == first["upserted"]
+
+    index_file.unlink()  # e.g. a corpus ingested before the index existed
+    client = MagicMock()
+    capsys.readouterr()
+    second, fake = _run(docs, manifest, client)
+    assert "site.pdf: reindex," in capsys.readouterr().out
+    assert second["unchanged"] == 1 and second["upserted"] == 0 and fake.embedded == 0
+    client.table.return_value.upsert.assert_not_called()
+    assert CitationIndex.load(str(index_file)).has_document("site.pdf")
+    assert "generation" not in second and corpus_generation(str(generation_file)) == 1  # reindex only
+
+
+def test_changing_the_chunk_profile_rechunks_unchanged_pdfs(tmp_path):
+    docs = tmp_path / "regs"
+    docs.mkdir()
+    shutil.copy(FIXTURE_PDF, docs / "site.pdf")
+    manifest = tmp_path / "manifest.json"
+
+    first, _ = _run(docs, manifest, MagicMock(), chunk_profile="legacy")
+    second, fake = _run(docs, manifest, MagicMock(), chunk_profile="regulations")
+    assert second["changed"] == 1 and second["unchanged"] == 0
+    assert 0 < second["deleted"] <= first["upserted"] and fake.embedded == second["upserted"] > 0
+    third, fake = _run(docs, manifest, MagicMock(), chunk_profile="regulations")
+    assert third["unchanged"] == 1 and fake.embedded == 0
+
+
+def test_same_name_in_another_directory_does_not_clear_its_rows(tmp_path):
+    manifest = tmp_path / "manifest.json"
+    for sub in ("a", "b"):
+        (tmp_path / sub).mkdir()
+        shutil.copy(FIXTURE_PDF, tmp_path / sub / "permit.pdf")
+
+    first = MagicMock()
+    _run(tmp_path / "a", manifest, first)
+    first.table.return_value.delete.return_value.contains.assert_called_once_with(
+        "metadata", {"corpus": "regulations", "source_pdf": "permit.pdf"}
+    )
+    second = MagicMock()
+    _run(tmp_path / "b", manifest, second)
+    second.table.return_value.delete.return_value.contains.assert_called_once_with(
+        "metadata", {"corpus": "regulations", "source_pdf": "permit.pdf", "source_path": str(tmp_path / "b" / "permit.pdf")}
+    )
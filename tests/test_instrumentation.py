@@ -0,0 +1,108 @@
+"""Tests for local per-node graph instrumentation and its exporters"""
+import json
+import urllib.request
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+from src.instrumentation import GraphInstrumentation, serve_metrics, summarize
+from tests.fakes import ScriptedChatModel
+
+
+def _usage(prompt, completion):
+    return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _supervisor_graph(handler):
+    from langgraph.prebuilt import create_react_agent
+    from langgraph_supervisor import create_supervisor
+
+    @tool
+    def match_regulations(query: str) -> str:
+        """Search regulations."""
+        return "rows"
+
+    supervisor = ScriptedChatModel(responses=iter([
+        AIMessage(content="route", tool_calls=[{"name": "transfer_to_compliance_retriever_agent", "args": {}, "id": "1"}], usage_metadata=_usage(100, 5)),
+        AIMessage(content="done", usage_metadata=_usage(300, 10)),
+    ]))
+    retriever = ScriptedChatModel(responses=iter([
+        AIMessage(content="search", tool_calls=[{"name": "match_regulations", "args": {"query": "ldar"}, "id": "2"}], usage_metadata=_usage(50, 3)),
+        AIMessage(content="found", usage_metadata=_usage(80, 7)),
+    ]))
+    agent = create_react_agent(model=retriever, tools=[match_regulations], name="compliance_retriever_agent", prompt="r")
+    graph = create_supervisor(agents=[agent], model=supervisor, prompt="s").compile(name="agent")
+    return graph.with_config(callbacks=[handler])
+
+
+def test_records_per_node_llm_calls_tokens_and_tools(tmp_path):
+    handler = GraphInstrumentation(jsonl_path=str(tmp_path / "m.jsonl"), prom_path=str(tmp_path / "m.prom"))
+    graph = _supervisor_graph(handler)
+    list(graph.stream({"messages": [HumanMessage(content="hi")]}, stream_mode=["messages", "updates"], subgraphs=True))
+
+    (record,) = handler.records
+    assert record["graph"] == "agent" and record["error"] is None and record["wall_s"] > 0
+    sup, ret = record["nodes"]["supervisor"], record["nodes"]["compliance_retriever_agent"]
+    assert (sup["runs"], sup["llm_calls"], sup["prompt_tokens"], sup["completion_tokens"]) == (2, 2, 400, 15)
+    assert (ret["runs"], ret["llm_calls"], ret["prompt_tokens"], ret["completion_tokens"], ret["tool_calls"]) == (1, 2, 130, 10, 1)
+    assert record["tools"]["match_regulations"]["calls"] == 1
+    assert record["tools"]["match_regulations"]["errors"] == 0
+
+    lines = (tmp_path / "m.jsonl").read_text().splitlines()
+    assert json.loads(lines[0])["run_id"] == record["run_id"]
+    prom = (tmp_path / "m.prom").read_text()
+    assert 'graph_runs_total{graph="agent"} 1' in prom
+    assert 'graph_llm_tokens_total{node="supervisor",kind="prompt"} 400' in prom
+    assert 'graph_tool_calls_total{tool="match_regulations"} 1' in prom
+
+
+def test_summarize_and_http_endpoint(tmp_path):
+    handler = GraphInstrumentation(jsonl_path=str(tmp_path / "m.jsonl"), prom_path=str(tmp_path / "m.prom"))
+    _supervisor_graph(handler).invoke({"messages": [HumanMessage(content="hi")]})
+
+    summary = summarize(handler.records)
+    assert summary["runs"] == 1
+    assert set(summary["nodes"]) == {"supervisor", "compliance_retriever_agent"}
+
+    server = serve_metrics(handler.registry, port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        body = urllib.request.urlopen(url, timeout=5).read().decode()
+    finally:
+        server.shutdown()
+    assert 'graph_llm_calls_total{node="compliance_retriever_agent"} 2' in body
+
+
+def test_cache_hits_are_attributed_to_the_run(tmp_path, monkeypatch):
+    from src import instrumentation
+
+    counters = iter([{"embedding_hit": 3, "embedding_miss": 1}, {"embedding_hit": 7, "embedding_miss": 1}])
+    monkeypatch.setattr(instrumentation, "_cache_counters", lambda: next(counters))
+    handler = GraphInstrumentation(jsonl_path=str(tmp_path / "m.jsonl"), prom_path=str(tmp_path / "m.prom"))
+
+    from langgraph.graph import END, START, MessagesState, StateGraph
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("noop", lambda state: {})
+    builder.add_edge(START, "noop")
+    builder.add_edge("noop", END)
+    builder.compile().with_config(callbacks=[handler]).invoke({"messages": []})
+    assert handler.records[-1]["cache"] == {"embedding_hit": 4}
+    assert handler.records[-1]["nodes"]["noop"]["runs"] == 1
+
+
+def test_process_handler_follows_environment(tmp_path, monkeypatch):
+    from src.instrumentation import get_instrumentation
+
+    get_instrumentation.cache_clear()
+    assert get_instrumentation() is None  # conftest keeps test runs out of .cache
+
+    monkeypatch.setenv("GRAPH_METRICS_DISABLED", "0")
+    monkeypatch.setenv("GRAPH_METRICS_JSONL", str(tmp_path / "runs.jsonl"))
+    monkeypatch.setenv("GRAPH_METRICS_PROM", str(tmp_path / "runs.prom"))
+    get_instrumentation.cache_clear()
+    try:
+        handler = get_instrumentation()
+        assert (handler.jsonl_path, handler.prom_path) == (str(tmp_path / "runs.jsonl"), str(tmp_path / "runs.prom"))
+    finally:
+        get_instrumentation.cache_clear()
@@ -0,0 +1,107 @@
+"""Tests for the background job queue and worker pool"""
+import threading
+import time
+
+from src.jobs import JobRunner, JobStore, save_upload
+
+
+def _wait_for(store, job_ids, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = [store.get(j) for j in job_ids]
+        if all(j["state"] in ("done", "rejected", "failed") for j in jobs):
+            return jobs
+        time.sleep(0.02)
+    raise AssertionError("jobs did not finish in time")
+
+
+def test_jobs_persist_and_report_stage_progress(tmp_path):
+    def run_job(pdf_path, name, on_stage, limit, on_update):
+        for stage in ("extract", "filter", "ingest", "analyze"):
+            on_stage(stage, "running")
+            on_stage(stage, "done")
+        relevant = "relevant" in name
+        return {"relevance": "Yes" if relevant else "No", "relevant": relevant, "report": "report" if relevant else None}
+
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    runner = JobRunner(store, workers=2, run_job=run_job, poll_interval=0.01).start()
+    ids = [store.submit("relevant.pdf", "a.pdf"), store.submit("other.pdf", "b.pdf")]
+    runner.notify()
+    first, second = _wait_for(store, ids)
+    runner.stop()
+
+    assert first["state"] == "done" and first["report"] == "report" and first["fraction"] == 1.0
+    assert all(s["status"] == "done" and "seconds" in s for s in first["progress"].values())
+    assert second["state"] == "rejected" and second["relevance"] == "No"
+
+    reopened = JobStore(str(tmp_path / "jobs.sqlite3"))
+    assert {j["id"] for j in reopened.list()} == set(ids)
+
+
+def test_failed_job_records_error_and_stage(tmp_path):
+    def run_job(pdf_path, name, on_stage, limit, on_update):
+        on_stage("extract", "running")
+        raise ValueError("bad pdf")
+
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    runner = JobRunner(store, workers=1, run_job=run_job, poll_interval=0.01).start()
+    (job,) = _wait_for(store, [store.submit("x.pdf", "x.pdf")])
+    runner.stop()
+    assert job["state"] == "failed" and "bad pdf" in job["error"]
+    assert job["progress"]["extract"]["status"] == "failed"
+
+
+def test_interrupted_jobs_are_requeued(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit("x.pdf", "x.pdf")
+    store.claim()
+    store.update_stage(job_id, "extract", "running")
+    assert store.requeue_running() == 1
+    job = store.get(job_id)
+    assert job["state"] == "queued" and job["progress"]["extract"]["status"] == "pending"
+
+
+def test_provider_limits_bound_concurrency(tmp_path):
+    active = {"n": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def run_job(pdf_path, name, on_stage, limit, on_update):
+        with limit("gemini"):
+            with lock:
+                active["n"] += 1
+                active["peak"] = max(active["peak"], active["n"])
+            time.sleep(0.05)
+            with lock:
+                active["n"] -= 1
+        return {"relevance": "Yes", "relevant": True, "report": "ok"}
+
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    runner = JobRunner(store, workers=4, limits={"gemini": 1}, run_job=run_job, poll_interval=0.01).start()
+    ids = [store.submit(f"{i}.pdf", f"{i}.pdf") for i in range(4)]
+    _wait_for(store, ids)
+    runner.stop()
+    assert active["peak"] == 1
+
+
+def test_save_upload_uses_a_folder_per_job(tmp_path):
+    a = save_upload("report.pdf", b"%PDF-a", str(tmp_path))
+    b = save_upload("report.pdf", b"%PDF-b", str(tmp_path))
+    assert a["pdf_path"] != b["pdf_path"]
+    assert open(a["pdf_path"], "rb").read() == b"%PDF-a"
+
+
+def test_triage_document_skips_ingest_for_irrelevant_documents(monkeypatch):
+    from src import triage
+
+    import graph
+    from RAG import rag
+
+    calls = []
+    monkeypatch.setattr(triage, "extract_pages", lambda path: [{"page_content": "FIFA World Cup final", "metadata": {}}])
+    monkeypatch.setattr(graph, "evaluate_document_theme", lambda text: "No")
+    monkeypatch.setattr(rag, "run_rag_pipeline", lambda path: calls.append("ingest"))
+    stages = []
+    result = triage.triage_document("x.pdf", "x.pdf", on_stage=lambda s, status: stages.append((s, status)))
+    assert result == {"relevance": "No", "relevant": False, "report": None, "timings": None}
+    assert calls == []
+    assert stages[-2:] == [("ingest", "skipped"), ("analyze", "skipped")]
@@ -0,0 +1,200 @@
+"""Tests for the pgvector schema migrations, ANN search parameters and the recall benchmark helpers"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.bench.pgvector import clustered_vectors, recall_at_k, vector_literal
+from src.RAG import migrate
+from src.RAG.backends import SupabaseBackend
+
+
+class FakeConnection:
+    """DB-API-ish connection that records statements and keeps schema_migrations in memory."""
+
+    def __init__(self, applied=None):
+        self.applied = dict(applied or {})
+        self.executed = []
+        self._rows = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql.strip())
+        if sql.startswith("select version, checksum"):
+            self._rows = list(self.applied.items())
+        elif sql.startswith("insert into schema_migrations"):
+            self.applied[params[0]] = params[2]
+
+    def fetchall(self):
+        return self._rows
+
+
+def test_discovers_migrations_in_order_with_directives():
+    migrations = migrate.discover()
+    assert [m.version for m in migrations] == [1, 2, 3, 4, 5, 6]
+    by_name = {m.name: m for m in migrations}
+    assert not by_name["embedding_hnsw_index"].transactional and by_name["baseline"].transactional
+    assert by_name["halfvec_storage"].requires == ["halfvec"]
+    assert by_name["embedding_hnsw_index"].statements() == [
+        "create index concurrently if not exists documents_oag_compliance_embedding_hnsw\n"
+        "  on documents_oag_compliance using hnsw (embedding vector_cosine_ops)\n"
+        "  with (m = 16, ef_construction = 64)"
+    ]
+    assert 5 not in [m.version for m in migrate.selected(migrations)]
+    assert 5 in [m.version for m in migrate.selected(migrations, "halfvec")]
+    with pytest.raises(ValueError):
+        migrate.selected(migrations, "int8")
+
+
+def test_applies_pending_once_and_keeps_concurrent_builds_out_of_transactions():
+    conn = FakeConnection()
+    applied = migrate.apply_migrations(conn, log=lambda line: None)
+
+    assert [m.version for m in applied] == [1, 2, 3, 4, 6]
+    hnsw = next(i for i, sql in enumerate(conn.executed) if "using hnsw" in sql)
+    opened = [i for i, sql in enumerate(conn.executed) if sql == "begin"]
+    closed = [i for i, sql in enumerate(conn.executed) if sql == "commit"]
+    assert len(opened) == len(closed) == 3  # 0001, 0004 and 0006
+    assert not any(b < hnsw < c for b, c in zip(opened, closed))
+    assert conn.executed[0].startswith("select pg_advisory_lock") and conn.executed[-1].startswith("select pg_advisory_unlock")
+
+    lines = []
+    assert migrate.apply_migrations(conn, log=lines.append) == []
+    assert lines == ["[migrate] up to date"]
+    assert [m.version for m in migrate.apply_migrations(conn, storage="halfvec", log=lines.append)] == [5]
+
+
+def test_dry_run_and_modified_migration_warning():
+    conn = FakeConnection(applied={1: "edited", 2: "x"})
+    lines = []
+    pending = migrate.apply_migrations(conn, dry_run=True, log=lines.append)
+
+    assert [m.version for m in pending] == [3, 4, 6]
+    assert not any(sql.startswith("insert") for sql in conn.executed)
+    assert any("0001_baseline.sql changed" in line for line in lines)
+    states = {row["version"]: (row["state"], row["modified"]) for row in migrate.status(conn)}
+    assert states[1] == ("applied", True) and states[3] == ("pending", False) and states[5] == ("optional", False)
+
+
+def test_rpc_sends_search_params_only_when_set():
+    plain = SupabaseBackend(client=None, url="https://x.supabase.co/", key="k")
+    assert set(plain._rpc_request([0.1], 5, None)["json"]) == {"query_embedding", "match_count", "filter"}
+
+    tuned = SupabaseBackend(client=None, url="https://x.supabase.co", key="k", ef_search=40)
+    assert tuned._rpc_request([0.1], 5, None)["json"]["ef_search"] == 40
+    payload = tuned._rpc_request([0.1], 5, {"corpus": "regulations"}, ef_search=200, probes=8)["json"]
+    assert (payload["ef_search"], payload["probes"], payload["filter"]) == (200, 8, {"corpus": "regulations"})
+
+
+def test_batched_rpc_request_and_split():
+    backend = SupabaseBackend(client=None, url="https://x.supabase.co", key="k", ef_search=40)
+    request = backend._rpc_request([[0.1], [0.2]], 5, {"corpus": "regulations"}, many=True)
+    assert request["url"].endswith("/rpc/match_documents_oag_compliance_many")
+    assert request["json"]["query_embeddings"] == [[0.1], [0.2]] and request["json"]["ef_search"] == 40
+    assert "query_embedding" not in request["json"]
+
+    rows = [{"query_index": 1, "id": "b"}, {"query_index": 0, "id": "a"}, {"query_index": 1, "id": "c"}]
+    assert SupabaseBackend._split(rows, 3) == [[{"id": "a"}], [{"id": "b"}, {"id": "c"}], []]
+
+
+def test_match_regulations_many_batches_and_dedupes(monkeypatch):
+    import RAG.backends
+    import RAG.embedding_cache
+    import RAG.result_cache
+    from graph import match_regulations, match_regulations_many
+    from RAG.result_cache import ToolResultCache
+
+    calls = {"embed": [], "match_many": 0, "match": 0}
+    shared = {"id": "s", "content": "LDAR survey frequency", "metadata": {"corpus": "regulations"}, "similarity": 0.8}
+
+    class Backend:
+        def match_many(self, embeddings, match_count=5, filter=None, **search):
+            calls["match_many"] += 1
+            own = [{"id": f"q{i}", "content": f"passage {i}", "metadata": {"corpus": "regulations"}, "similarity": 0.9}
+                   for i in range(len(embeddings))]
+            return [[own[0], shared], [shared, own[1]]][: len(embeddings)]
+
+        def match(self, embedding, match_count=5, filter=None, **search):
+            calls["match"] += 1
+            return []
+
+    class Emb:
+        def embed_documents(self, texts):
+            calls["embed"].append(list(texts))
+            return [[1.0, 0.0], [0.0, 1.0]][: len(texts)]
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    monkeypatch.setattr(RAG.backends, "get_backend", lambda: Backend())
+    monkeypatch.setattr(RAG.embedding_cache, "get_embeddings", lambda: Emb())
+    monkeypatch.setenv("HYBRID_SEARCH", "0")
+    cache = ToolResultCache()
+    monkeypatch.setattr(RAG.result_cache, "get_result_cache", lambda: cache)
+
+    out = json.loads(match_regulations_many(["ldar", "venting", "ldar"], 2))
+    assert calls["embed"] == [["ldar", "venting"]] and calls["match_many"] == 1
+    assert [group["query"] for group in out] == ["ldar", "venting"]
+    assert [r["id"] for r in out[0]["rows"]] == ["q0"]
+    assert [r["id"] for r in out[1]["rows"]] == ["s", "q1"]  # rank 0 for 'venting' beats rank 1 for 'ldar'
+    assert out[1]["rows"][0]["queries"] == ["ldar", "venting"]
+
+    assert json.loads(match_regulations("venting", 2))[0]["id"] == "s"  # per-query result cached
+    assert calls["match"] == 0 and len(calls["embed"]) == 1
+
+
+def test_match_regulations_passes_search_params_through(monkeypatch):
+    import RAG.backends
+    import RAG.embedding_cache
+    from graph import match_regulations
+
+    seen = []
+
+    class Backend:
+        def match(self, embedding, match_count=5, filter=None, **search):
+            seen.append(search)
+            return [{"id": "a", "content": "LDAR", "metadata": {"corpus": "regulations"}, "similarity": 0.9}]
+
+    class Emb:
+        def embed_query(self, text):
+            return [1.0, 0.0]
+
+    monkeypatch.setattr(RAG.backends, "get_backend", lambda: Backend())
+    monkeypatch.setattr(RAG.embedding_cache, "get_embeddings", lambda: Emb())
+    monkeypatch.setenv("TOOL_CACHE_DISABLED", "1")
+    monkeypatch.setenv("HYBRID_SEARCH", "0")
+
+    assert json.loads(match_regulations("ldar", 1))[0]["id"] == "a"
+    match_regulations("ldar", 1, ef_search=200)
+    match_regulations("ldar", 1, probes=16)
+    assert seen == [{}, {"ef_search": 200}, {"probes": 16}]
+
+
+def test_benchmark_helpers():
+    vectors = clustered_vectors(200, dim=32, clusters=4)
+    assert vectors.shape == (200, 32) and np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    assert vector_literal([0.5, -1.0, 0.25]) == "[0.5,-1,0.25]"
+    assert recall_at_k([["a", "b"], ["c", "d"]], [["a", "x"], ["d", "c"]]) == 0.75
+
+
+@pytest.mark.skipif(not os.getenv("PGVECTOR_TEST_DSN"), reason="needs a scratch Postgres + pgvector (PGVECTOR_TEST_DSN)")
+def test_migrations_and_index_against_real_pgvector():
+    from src.bench.pgvector import run_benchmark
+
+    with migrate.connect(os.environ["PGVECTOR_TEST_DSN"]) as conn:
+        results = run_benchmark(conn, rows=3000, queries=30, ef_values=(10, 200), ivfflat_lists=20, probe_values=(20,))
+        states = {row["version"]: row["state"] for row in migrate.status(conn)}
+    assert all(states[v] == "applied" for v in (1, 2, 3, 4))
+    assert "documents_oag_compliance_embedding_hnsw" in results["sizes"]["indexes"]
+    low, high = results["hnsw"]
+    assert high["recall"] >= 0.95 and high["recall"] >= low["recall"]
+    assert results["ivfflat"]["passes"][0]["recall"] == 1.0  # probing every list is exact
@@ -0,0 +1,107 @@
+"""Tests for the deterministic fan-out pipeline graph"""
+import json
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import graph
+from tests.fakes import ScriptedChatModel
+
+ROWS = {
+    "ldar": [{"id": 1, "content": "LDAR surveys three times per year", "metadata": {"source_pdf": "SOR-2018-66.pdf", "page": 12}, "similarity": 0.9}],
+    "pneumatics": [
+        {"id": 2, "content": "Pneumatic devices must not exceed 0.17 m3/h", "metadata": {"source_pdf": "SOR-2018-66.pdf", "page": 20}, "similarity": 0.8},
+        {"id": 1, "content": "LDAR surveys three times per year", "metadata": {"source_pdf": "SOR-2018-66.pdf", "page": 12}, "similarity": 0.95},
+    ],
+    "venting_flaring": [{"id": 3, "content": "Vent gas limits of 15 000 m3 per month", "metadata": {"source_pdf": "Directive060.pdf", "page": 40}, "similarity": 0.7}],
+    "water": [],
+}
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    queries = []
+    lock = threading.Lock()
+
+    def fake_match(query, match_count=5):
+        topic = next(t for t, q in graph.PIPELINE_TOPICS.items() if q == query)
+        with lock:
+            queries.append(topic)
+        return json.dumps(ROWS[topic])
+
+    model = ScriptedChatModel(responses=iter([
+        AIMessage(content="- LDAR overdue (High)"),
+        AIMessage(content="Executive summary: LDAR overdue."),
+    ]))
+    monkeypatch.setattr(graph, "match_regulations", fake_match)
+    monkeypatch.setattr(graph, "get_model", lambda: model)
+    return graph.get_pipeline(), queries
+
+
+def test_triage_request_runs_fixed_path_with_fan_out(pipeline):
+    compiled, queries = pipeline
+    result = compiled.invoke({"messages": [HumanMessage(content=f"{graph.TRIAGE_REQUEST_MARKER}: site B")]})
+
+    assert sorted(queries) == sorted(graph.PIPELINE_TOPICS)
+    assert result["llm_calls"] == 2
+    assert result["gaps"] == "- LDAR overdue (High)"
+    report = result["messages"][-1]
+    assert report.name == "report_generator_agent" and report.content == "Executive summary: LDAR overdue."
+
+    context = result["context"]
+    assert context.count("LDAR surveys three times per year") == 1
+    assert context.index("LDAR surveys") < context.index("Pneumatic devices") < context.index("Vent gas")
+    assert "topics: ldar, pneumatics" in context or "topics: pneumatics, ldar" in context
+    assert "(SOR-2018-66.pdf, 12;" in context
+
+
+def test_free_form_request_falls_back_to_supervisor(monkeypatch, pipeline):
+    compiled, queries = pipeline
+
+    class FakeSupervisor:
+        def invoke(self, state):
+            return {"messages": state["messages"] + [AIMessage(content="Directive 060 covers flaring.")]}
+
+    monkeypatch.setattr(graph, "get_agent", lambda: FakeSupervisor())
+    result = compiled.invoke({"messages": [HumanMessage(content="What does Directive 060 cover?")]})
+    assert queries == []
+    assert [m.content for m in result["messages"]] == ["What does Directive 060 cover?", "Directive 060 covers flaring."]
+
+
+def test_analysis_graph_is_selectable(monkeypatch):
+    monkeypatch.setattr(graph, "get_agent", lambda: "supervisor")
+    monkeypatch.setattr(graph, "get_pipeline", lambda: "pipeline")
+    assert graph.get_analysis_graph() == "supervisor"
+    monkeypatch.setenv("ANALYSIS_GRAPH", "pipeline")
+    assert graph.get_analysis_graph() == "pipeline"
+
+
+def test_compare_reports_llm_calls_and_time_saved(pipeline, monkeypatch):
+    import compare_modes
+    import triage
+
+    compiled, _ = pipeline
+
+    class ChattySupervisor:
+        def invoke(self, state, config=None):
+            for callback in config["callbacks"]:
+                for _ in range(6):
+                    callback.on_chat_model_start({}, [])
+            return {"messages": [AIMessage(content="report")]}
+
+    monkeypatch.setattr(triage, "extract_text", lambda path: "LDAR overdue")
+    report = compare_modes.compare("site.pdf", graphs={"supervisor": ChattySupervisor(), "pipeline": compiled})
+    assert report["supervisor"]["mean_llm_calls"] == 6
+    assert report["pipeline"]["mean_llm_calls"] == 2
+    assert report["savings"]["llm_calls"] == 4
+
+
+def test_pipeline_streams_with_agent_names(pipeline):
+    from triage import stream_analysis
+
+    compiled, _ = pipeline
+    result = stream_analysis("site.pdf", "LDAR overdue", agent=compiled)
+    assert result["report"] == "Executive summary: LDAR overdue."
+    assert [s["agent"] for s in result["timings"]["segments"]] == ["gap_analyzer_agent", "report_generator_agent"]
+    assert result["timings"]["first_report_token_s"] is not None
@@ -0,0 +1,81 @@
+"""Tests for the local tiered pre-classifier in front of the filter agent"""
+from src import graph
+from src.prefilter import TieredClassifier, domain_score, keyword_score, representative_sample
+
+
+def test_clear_cases_are_decided_locally():
+    clf = TieredClassifier()
+    relevant = clf.classify(
+        "LDAR Survey Report\nMethane emissions detected at separator unit\nHigh-bleed pneumatic devices in operation"
+    )
+    unrelated = clf.classify("FIFA World Cup 2022 Final\nArgentina vs France\nLionel Messi scored two goals")
+    assert relevant["label"] == "Yes" and relevant["tier"] == "local_yes"
+    assert "ldar" in relevant["topics"] and "emissions" in relevant["topics"]
+    assert unrelated["label"] == "No" and unrelated["tier"] == "local_no"
+    assert clf.stats() == {"local_yes": 1, "local_no": 1, "llm": 0, "total": 2, "escalation_rate": 0.0}
+
+
+def test_ambiguous_text_escalates_unless_local_mode():
+    text = "Monthly compliance summary for the facility."
+    assert TieredClassifier().classify(text)["tier"] == "llm"
+    assert TieredClassifier(mode="local").classify(text)["label"] in ("Yes", "No")
+    assert TieredClassifier(mode="llm").classify("methane venting flaring LDAR spill")["label"] is None
+
+
+def test_off_domain_compliance_audit_is_not_a_local_yes():
+    audit = (
+        "GDPR Compliance Audit Report\n"
+        "This audit reviews the controller's compliance with the data protection regulation.\n"
+        "Monitoring and reporting obligations: the operator must keep records and reporting of personal data breaches.\n"
+        "Non-compliance findings: breaches were not reported within 72 hours after the release of customer data.\n"
+        "Corrective action: the operator shall implement corrective action plans and continuous monitoring.\n"
+        "Regulation compliance monitoring is reviewed annually; reporting to the supervisory authority is required."
+    )
+    result = TieredClassifier().classify(audit)
+    assert result["keyword_score"] >= 3.0 and set(result["topics"]) <= {"reporting", "water_spills"}
+    assert result["domain_score"] == 0.0 and result["label"] != "Yes" and result["tier"] == "llm"
+    assert TieredClassifier(mode="local").classify(audit)["label"] == "No"
+    assert domain_score("produced water spill and methane venting at the wellsite") >= 2.0
+
+
+def test_keyword_score_damps_repeats():
+    once, _ = keyword_score("flaring")
+    many, topics = keyword_score("flaring " * 50)
+    assert once == 2.0 and once < many < 50 * once
+    assert list(topics) == ["venting_flaring"]
+
+
+def test_representative_sample_is_bounded_and_keeps_relevant_paragraphs():
+    filler = "\n\n".join(f"Paragraph {i} about the site history and general facility layout." for i in range(200))
+    text = "Inspection of Site B\n\n" + filler + "\n\nTank venting exceeded limits; flare was not lit.\n\n" + filler + "\n\nSigned by inspector."
+    sample = representative_sample(text, max_chars=2000)
+    assert len(sample) <= 2000 + 200
+    assert sample.startswith("Inspection of Site B")
+    assert "Tank venting exceeded limits" in sample
+    assert sample.endswith("Signed by inspector.")
+
+
+def test_evaluate_document_theme_skips_llm_for_clear_cases(monkeypatch):
+    def no_llm():
+        raise AssertionError("filter agent should not be called")
+
+    monkeypatch.setattr(graph, "get_filter_agent", no_llm)
+    assert graph.evaluate_document_theme("Tank venting operations and flare routing requirements") == "Yes"
+    assert graph.evaluate_document_theme("The quarterly sales meeting is on Tuesday.") == "No"
+
+
+def test_evaluate_document_theme_sends_bounded_sample_to_llm(monkeypatch):
+    from langchain_core.messages import AIMessage
+
+    seen = []
+
+    class FakeAgent:
+        def invoke(self, state):
+            seen.append(state["messages"][0].content)
+            return {"messages": [AIMessage(content="Yes")]}
+
+    monkeypatch.setattr(graph, "get_filter_agent", lambda: FakeAgent())
+    monkeypatch.setenv("PREFILTER_SAMPLE_CHARS", "1000")
+    text = "Monthly compliance summary for the facility.\n\n" + "General notes on staffing.\n\n" * 500
+    assert graph.evaluate_document_theme(text) == "Yes"
+    assert len(seen) == 1 and len(seen[0]) < 1100
@@ -4,8 +4,8 @@ from unittest.mock import Mock, patch
 from src.RAG.rag import run_rag_pipeline
 
 
-@patch('src.RAG.rag.create_client')
-@patch('src.RAG.rag.OpenAIEmbeddings')
+@patch('src.RAG.rag.get_backend')
+@patch('src.RAG.rag.get_embeddings')
 def test_rag_pipeline_chunks_document(mock_embeddings, mock_supabase):
     """Test that RAG pipeline chunks and embeds documents"""
     # Mock Supabase client
@@ -0,0 +1,84 @@
+"""Tests for the exact + semantic tool-result cache"""
+import json
+
+from src.RAG import result_cache
+from src.RAG.result_cache import ToolResultCache
+
+
+def test_exact_hit_normalizes_query_and_respects_params():
+    cache = ToolResultCache()
+    cache.put("web_search", "AER Directive 060  venting limits", "v1", {"max_results": 5})
+    assert cache.get("web_search", "aer directive 060 venting limits", {"max_results": 5}) == "v1"
+    assert cache.get("web_search", "aer directive 060 venting limits", {"max_results": 3}) is None
+
+
+def test_semantic_lookup_uses_threshold():
+    cache = ToolResultCache(threshold=0.9)
+    cache.put("match_regulations", "pneumatic device requirements", "rows", {"k": 5}, vector=[1.0, 0.0, 0.1])
+
+    near = lambda q: [0.99, 0.05, 0.1]
+    far = lambda q: [0.0, 1.0, 0.0]
+    assert cache.lookup("match_regulations", "SOR/2018-66 pneumatic devices", {"k": 5}, embed=near)[0] == "rows"
+    value, vector = cache.lookup("match_regulations", "spill reporting", {"k": 5}, embed=far)
+    assert value is None and vector == [0.0, 1.0, 0.0]
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1 and stats["misses"] == 1
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    cache = ToolResultCache(max_entries=2, ttl_s=10)
+    cache.put("t", "a", 1)
+    cache.put("t", "b", 2)
+    cache.get("t", "a")
+    cache.put("t", "c", 3)  # evicts 'b' (least recently used)
+    assert cache.get("t", "b") is None and cache.get("t", "a") == 1
+
+    now[0] += 11
+    assert cache.get("t", "a") is None
+    assert cache.stats()["expired"] >= 1
+
+
+def test_corpus_generation_invalidates_regulation_results():
+    cache = ToolResultCache()
+    cache.put("match_regulations", "ldar frequency", "old", generation=3, vector=[1.0, 0.0])
+    assert cache.get("match_regulations", "ldar frequency", generation=3) == "old"
+    assert cache.get("match_regulations", "ldar frequency", generation=4) is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_match_regulations_tool_serves_repeats_from_cache(tmp_path, monkeypatch):
+    import RAG.backends
+    import RAG.embedding_cache
+    import RAG.result_cache
+    from graph import match_regulations
+    from RAG.backends import LocalBackend
+
+    backend = LocalBackend(path=None)
+    backend.upsert([{"id": "a", "content": "LDAR quarterly", "metadata": {"corpus": "regulations"}, "embedding": [1.0, 0.0]}])
+    calls = []
+
+    class Emb:
+        def embed_query(self, text):
+            calls.append(text)
+            return [1.0, 0.0]
+
+    cache = ToolResultCache()
+    monkeypatch.setattr(RAG.backends, "get_backend", lambda: backend)
+    monkeypatch.setattr(RAG.embedding_cache, "get_embeddings", lambda: Emb())
+    monkeypatch.setattr(RAG.result_cache, "get_result_cache", lambda: cache)
+    monkeypatch.setenv("CORPUS_GENERATION_PATH", str(tmp_path / "gen"))
+
+    first = match_regulations("LDAR survey frequency", 1)
+    assert json.loads(first)[0]["id"] == "a"
+    assert match_regulations("ldar survey   frequency", 1) == first
+    assert match_regulations("How often are LDAR surveys required", 1) == first
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["semantic_hits"] == 1
+    assert len(calls) == 2  # the exact hit never embedded
+
+    from RAG.manifest import bump_corpus_generation
+
+    bump_corpus_generation()
+    match_regulations("LDAR survey frequency", 1)
+    assert cache.stats()["invalidated"] >= 1
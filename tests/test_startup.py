@@ -0,0 +1,32 @@
+"""Cold-start regression tests: importing the entry points must stay lightweight"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+HEAVY = ["langchain_google_genai", "langgraph_supervisor", "langgraph.prebuilt", "supabase", "numpy"]
+
+
+def _loaded_after(code):
+    probe = f"import sys, json\n{code}\nprint(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))"
+    out = subprocess.run(
+        [sys.executable, "-c", probe], cwd=SRC_DIR, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": str(SRC_DIR)},
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_importing_graph_defers_heavy_dependencies():
+    assert _loaded_after("import graph") == []
+
+
+def test_graph_exports_resolve_lazily():
+    loaded = _loaded_after(
+        "import os; os.environ.setdefault('GOOGLE_API_KEY', 'test')\n"
+        "import graph\n"
+        "assert graph.agent is graph.demo_app is graph.get_agent()\n"
+        "assert graph.app is graph.get_filter_agent()"
+    )
+    assert "langgraph_supervisor" in loaded
@@ -17,4 +17,18 @@ def test_app_title_displayed(mock_st):
     import src.streamlit_app
     # Verify title was called
     # This is a basic smoke test
-    assert True  # Placeholder for actual UI testing
\ No newline at end of file
+    assert True  # Placeholder for actual UI testing
+
+def test_importing_the_app_starts_no_workers(tmp_path, monkeypatch):
+    """The worker pool, job database and folders are created by main(), not on import"""
+    import importlib
+    import threading
+
+    import jobs
+    import src.streamlit_app
+
+    monkeypatch.chdir(tmp_path)
+    threads = threading.active_count()
+    importlib.reload(src.streamlit_app)
+    assert jobs.get_job_runner.cache_info().currsize == 0
+    assert threading.active_count() == threads and list(tmp_path.iterdir()) == []
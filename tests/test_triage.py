@@ -0,0 +1,56 @@
+"""Tests for streamed supervisor analysis (hand-offs, tokens, timings)"""
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+from src.triage import REPORT_AGENT, astream_analysis, stream_analysis
+from tests.fakes import ScriptedChatModel
+
+
+def _supervisor():
+    from langgraph.prebuilt import create_react_agent
+    from langgraph_supervisor import create_supervisor
+
+    supervisor = ScriptedChatModel(responses=iter([
+        AIMessage(content="Routing to report", tool_calls=[{"name": f"transfer_to_{REPORT_AGENT}", "args": {}, "id": "1"}]),
+        AIMessage(content="Final compliance report delivered."),
+    ]))
+    reporter = ScriptedChatModel(responses=iter([AIMessage(content="Executive summary: two high severity gaps.")]))
+    agent = create_react_agent(model=reporter, tools=[], name=REPORT_AGENT, prompt="report")
+    return create_supervisor(agents=[agent], model=supervisor, prompt="route").compile()
+
+
+def test_stream_analysis_tracks_handoffs_tokens_and_timings():
+    snapshots = []
+    result = stream_analysis("site.pdf", "LDAR overdue", agent=_supervisor(), on_update=snapshots.append)
+
+    assert result["report"] == "Final compliance report delivered."
+    timings = result["timings"]
+    assert [s["agent"] for s in timings["segments"]] == ["supervisor", REPORT_AGENT, "supervisor"]
+    assert 0 <= timings["first_token_s"] <= timings["first_report_token_s"] <= timings["total_s"]
+    assert set(timings["per_agent_s"]) == {"supervisor", REPORT_AGENT}
+
+    final = snapshots[-1]
+    assert final["handoffs"] == ["supervisor", REPORT_AGENT, "supervisor"]
+    assert final["text"][REPORT_AGENT] == "Executive summary: two high severity gaps."
+    assert any(s["agent"] == REPORT_AGENT for s in snapshots[:-1])
+
+
+def test_astream_analysis_matches_sync():
+    result = asyncio.run(astream_analysis("site.pdf", "LDAR overdue", agent=_supervisor()))
+    assert result["report"] == "Final compliance report delivered."
+    assert result["timings"]["first_report_token_s"] is not None
+
+
+def test_astream_analysis_checkpoints_its_thread(monkeypatch):
+    import graph
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    saver = InMemorySaver()
+    monkeypatch.setattr(graph, "get_checkpointer", lambda: saver)
+    agent = _supervisor()
+    first = asyncio.run(astream_analysis("site.pdf", "LDAR overdue", agent=agent, thread_id="doc:1"))
+    assert saver.get_tuple({"configurable": {"thread_id": "doc:1"}}) is not None
+
+    again = asyncio.run(astream_analysis("site.pdf", "LDAR overdue", agent=agent, thread_id="doc:1"))
+    assert again["report"] == first["report"] == "Final compliance report delivered."  # no scripted replies left